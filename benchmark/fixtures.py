@@ -0,0 +1,210 @@
+#!/usr/local/bin/python
+
+#
+# Program: fixtures.py
+#
+# Purpose:
+#
+#	Writes the fixtures file of the benchmark: a sample of the
+#	markers, references, users, vocabulary terms, libraries and
+#	probes of a database, as JSON, for generate.py.
+#
+#	With --tables it also writes a fixture dump of the lookup tables
+#	for the loaders' offline backend (PROBELOADBACKEND=fixtures:<dump>,
+#	see probeloadlib/backend.py).
+#
+#	Run it once against a development database, with --tables; seed.py
+#	builds the benchmark template database (see harness.py) from the
+#	dump, so that every value the generator writes exists in the
+#	databases the loaders are benchmarked against.  The queries
+#	select what the lookups of the loaders accept (see
+#	probeloadlib/lookups.py).
+#
+# Usage:
+#	fixtures.py --output fixtures.json [--size N] [--tables dump.json]
+#
+#	--size		values per list (default 1000)
+#	--tables	also dump the lookup tables to this file
+#
+# Envvars:
+#
+#	PG_DBSERVER, PG_DBNAME	the database to sample
+#	PG_DBUSER		database user
+#	PG_1LINE_PASSFILE	file holding the password
+#
+
+import sys
+import os
+import getopt
+import json
+import db
+
+# probeloadlib is in the product directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from probeloadlib import backend
+
+# name : SQL selecting 'value', limited to %d rows
+queries = {
+    'markers' : '''
+	select a.accID as value
+	from ACC_Accession a, MRK_Marker m
+	where a._MGIType_key = 2
+	and a._LogicalDB_key = 1
+	and a.prefixPart = 'MGI:'
+	and a.preferred = 1
+	and a._Object_key = m._Marker_key
+	and m._Organism_key = 1
+	and m._Marker_Status_key = 1
+	order by a.accID limit %d
+	''',
+    'references' : '''
+	select jnumID as value from BIB_Citation_Cache
+	where jnumID is not null
+	order by jnumID limit %d
+	''',
+    'users' : '''
+	select login as value from MGI_User
+	order by login limit %d
+	''',
+    'logicalDBs' : '''
+	select name as value from ACC_LogicalDB
+	where _LogicalDB_key = 9
+	limit %d
+	''',
+    'organisms' : '''
+	select commonName as value from MGI_Organism
+	order by commonName limit %d
+	''',
+    'strains' : '''
+	select strain as value from PRB_Strain
+	order by strain limit %d
+	''',
+    'tissues' : '''
+	select tissue as value from PRB_Tissue
+	order by tissue limit %d
+	''',
+    'libraries' : '''
+	select name as value from PRB_Source
+	where name is not null
+	order by name limit %d
+	''',
+    }
+
+# name : vocabulary name
+vocabularies = {
+    'genders' : 'Gender',
+    'cellLines' : 'Cell Line',
+    'vectorTypes' : 'Segment Vector Type',
+    'segmentTypes' : 'Segment Type',
+    }
+
+termSQL = '''
+	select t.term as value
+	from VOC_Term t, VOC_Vocab v
+	where v.name = '%s'
+	and v._Vocab_key = t._Vocab_key
+	order by t.term limit %d
+	'''
+
+probeSQL = '''
+	select a.accID, p.name
+	from ACC_Accession a, PRB_Probe p
+	where a._MGIType_key = 3
+	and a._LogicalDB_key = 1
+	and a.prefixPart = 'MGI:'
+	and a.preferred = 1
+	and a._Object_key = p._Probe_key
+	and p.name is not null
+	order by a.accID limit %d
+	'''
+
+# values that are not looked up in a table
+constants = {
+    'ages' : ['Not Applicable', 'Not Specified'],
+    'relationships' : ['E', 'H'],
+    }
+
+# Purpose: sample the fixture values of the database
+# Returns: the fixtures (dictionary of lists)
+# Assumes: the connection is set up
+# Effects: queries the database
+# Throws:  nothing
+
+def extract(
+    size	# values per list (integer)
+    ):
+
+    fixtures = dict(constants)
+
+    for name in queries.keys():
+        fixtures[name] = [r['value'] for r in db.sql(queries[name] % (size), 'auto')]
+
+    for name in vocabularies.keys():
+        fixtures[name] = [r['value'] for r in db.sql(termSQL % (vocabularies[name], size), 'auto')]
+
+    fixtures['probes'] = [[r['accID'], r['name']] for r in db.sql(probeSQL % (size), 'auto')]
+
+    return fixtures
+
+# Purpose: prints the usage message and exits
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits with status 1
+# Throws:  nothing
+
+def usage(message):
+
+    sys.stderr.write('%s\nUsage: %s --output fixtures.json [--size N] [--tables dump.json]\n' \
+        % (message, sys.argv[0]))
+    sys.exit(1)
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], '', ['output=', 'size=', 'tables='])
+    except getopt.GetoptError as e:
+        usage(str(e))
+
+    fileName = None
+    dumpFileName = None
+    size = 1000
+
+    for opt, arg in opts:
+        if opt == '--output':
+            fileName = arg
+        elif opt == '--tables':
+            dumpFileName = arg
+        elif opt == '--size':
+            try:
+                size = int(arg)
+            except ValueError:
+                usage('--size needs a number: %s' % (arg))
+
+    if fileName is None:
+        usage('--output is required')
+
+    db.useOneConnection(1)
+    db.set_sqlUser(os.environ['PG_DBUSER'])
+    db.set_sqlPasswordFromFile(os.environ['PG_1LINE_PASSFILE'])
+
+    fixtures = extract(size)
+
+    if dumpFileName is not None:
+        backend.dumpTables(dumpFileName)
+
+    db.useOneConnection(0)
+
+    empty = [name for name in fixtures.keys() if len(fixtures[name]) == 0]
+    if len(empty) > 0:
+        sys.stderr.write('No fixture values for: %s\n' % (', '.join(sorted(empty))))
+        sys.exit(1)
+
+    outputFile = open(fileName, 'w')
+    json.dump(fixtures, outputFile, indent = 1, sort_keys = True)
+    outputFile.write('\n')
+    outputFile.close()
@@ -0,0 +1,256 @@
+#!/usr/local/bin/python
+
+#
+# Program: generate.py
+#
+# Purpose:
+#
+#	Writes a synthetic input file for probeload.py, primerload.py or
+#	probereference.py, in the loader's column layout, for the
+#	benchmark harness (see harness.py).
+#
+#	The values are drawn from a fixtures file (see fixtures.py): the
+#	markers, references, users, vocabulary terms, libraries and
+#	probes of the benchmark database, so that the lines are valid
+#	unless an error is put in on purpose.  The same fixtures and seed
+#	always give the same file.
+#
+# Usage:
+#	generate.py --loader probeload --fixtures fixtures.json --output mydata.txt
+#		[--lines N] [--markers N] [--aliases N] [--parents R]
+#		[--by-name R] [--errors R] [--seed N]
+#
+#	--loader	probeload, primerload or probereference
+#	--lines		number of input lines (default 10000)
+#	--markers	markers per line, probeload/primerload (default 1)
+#	--aliases	aliases per line (default 1)
+#	--parents	fraction of probes with a Parent Probe, probeload (default 0.1)
+#	--by-name	fraction of probes given by name, probereference (default 0.5)
+#	--errors	fraction of lines with one invalid value (default 0.01)
+#	--seed		random seed (default 1)
+#
+
+import sys
+import getopt
+import json
+import random
+
+invalidMarker = 'MGI:0'
+invalidReference = 'J:0'
+invalidUser = 'benchmark-no-such-user'
+
+# Purpose: one probeload.py input line
+# Returns: list of 22 fields
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def probeloadLine(
+    rand,		# random generator (random.Random)
+    fixtures,		# fixtures (dictionary)
+    lineNum,		# line number (integer)
+    options		# generator options (dictionary)
+    ):
+
+    fields = [''] * 22
+
+    fields[0] = 'bench-probe-%d' % (lineNum)
+    fields[1] = rand.choice(fixtures['references'])
+
+    if rand.random() < options['parents']:
+        fields[2] = rand.choice(fixtures['probes'])[0]
+    elif rand.random() < 0.5:
+        fields[3] = rand.choice(fixtures['libraries'])
+    else:
+        fields[4] = rand.choice(fixtures['organisms'])
+        fields[5] = rand.choice(fixtures['strains'])
+        fields[6] = rand.choice(fixtures['tissues'])
+        fields[7] = rand.choice(fixtures['genders'])
+        fields[8] = rand.choice(fixtures['cellLines'])
+        fields[9] = rand.choice(fixtures['ages'])
+
+    fields[10] = rand.choice(fixtures['vectorTypes'])
+    fields[11] = rand.choice(fixtures['segmentTypes'])
+    fields[12] = 'region %d' % (lineNum)
+    fields[15] = '|'.join(rand.sample(fixtures['markers'], options['markers']))
+    fields[16] = rand.choice(fixtures['relationships'])
+    fields[17] = '%s:BX%06d' % (rand.choice(fixtures['logicalDBs']), lineNum)
+    fields[18] = '|'.join(['bench-alias-%d-%d' % (lineNum, i) for i in range(options['aliases'])])
+    fields[19] = 'benchmark note %d' % (lineNum)
+    fields[21] = rand.choice(fixtures['users'])
+
+    if rand.random() < options['errors']:
+        field, value = rand.choice([(1, invalidReference), (15, invalidMarker), (21, invalidUser)])
+        fields[field] = value
+
+    return fields
+
+# Purpose: one primerload.py input line
+# Returns: list of 12 fields
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def primerloadLine(rand, fixtures, lineNum, options):
+
+    fields = [''] * 12
+
+    fields[0] = 'bench-symbol-%d' % (lineNum)
+    fields[1] = '|'.join(rand.sample(fixtures['markers'], options['markers']))
+    fields[2] = 'bench-primer-%d' % (lineNum)
+    fields[3] = rand.choice(fixtures['references'])
+    fields[4] = 'region %d' % (lineNum)
+    fields[5] = ''.join([rand.choice('ACGT') for i in range(20)])
+    fields[6] = ''.join([rand.choice('ACGT') for i in range(20)])
+    fields[7] = '%d' % (rand.randint(100, 1000))
+    fields[8] = 'benchmark note %d' % (lineNum)
+    fields[9] = 'BX%06d' % (lineNum)
+    fields[10] = '|'.join(['bench-alias-%d-%d' % (lineNum, i) for i in range(options['aliases'])])
+    fields[11] = rand.choice(fixtures['users'])
+
+    if rand.random() < options['errors']:
+        field, value = rand.choice([(3, invalidReference), (1, invalidMarker), (11, invalidUser)])
+        fields[field] = value
+
+    return fields
+
+# Purpose: one probereference.py input line
+# Returns: list of 4 fields
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def probereferenceLine(rand, fixtures, lineNum, options):
+
+    probeID, probeName = rand.choice(fixtures['probes'])
+
+    fields = [''] * 4
+
+    if rand.random() < options['byName']:
+        fields[0] = probeName
+    else:
+        fields[0] = probeID
+
+    fields[1] = rand.choice(fixtures['references'])
+    fields[2] = '|'.join(['bench-alias-%d-%d' % (lineNum, i) for i in range(options['aliases'])])
+    fields[3] = rand.choice(fixtures['users'])
+
+    if rand.random() < options['errors']:
+        field, value = rand.choice([(1, invalidReference), (3, invalidUser)])
+        fields[field] = value
+
+    return fields
+
+# loader : function writing one line
+lineFunctions = {
+    'probeload' : probeloadLine,
+    'primerload' : primerloadLine,
+    'probereference' : probereferenceLine,
+    }
+
+defaults = {
+    'lines' : 10000,
+    'markers' : 1,
+    'aliases' : 1,
+    'parents' : 0.1,
+    'byName' : 0.5,
+    'errors' : 0.01,
+    'seed' : 1,
+    }
+
+# Purpose: read a fixtures file
+# Returns: the fixtures (dictionary of sorted lists)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  IOError, ValueError if the file cannot be read
+
+def readFixtures(
+    fileName	# fixtures file name (string)
+    ):
+
+    fixturesFile = open(fileName, 'r')
+    fixtures = json.load(fixturesFile)
+    fixturesFile.close()
+
+    for name in fixtures.keys():
+        fixtures[name].sort()
+
+    return fixtures
+
+# Purpose: write a synthetic input file
+# Returns: nothing
+# Assumes: the fixtures have at least 'markers' markers
+# Effects: creates 'fileName'
+# Throws:  IOError if the file cannot be written
+
+def generate(
+    loader,	# probeload, primerload or probereference (string)
+    fixtures,	# fixtures (dictionary)
+    fileName,	# input file name (string)
+    options	# generator options, see 'defaults' (dictionary)
+    ):
+
+    lineFunction = lineFunctions[loader]
+    rand = random.Random(options['seed'])
+
+    outputFile = open(fileName, 'w')
+
+    for lineNum in range(1, options['lines'] + 1):
+        outputFile.write('\t'.join(lineFunction(rand, fixtures, lineNum, options)) + '\n')
+
+    outputFile.close()
+
+# Purpose: prints the usage message and exits
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits with status 1
+# Throws:  nothing
+
+def usage(message):
+
+    sys.stderr.write('%s\nUsage: %s --loader probeload|primerload|probereference ' \
+        '--fixtures fixtures.json --output file [--lines N] [--markers N] [--aliases N] ' \
+        '[--parents R] [--by-name R] [--errors R] [--seed N]\n' % (message, sys.argv[0]))
+    sys.exit(1)
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], '', ['loader=', 'fixtures=', 'output=',
+            'lines=', 'markers=', 'aliases=', 'parents=', 'by-name=', 'errors=', 'seed='])
+    except getopt.GetoptError as e:
+        usage(str(e))
+
+    loader = None
+    fixturesFileName = None
+    fileName = None
+    options = dict(defaults)
+
+    try:
+        for opt, arg in opts:
+            if opt == '--loader':
+                loader = arg
+            elif opt == '--fixtures':
+                fixturesFileName = arg
+            elif opt == '--output':
+                fileName = arg
+            elif opt in ('--lines', '--markers', '--aliases', '--seed'):
+                options[opt[2:]] = int(arg)
+            elif opt == '--by-name':
+                options['byName'] = float(arg)
+            else:
+                options[opt[2:]] = float(arg)
+    except ValueError:
+        usage('%s needs a number: %s' % (opt, arg))
+
+    if loader not in lineFunctions:
+        usage('unknown loader: %s' % (loader))
+
+    if fixturesFileName is None or fileName is None:
+        usage('--fixtures and --output are required')
+
+    generate(loader, readFixtures(fixturesFileName), fileName, options)
@@ -0,0 +1,263 @@
+#!/usr/local/bin/python
+
+#
+# Program: harness.py
+#
+# Purpose:
+#
+#	Throughput benchmark of probeload.py, primerload.py and
+#	probereference.py against a local Postgres instance.
+#
+#	For each loader and run the harness:
+#
+#		writes a synthetic input file (see generate.py)
+#		clones the template database (createdb -T), so that
+#		    every run starts from the same data
+#		runs the loader on the clone, in its own process
+#		reads the loader's statistics file (<input>.stats.json)
+#		    and the peak RSS of the process
+#		drops the clone
+#
+#	and writes the results, with the median of the runs, as a JSON
+#	document for report.py.
+#
+#	The template database holds the mgd schema and the vocabulary,
+#	marker, reference and probe data the fixtures were sampled from;
+#	it is built once by seed.py from the fixture dump of fixtures.py
+#	--tables, and is never loaded into:
+#
+#		fixtures.py --output fixtures.json --tables dump.json
+#		seed.py --dump dump.json --schema mgd_schema.sql
+#		harness.py --fixtures fixtures.json --output results.json
+#
+# Usage:
+#	harness.py --fixtures fixtures.json --output results.json
+#		[--loaders probeload,primerload,probereference] [--runs N]
+#		[--workdir dir] and the options of generate.py
+#
+#	--runs		runs of each loader (default 3)
+#	--workdir	directory of the input and output files (default ./benchmark.work)
+#
+# Envvars:
+#
+#	BENCHTEMPLATE		template database (default mgd_bench; see seed.py)
+#	PG_DBSERVER		the local Postgres server
+#	PG_DBUSER		database user; must be allowed to create databases
+#	PG_1LINE_PASSFILE	file holding the password
+#	PG_DBUTILS		pgdbutilities, for the bcp of primerload/probereference
+#
+
+import sys
+import os
+import getopt
+import json
+import subprocess
+import generate
+
+productDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loader : (script, mode, mode variable, load directory variable,
+#	data file variable, output directory variable)
+loaders = {
+    'probeload' : ('probeload.py', 'load-copy',
+        'PROBELOADMODE', 'PROBELOADDIR', 'PROBEDATAFILE', 'PROBELOADDATADIR'),
+    'primerload' : ('primerload.py', 'load',
+        'PRIMERMODE', 'PRIMERLOADDIR', 'PRIMERDATAFILE', 'OUTPUTDIR'),
+    'probereference' : ('probereference.py', 'load',
+        'PROBELOADMODE', 'PROBELOADDIR', 'PROBEDATAFILE', 'PROBELOADDATADIR'),
+    }
+
+# counters of the statistics file reported for each run
+counters = ['rows accepted', 'rows rejected', 'sql statements', 'lookup pipeline queries']
+
+# phases of the statistics file reported for each run
+phases = ['init', 'resolveLookups', 'setPrimaryKeys', 'processFile', 'bcpFiles']
+
+# Purpose: run a PostgreSQL client program (createdb, dropdb, psql)
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits if the program fails
+# Throws:  nothing
+
+def pgCommand(
+    args,	# program and arguments (list of strings)
+    env		# environment (dictionary)
+    ):
+
+    if subprocess.call(args + ['-h', env['PG_DBSERVER'], '-U', env['PG_DBUSER']], env = env) != 0:
+        sys.stderr.write('Could not run %s\n' % (' '.join(args)))
+        sys.exit(1)
+
+# Purpose: run one loader once
+# Returns: the results of the run (dictionary)
+# Assumes: the input file has been generated
+# Effects: creates and drops a clone of the template database;
+#	writes the loader's files in 'workDir'
+#	exits if the loader writes no statistics file
+# Throws:  nothing
+
+def runLoader(
+    loader,		# loader name (string)
+    inputFileName,	# input file name (string)
+    workDir,		# directory of the loader's files (string)
+    database,		# name of the clone (string)
+    env			# environment (dictionary)
+    ):
+
+    script, mode, modeEnv, loadDirEnv, dataFileEnv, outputDirEnv = loaders[loader]
+
+    env = dict(env)
+    env[modeEnv] = mode
+    env[loadDirEnv] = workDir
+    env[dataFileEnv] = inputFileName
+    env[outputDirEnv] = workDir
+    env['PROBELOADSQLLOG'] = 'summary'
+
+    statsFileName = os.path.join(workDir, os.path.basename(inputFileName) + '.stats.json')
+    if os.path.exists(statsFileName):
+        os.remove(statsFileName)
+
+    pgCommand(['createdb', '-T', env['BENCHTEMPLATE'], database], env)
+
+    try:
+        env['PG_DBNAME'] = database
+        process = subprocess.Popen([sys.executable, os.path.join(productDir, script)],
+            cwd = workDir, env = env)
+        pid, status, rusage = os.wait4(process.pid, 0)
+    finally:
+        pgCommand(['dropdb', database], env)
+
+    if not os.path.exists(statsFileName):
+        sys.stderr.write('%s wrote no statistics (wait status %d)\n' % (script, status))
+        sys.exit(1)
+
+    statsFile = open(statsFileName, 'r')
+    stats = json.load(statsFile)
+    statsFile.close()
+
+    result = {
+        'status' : stats['status'],
+        'elapsed' : stats['elapsed'],
+        'rowsPerSecond' : stats['rowsPerSecond'],
+        'peakRSSKB' : rusage.ru_maxrss,
+        }
+
+    for name in counters:
+        result[name] = stats['counters'].get(name, 0)
+
+    for name in phases:
+        if name in stats['timers']:
+            result[name + ' seconds'] = stats['timers'][name]['seconds']
+
+    return result
+
+# Purpose: the median of each value over the runs
+# Returns: dictionary
+# Assumes: there is at least one run
+# Effects: nothing
+# Throws:  nothing
+
+def median(runs):
+
+    result = {}
+
+    for name in runs[0].keys():
+        values = sorted([r.get(name, 0) for r in runs])
+        result[name] = values[len(values) / 2]
+
+    return result
+
+# Purpose: prints the usage message and exits
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits with status 1
+# Throws:  nothing
+
+def usage(message):
+
+    sys.stderr.write('%s\nUsage: %s --fixtures fixtures.json --output results.json ' \
+        '[--loaders probeload,primerload,probereference] [--runs N] [--workdir dir] ' \
+        '[--lines N] [--markers N] [--aliases N] [--parents R] [--by-name R] [--errors R] ' \
+        '[--seed N]\n' % (message, sys.argv[0]))
+    sys.exit(1)
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], '', ['fixtures=', 'output=', 'loaders=',
+            'runs=', 'workdir=', 'lines=', 'markers=', 'aliases=', 'parents=', 'by-name=',
+            'errors=', 'seed='])
+    except getopt.GetoptError as e:
+        usage(str(e))
+
+    fixturesFileName = None
+    resultsFileName = None
+    names = ['probeload', 'primerload', 'probereference']
+    runs = 3
+    workDir = os.path.abspath('benchmark.work')
+    options = dict(generate.defaults)
+
+    try:
+        for opt, arg in opts:
+            if opt == '--fixtures':
+                fixturesFileName = arg
+            elif opt == '--output':
+                resultsFileName = arg
+            elif opt == '--loaders':
+                names = arg.split(',')
+            elif opt == '--runs':
+                runs = int(arg)
+            elif opt == '--workdir':
+                workDir = os.path.abspath(arg)
+            elif opt in ('--lines', '--markers', '--aliases', '--seed'):
+                options[opt[2:]] = int(arg)
+            elif opt == '--by-name':
+                options['byName'] = float(arg)
+            else:
+                options[opt[2:]] = float(arg)
+    except ValueError:
+        usage('%s needs a number: %s' % (opt, arg))
+
+    for name in names:
+        if name not in loaders:
+            usage('unknown loader: %s' % (name))
+
+    if fixturesFileName is None or resultsFileName is None:
+        usage('--fixtures and --output are required')
+
+    env = dict(os.environ)
+    env.setdefault('BENCHTEMPLATE', 'mgd_bench')
+    env['PYTHONPATH'] = productDir + os.pathsep + env.get('PYTHONPATH', '')
+
+    passwordFile = open(env['PG_1LINE_PASSFILE'], 'r')
+    env['PGPASSWORD'] = passwordFile.readline().strip()
+    passwordFile.close()
+
+    fixtures = generate.readFixtures(fixturesFileName)
+
+    if not os.path.isdir(workDir):
+        os.makedirs(workDir)
+
+    results = {'options' : options, 'runs' : runs, 'loaders' : {}}
+
+    for name in names:
+
+        inputFileName = os.path.join(workDir, name + '.txt')
+        generate.generate(name, fixtures, inputFileName, options)
+
+        loaderRuns = []
+        for i in range(runs):
+            database = 'bench_%s_%d_%d' % (name, os.getpid(), i)
+            loaderRuns.append(runLoader(name, inputFileName, workDir, database, env))
+            sys.stderr.write('%s run %d: %.1f rows/sec\n' % (name, i + 1, loaderRuns[-1]['rowsPerSecond']))
+
+        results['loaders'][name] = {'median' : median(loaderRuns), 'runs' : loaderRuns}
+
+    resultsFile = open(resultsFileName, 'w')
+    json.dump(results, resultsFile, indent = 1, sort_keys = True)
+    resultsFile.write('\n')
+    resultsFile.close()
@@ -0,0 +1,163 @@
+#!/usr/local/bin/python
+
+#
+# Program: report.py
+#
+# Purpose:
+#
+#	Prints the results of a benchmark (see harness.py): rows/sec,
+#	elapsed time, peak RSS and SQL statement counts of each loader.
+#
+#	Given the results of an earlier benchmark (i.e. of the last
+#	release) as --baseline, it prints the change in each value and
+#	flags a regression when the rows/sec fall, or the peak RSS or
+#	the statement count grow, by more than --tolerance percent.
+#
+# Usage:
+#	report.py results.json [--baseline baseline.json] [--tolerance P]
+#
+#	--tolerance	percent change allowed before a regression (default 10)
+#
+# Exit Codes:
+#
+#	0	no regression
+#	1	a regression, or invalid arguments
+#
+
+import sys
+import getopt
+import json
+
+# (value, heading, format, 1 if larger is better)
+columns = [
+    ('rowsPerSecond', 'rows/sec', '%.1f', 1),
+    ('elapsed', 'seconds', '%.1f', 0),
+    ('peakRSSKB', 'peak RSS KB', '%d', 0),
+    ('sql statements', 'statements', '%d', 0),
+    ('rows accepted', 'accepted', '%d', None),
+    ('rows rejected', 'rejected', '%d', None),
+    ]
+
+# values whose change is checked against the tolerance
+checked = ['rowsPerSecond', 'peakRSSKB', 'sql statements']
+
+# Purpose: read a results file
+# Returns: the results (dictionary)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  IOError, ValueError if the file cannot be read
+
+def readResults(fileName):
+
+    resultsFile = open(fileName, 'r')
+    results = json.load(resultsFile)
+    resultsFile.close()
+
+    return results
+
+# Purpose: the change from the baseline, in percent
+# Returns: float, or None if there is no baseline value
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def change(value, baseValue):
+
+    if baseValue is None or baseValue == 0:
+        return None
+
+    return 100.0 * (value - baseValue) / baseValue
+
+# Purpose: print the report
+# Returns: the number of regressions (integer)
+# Assumes: nothing
+# Effects: writes to stdout
+# Throws:  nothing
+
+def report(
+    results,		# results of harness.py (dictionary)
+    baseline,		# results of the baseline, or None (dictionary)
+    tolerance		# percent change allowed (float)
+    ):
+
+    regressions = 0
+
+    print 'lines: %(lines)d, markers: %(markers)d, aliases: %(aliases)d, parents: %(parents)s, ' \
+        'errors: %(errors)s, seed: %(seed)d' % results['options']
+    print 'median of %d run(s)' % (results['runs'])
+    print
+
+    print '%-16s' % ('loader') + ''.join(['%14s' % (c[1]) for c in columns])
+
+    for loader in sorted(results['loaders'].keys()):
+
+        median = results['loaders'][loader]['median']
+        print '%-16s' % (loader) + ''.join(['%14s' % (c[2] % (median.get(c[0], 0))) for c in columns])
+
+        if baseline is None or loader not in baseline['loaders']:
+            continue
+
+        baseMedian = baseline['loaders'][loader]['median']
+        line = '%-16s' % ('  change')
+        flagged = []
+
+        for name, heading, format, larger in columns:
+            percent = change(median.get(name, 0), baseMedian.get(name))
+
+            if percent is None:
+                line = line + '%14s' % ('-')
+                continue
+
+            line = line + '%14s' % ('%+.1f%%' % (percent))
+
+            if name in checked and ((larger and percent < -tolerance) or (not larger and percent > tolerance)):
+                flagged.append(heading)
+
+        print line
+
+        if len(flagged) > 0:
+            print '  REGRESSION: %s' % (', '.join(flagged))
+            regressions = regressions + len(flagged)
+
+    return regressions
+
+# Purpose: prints the usage message and exits
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits with status 1
+# Throws:  nothing
+
+def usage(message):
+
+    sys.stderr.write('%s\nUsage: %s results.json [--baseline baseline.json] [--tolerance P]\n' \
+        % (message, sys.argv[0]))
+    sys.exit(1)
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.gnu_getopt(sys.argv[1:], '', ['baseline=', 'tolerance='])
+    except getopt.GetoptError as e:
+        usage(str(e))
+
+    if len(args) != 1:
+        usage('one results file is required')
+
+    baseline = None
+    tolerance = 10.0
+
+    for opt, arg in opts:
+        if opt == '--baseline':
+            baseline = readResults(arg)
+        elif opt == '--tolerance':
+            try:
+                tolerance = float(arg)
+            except ValueError:
+                usage('--tolerance needs a number: %s' % (arg))
+
+    if report(readResults(args[0]), baseline, tolerance) > 0:
+        sys.exit(1)
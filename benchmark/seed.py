@@ -0,0 +1,240 @@
+#!/usr/local/bin/python
+
+#
+# Program: seed.py
+#
+# Purpose:
+#
+#	Builds the template database of the benchmark (see harness.py)
+#	from a fixture dump written by fixtures.py --tables (see
+#	probeloadlib/backend.py dumpTables()).
+#
+#	It creates the template database and:
+#
+#		runs the schema file, if one is given: the mgd schema,
+#		    i.e. pg_dump --schema-only of a development database,
+#		    for the tables, views and sequences the loaders use
+#		    beyond the dump
+#		creates each table of the dump the schema did not, with
+#		    the columns of the dump and types read off its values
+#		copies the rows of the dump in, in one transaction, with
+#		    foreign keys off (the dump holds only the rows the
+#		    lookups need)
+#		creates the key sequences of probeloadlib/keys.py that do
+#		    not exist and sets each past the max(key) of its table
+#
+#	harness.py then clones the template for every run.
+#
+# Usage:
+#	seed.py --dump dump.json [--schema schema.sql] [--replace]
+#
+#	--dump		the fixture dump
+#	--schema	SQL file of the mgd schema, run before the rows are copied
+#	--replace	drop the template database first if it exists
+#
+# Envvars:
+#
+#	BENCHTEMPLATE		template database (default mgd_bench)
+#	PG_DBSERVER		the local Postgres server
+#	PG_DBUSER		database user; must be allowed to create databases
+#				and to set session_replication_role
+#	PG_1LINE_PASSFILE	file holding the password
+#
+
+import sys
+import os
+import getopt
+import json
+import subprocess
+import harness
+
+# probeloadlib is in the product directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from probeloadlib import keys
+
+# sets each key sequence past the max(key) of its table, creating
+# the sequence if the schema has none; a table that does not exist
+# is skipped
+sequenceSQL = '''
+do $$
+begin
+    if to_regclass('%s') is not null then
+	execute 'create sequence if not exists %s';
+	execute 'select setval(''%s'', coalesce((select max(%s) from %s), 0) + 1, false)';
+    end if;
+end
+$$;
+'''
+
+# Purpose: the column type of a list of dumped values
+# Returns: SQL type name (string)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def columnType(
+    values	# values of one column (list)
+    ):
+
+    types = set([type(v) for v in values if v is not None])
+
+    if len(types) > 0 and types <= set([bool]):
+        return 'boolean'
+
+    if len(types) > 0 and types <= set([int, long]):
+        for v in values:
+            if v is not None and abs(v) > 2147483647:
+                return 'bigint'
+        return 'integer'
+
+    if len(types) > 0 and types <= set([int, long, float]):
+        return 'numeric'
+
+    return 'text'
+
+# Purpose: a dumped value in the text format of COPY
+# Returns: string
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def copyValue(value):
+
+    if value is None:
+        return '\\N'
+
+    if value is True:
+        return 't'
+
+    if value is False:
+        return 'f'
+
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+# Purpose: write the SQL that builds the template from the dump
+# Returns: nothing
+# Assumes: the schema file, if any, has been run
+# Effects: writes to 'sqlFile'
+# Throws:  nothing
+
+def writeSQL(
+    dump,	# the fixture dump (dictionary)
+    sqlFile	# psql's standard input (file)
+    ):
+
+    sqlFile.write('begin;\n')
+    sqlFile.write('set session_replication_role = replica;\n')
+
+    for table in sorted(dump.keys()):
+
+        columns = dump[table]['columns']
+        rows = dump[table]['rows']
+
+        definitions = []
+        for i in range(len(columns)):
+            definitions.append('%s %s' % (columns[i], columnType([r[i] for r in rows])))
+
+        sqlFile.write('create table if not exists %s (%s);\n' % (table, ', '.join(definitions)))
+        sqlFile.write('copy %s (%s) from stdin;\n' % (table, ', '.join(columns)))
+        for r in rows:
+            sqlFile.write('\t'.join(map(copyValue, r)) + '\n')
+        sqlFile.write('\\.\n')
+
+    for table in sorted(keys.sequences.keys()):
+        keyColumn, sequence = keys.sequences[table]
+        sqlFile.write(sequenceSQL % (table.lower(), sequence, sequence, keyColumn, table))
+
+    sqlFile.write('commit;\n')
+    sqlFile.write('analyze;\n')
+
+# Purpose: build the template database from a fixture dump
+# Returns: nothing
+# Assumes: nothing
+# Effects: creates the template database (dropping it first if
+#	'replace' is set) and loads the schema and the dump into it
+#	exits if a step fails
+# Throws:  nothing
+
+def seed(
+    template,		# template database name (string)
+    dumpFileName,	# fixture dump file name (string)
+    schemaFileName,	# schema file name, or None (string)
+    replace,		# 1 to drop an existing template first (integer)
+    env			# environment (dictionary)
+    ):
+
+    dumpFile = open(dumpFileName, 'r')
+    dump = json.load(dumpFile)
+    dumpFile.close()
+
+    if replace:
+        harness.pgCommand(['dropdb', '--if-exists', template], env)
+
+    harness.pgCommand(['createdb', template], env)
+
+    psql = ['psql', '-q', '-v', 'ON_ERROR_STOP=1', '-d', template]
+
+    if schemaFileName is not None:
+        harness.pgCommand(psql + ['-f', schemaFileName], env)
+
+    process = subprocess.Popen(psql + ['-f', '-', '-h', env['PG_DBSERVER'], '-U', env['PG_DBUSER']],
+        stdin = subprocess.PIPE, env = env)
+    writeSQL(dump, process.stdin)
+    process.stdin.close()
+
+    if process.wait() != 0:
+        sys.stderr.write('Could not load %s into %s\n' % (dumpFileName, template))
+        sys.exit(1)
+
+# Purpose: prints the usage message and exits
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits with status 1
+# Throws:  nothing
+
+def usage(message):
+
+    sys.stderr.write('%s\nUsage: %s --dump dump.json [--schema schema.sql] [--replace]\n' \
+        % (message, sys.argv[0]))
+    sys.exit(1)
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], '', ['dump=', 'schema=', 'replace'])
+    except getopt.GetoptError as e:
+        usage(str(e))
+
+    dumpFileName = None
+    schemaFileName = None
+    replace = 0
+
+    for opt, arg in opts:
+        if opt == '--dump':
+            dumpFileName = arg
+        elif opt == '--schema':
+            schemaFileName = arg
+        elif opt == '--replace':
+            replace = 1
+
+    if dumpFileName is None:
+        usage('--dump is required')
+
+    env = dict(os.environ)
+    env.setdefault('BENCHTEMPLATE', 'mgd_bench')
+
+    passwordFile = open(env['PG_1LINE_PASSFILE'], 'r')
+    env['PGPASSWORD'] = passwordFile.readline().strip()
+    passwordFile.close()
+
+    seed(env['BENCHTEMPLATE'], dumpFileName, schemaFileName, replace, env)
@@ -24,6 +24,10 @@
 #
 # Envvars:
 #
+#	PROBELOADBCPWORKERS	number of bcp commands to run at a time (default 4)
+#	PROBELOADSQLLOG		SQL logged to the diagnostics file: all (default),
+#				sample:N (every Nth statement), summary or off
+#
 # Inputs:
 #
 #	A tab-delimited file in the format:
@@ -56,12 +60,14 @@
 #
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
 #
 # Exit Codes:
 #
 # Assumes:
 #
-#	That no one else is adding Nomen records to the database.
+#	Nothing; the primary keys and MGI IDs used by the load are reserved
+#	before the first line is processed (see probeloadlib/keys.py).
 #
 # Bugs:
 #
@@ -75,38 +81,12 @@ import db
 import mgi_utils
 import accessionlib
 import loadlib
+from probeloadlib import keys
+from probeloadlib import loader
+from probeloadlib import reader
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-mode = os.environ['PRIMERMODE']
-currentDir = os.environ['PRIMERLOADDIR']
-inputFileName = os.environ['PRIMERDATAFILE']
-outputDir = os.environ['OUTPUTDIR']
-
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
-
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
-
-bcpon = 1		# can the bcp files be bcp-ed into the database?  default is yes.
-
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
-primerFile = ''         # file descriptor
-markerFile = ''		# file descriptor
-refFile = ''            # file descriptor
-aliasFile = ''          # file descriptor
-accFile = ''            # file descriptor
-accRefFile = ''         # file descriptor
-noteFile = ''		# file descriptor
-
 primerTable = 'PRB_Probe'
 markerTable = 'PRB_Marker'
 refTable = 'PRB_Reference'
@@ -114,25 +94,7 @@ aliasTable = 'PRB_Alias'
 accTable = 'ACC_Accession'
 accRefTable = 'ACC_AccessionReference'
 noteTable = 'PRB_Notes'
-newPrimerFile = 'newPrimer.txt'
-
-primerFileName = primerTable + '.bcp'
-markerFileName = markerTable + '.bcp'
-refFileName = refTable + '.bcp'
-aliasFileName = aliasTable + '.bcp'
-accFileName = accTable + '.bcp'
-accRefFileName = accRefTable + '.bcp'
-noteFileName = noteTable + '.bcp'
-newPrimerFileName = newPrimerFile
-
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
-
-primerKey = 0           # PRB_Probe._Probe_key
-refKey = 0		# PRB_Reference._Reference_key
-aliasKey = 0		# PRB_Reference._Reference_key
-accKey = 0              # ACC_Accession._Accession_key
-mgiKey = 0              # ACC_AccessionMax.maxNumericPart
+newPrimerFileName = 'newPrimer.txt'
 
 segmentTypeKey = 63473	# PRB_Probe._SegmentType_key
 vectorKey = 316369	# PRB_Probe._Vector_key
@@ -142,281 +104,156 @@ mgiTypeKey = 3		# Molecular Segment
 mgiPrefix = "MGI:"
 logicalDBKey = 9	# Logical DB for Nucleotide Sequences
 
-referenceDict = {}      # dictionary of references for quick lookup
-markerDict = {}      	# dictionary of markers for quick lookup
-
 loaddate = loadlib.loaddate
 
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          calls showUsage() if usage error
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global primerFile, markerFile, refFile, aliasFile, accFile, accRefFile, noteFile, newPrimerFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        primerFile = open(primerFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % primerFileName)
-
-    try:
-        markerFile = open(markerFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % markerFileName)
-
-    try:
-        refFile = open(refFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % refFileName)
-
-    try:
-        aliasFile = open(aliasFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % aliasFileName)
-
-    try:
-        accFile = open(accFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % accFileName)
-
-    try:
-        accRefFile = open(accRefFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % accRefFileName)
-
-    try:
-        noteFile = open(noteFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % noteFileName)
-
-    try:
-        newPrimerFile = open(newPrimerFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % newPrimerFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode == 'preview':
-        DEBUG = 1
-        bcpon = 0
-    elif mode != 'load':
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  sets global primary key variables
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  sets global primary key variables
-# Throws:   nothing
-
-def setPrimaryKeys():
+class PrimerLoad(loader.Loader):
 
-    global primerKey, refKey, aliasKey, accKey, mgiKey
+    program = 'primerload'
+    columns = 12
 
-    results = db.sql('select max(_Probe_key) + 1 as maxKey from PRB_Probe', 'auto')
-    primerKey = results[0]['maxKey']
+    tables = [primerTable, markerTable, refTable, aliasTable, accTable, accRefTable, noteTable]
+    extraFiles = [newPrimerFileName]
 
-    results = db.sql('select max(_Reference_key) + 1 as maxKey from PRB_Reference', 'auto')
-    refKey = results[0]['maxKey']
+    timedFunctions = [
+        (loadlib, ['verifyMarker', 'verifyReference', 'verifyUser']),
+        ]
 
-    results = db.sql('select max(_Alias_key) + 1 as maxKey from PRB_Alias', 'auto')
-    aliasKey = results[0]['maxKey']
+    # from configuration file
+    modeEnv = 'PRIMERMODE'
+    loadDirEnv = 'PRIMERLOADDIR'
+    dataFileEnv = 'PRIMERDATAFILE'
+    outputDirEnv = 'OUTPUTDIR'
 
-    results = db.sql('select max(_Accession_key) + 1 as maxKey from ACC_Accession', 'auto')
-    accKey = results[0]['maxKey']
+    def __init__(self):
 
-    results = db.sql('''select maxNumericPart + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' % (mgiPrefix), 'auto')
-    mgiKey = results[0]['maxKey']
+        loader.Loader.__init__(self)
 
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
+        self.primerKey = 0	# PRB_Probe._Probe_key
+        self.refKey = 0		# PRB_Reference._Reference_key
+        self.aliasKey = 0	# PRB_Alias._Alias_key
+        self.accKey = 0		# ACC_Accession._Accession_key
+        self.mgiKey = 0		# ACC_AccessionMax.maxNumericPart
 
-def bcpFiles():
+    # Purpose:  sets the primary key variables
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  counts the lines, aliases and sequence IDs in the input file
+    #	    and reserves a block of keys for each table (see probeloadlib/keys.py)
+    #	    exits if a line is invalid
+    # Throws:   nothing
 
-    if DEBUG or not bcpon:
-        return
+    def setPrimaryKeys(self):
 
-    primerFile.close()
-    markerFile.close()
-    refFile.close()
-    aliasFile.close()
-    accFile.close()
-    accRefFile.close()
-    noteFile.close()
+        lineCount = 0
+        aliasCount = 0
+        seqIDCount = 0
 
-    db.commit()
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+            lineCount = lineCount + 1
+            seqIDCount = seqIDCount + len([a for a in string.split(tokens[9], '|') if len(a) > 0])
+            aliasCount = aliasCount + len([a for a in string.split(tokens[10], '|') if len(a) > 0])
 
-    bcp1 = bcpCommand % (primerTable, primerFileName)
-    bcp2 = bcpCommand % (markerTable, markerFileName)
-    bcp3 = bcpCommand % (refTable, refFileName)
-    bcp4 = bcpCommand % (aliasTable, aliasFileName)
-    bcp5 = bcpCommand % (accTable, accFileName)
-    bcp6 = bcpCommand % (accTable, accFileName)
-    bcp7 = bcpCommand % (noteTable, noteFileName)
+        self.inputFile.seek(0)
 
-    for bcpCmd in [bcp1, bcp2, bcp3, bcp4, bcp5, bcp6, bcp7]:
-	diagFile.write('%s\n' % bcpCmd)
-	os.system(bcpCmd)
+        self.primerKey = keys.reserveKeys(primerTable, lineCount, self.DEBUG)
+        self.refKey = keys.reserveKeys(refTable, lineCount, self.DEBUG)
+        self.aliasKey = keys.reserveKeys(aliasTable, aliasCount, self.DEBUG)
+        self.accKey = keys.reserveKeys(accTable, lineCount + seqIDCount, self.DEBUG)
+        self.mgiKey = keys.reserveAccessionNumbers(mgiPrefix, lineCount, self.DEBUG)
 
-    db.commit()
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
 
-    return
+    def validateRow(self, lineNum, tokens):
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+        errorFile = self.errorFile
 
-def processFile():
+        error = 0
+        markerIDs = string.split(tokens[1], '|')
+        name = tokens[2]
+        jnum = tokens[3]
+        createdBy = tokens[11]
 
-    global primerKey, refKey, aliasKey, accKey, mgiKey
+        # marker IDs
 
-    lineNum = 0
-    # For each line in the input file
+        markers = []
+        for markerID in markerIDs:
 
-    for line in inputFile.readlines():
+            markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
 
-        error = 0
-        lineNum = lineNum + 1
-
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
-
-        try:
-	    markerSymbol = tokens[0]	# not used
-	    markerIDs = string.split(tokens[1], '|')
-	    name = tokens[2]
-	    jnum = tokens[3]
-	    regionCovered = tokens[4]
-	    sequence1 = tokens[5]
-	    sequence2 = tokens[6]
-	    productSize = tokens[7]
-	    notes = tokens[8]
-	    sequenceIDs = tokens[9]
-	    aliasList = string.split(tokens[10], '|')
-	    createdBy = tokens[11]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
-
-	# marker IDs
-
-	markerList = []
-	for markerID in markerIDs:
-
-	    markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
-
-	    if len(markerID) > 0 and markerKey == 0:
-	        errorFile.write('Invalid Marker:  %s, %s\n' % (name, markerID))
-	        error = 1
+            if len(markerID) > 0 and markerKey == 0:
+                errorFile.write('Invalid Marker:  %s, %s\n' % (name, markerID))
+                error = 1
             elif len(markerID) > 0:
-		markerList.append(markerKey)
+                markers.append((markerID, markerKey))
 
-        referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+        markerList = self.uniqueMarkers(name, markers)
 
-	# sequence IDs
-	seqAccList = string.split(sequenceIDs, '|')
+        referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
+        createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
 
-        # if errors, continue to next record
         if error:
-            continue
+            return None
+
+        return {
+            'tokens' : tokens,
+            'referenceKey' : referenceKey,
+            'createdByKey' : createdByKey,
+            'markerList' : markerList,
+            }
+
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the primer to the table outputs and the new primer
+    #	    file; advances the primary keys
+    # Throws:   nothing
+
+    def writeRow(self, row):
+
+        primerFile = self.outputs[primerTable]
+        markerFile = self.outputs[markerTable]
+        refFile = self.outputs[refTable]
+        aliasFile = self.outputs[aliasTable]
+        accFile = self.outputs[accTable]
+        accRefFile = self.outputs[accRefTable]
+        noteFile = self.outputs[noteTable]
+        newPrimerFile = self.files[newPrimerFileName]
+
+        primerKey = self.primerKey
+        refKey = self.refKey
+        mgiKey = self.mgiKey
+
+        tokens = row['tokens']
+        name = tokens[2]
+        regionCovered = tokens[4]
+        sequence1 = tokens[5]
+        sequence2 = tokens[6]
+        productSize = tokens[7]
+        notes = tokens[8]
+        sequenceIDs = tokens[9]
+        aliasList = string.split(tokens[10], '|')
+
+        referenceKey = row['referenceKey']
+        createdByKey = row['createdByKey']
+        markerList = row['markerList']
+
+        # sequence IDs
+        seqAccList = string.split(sequenceIDs, '|')
 
         # if no errors, process the primer
 
         primerFile.write('%d\t%s\t\t%d\t%d\t%s\t%s\t%s\t%s\t\t\t%s\t%s\t%s\t%s\t%s\n' \
             % (primerKey, name, NA, vectorKey, segmentTypeKey, mgi_utils.prvalue(sequence1), \
-	    mgi_utils.prvalue(sequence2), mgi_utils.prvalue(regionCovered), mgi_utils.prvalue(productSize), \
-	    createdByKey, createdByKey, loaddate, loaddate))
-
-	for markerKey in markerList:
-	    if markerList.count(markerKey) == 1:
-                markerFile.write('%s\t%s\t%d\t%s\t%s\t%s\t%s\t%s\n' \
-		    % (primerKey, markerKey, referenceKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
-            else:
-		errorFile.write('Invalid Marker Duplicate:  %s, %s\n' % (name, markerID))
+            mgi_utils.prvalue(sequence2), mgi_utils.prvalue(regionCovered), mgi_utils.prvalue(productSize), \
+            createdByKey, createdByKey, loaddate, loaddate))
 
-	# loaddate))
+        for markerKey in markerList:
+            markerFile.write('%s\t%s\t%d\t%s\t%s\t%s\t%s\t%s\n' \
+                % (primerKey, markerKey, referenceKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
 
         refFile.write('%s\t%s\t%s\t0\t0\t%s\t%s\t%s\t%s\n' % (refKey, primerKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
 
@@ -426,59 +263,47 @@ def processFile():
             if len(alias) == 0:
                 continue
             aliasFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\n' \
-                    % (aliasKey, refKey, alias, createdByKey, createdByKey, loaddate, loaddate))
-            aliasKey = aliasKey + 1
+                % (self.aliasKey, refKey, alias, createdByKey, createdByKey, loaddate, loaddate))
+            self.aliasKey = self.aliasKey + 1
 
         # MGI Accession ID for the marker
 
         accFile.write('%s\t%s%d\t%s\t%s\t1\t%d\t%d\t0\t1\t%s\t%s\t%s\t%s\n' \
-            % (accKey, mgiPrefix, mgiKey, mgiPrefix, mgiKey, primerKey, mgiTypeKey, createdByKey, createdByKey, loaddate, loaddate))
+            % (self.accKey, mgiPrefix, mgiKey, mgiPrefix, mgiKey, primerKey, mgiTypeKey, createdByKey, createdByKey, loaddate, loaddate))
 
-	newPrimerFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s%d\n' \
-	   % (markerSymbol, string.join(markerIDs, '|'), name, jnum, regionCovered, sequence1, sequence2, productSize, notes, sequenceIDs, createdBy, mgiPrefix, mgiKey))
+        # the input line without the aliases, with the new MGI Primer ID
+        # as the last field
 
-        accKey = accKey + 1
-        mgiKey = mgiKey + 1
+        newPrimerFields = tokens[0:10] + [tokens[11]]
+        newPrimerFile.write('%s\t%s%d\n' % (string.join(newPrimerFields, '\t'), mgiPrefix, mgiKey))
 
-	# sequence accession ids
-	for acc in seqAccList:
+        self.accKey = self.accKey + 1
+        self.mgiKey = self.mgiKey + 1
 
-	    if len(acc) == 0:
-		continue
+        # sequence accession ids
+        for acc in seqAccList:
+
+            if len(acc) == 0:
+                continue
 
-	    prefixPart, numericPart = accessionlib.split_accnum(acc)
+            prefixPart, numericPart = accessionlib.split_accnum(acc)
             accFile.write('%s\t%s\t%s\t%s\t%s\t%d\t%d\t0\t1\t%s\t%s\t%s\t%s\n' \
-                % (accKey, acc, prefixPart, numericPart, logicalDBKey, primerKey, mgiTypeKey, createdByKey, createdByKey, loaddate, loaddate))
+                % (self.accKey, acc, prefixPart, numericPart, logicalDBKey, primerKey, mgiTypeKey, createdByKey, createdByKey, loaddate, loaddate))
             accRefFile.write('%s\t%s\t%s\t%s\t%s\t%s\n' \
-                % (accKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
-	    accKey = accKey + 1
+                % (self.accKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
+            self.accKey = self.accKey + 1
 
-	# notes
+        # notes
 
-	if len(notes) > 0:
-	   noteFile.write('%s|1\t%s\t%s\t%s\n' \
-		% (primerKey, notes, loaddate, loaddate))
+        if len(notes) > 0:
+            noteFile.write('%s|1\t%s\t%s\t%s\n' \
+                % (primerKey, notes, loaddate, loaddate))
 
-	refKey = refKey + 1
-        primerKey = primerKey + 1
-
-    #	end of "for line in inputFile.readlines():"
-
-    #
-    # Update the AccessionMax value
-    #
-
-    if not DEBUG:
-        db.sql('select * from ACC_setMax (%d)' % (lineNum), None)
+        self.refKey = self.refKey + 1
+        self.primerKey = self.primerKey + 1
 
 #
 # Main
 #
 
-init()
-verifyMode()
-setPrimaryKeys()
-processFile()
-bcpFiles()
-exit(0)
-
+PrimerLoad().run()
@@ -43,6 +43,7 @@
 #
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
 #
 # Exit Codes:
 #
@@ -63,268 +64,191 @@
 import sys
 import os
 import string
+import StringIO
 import accessionlib
 import db
 import mgi_utils
 import loadlib
 import sourceloadlib
+from probeloadlib import keys
+from probeloadlib import loader
+from probeloadlib import reader
+from probeloadlib import staging
 
 #globals
 
+refTable = 'PRB_Reference'
+aliasTable = 'PRB_Alias'
+
+mgiTypeKey = '3'
+
 #
-# from configuration file
+# the from/to pairs are staged in 'mergeTable' and applied to the
+# whole file at once (see probeloadlib/staging.py)
 #
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-mode = os.environ['PROBELOADMODE']
-currentDir = os.environ['PROBELOADDIR']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
+mergeTable = 'probeassay_merge'
+mergeColumns = 'fromKey int not null, toKey int not null, refsKey int not null'
 
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
+# move assay information from fromID to toID
+updateAssaySQL = '''update GXD_ProbePrep p set _Probe_key = m.toKey
+	from %s m
+	where p._Probe_key = m.fromKey''' % (mergeTable)
 
-bcpon = 1  
+# move fromID (from) references to toID
+updateRefSQL = '''update PRB_Reference r set _Probe_key = m.toKey
+	from %s m
+	where r._Probe_key = m.fromKey
+	and r._Refs_key != m.refsKey''' % (mergeTable)
 
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
+# delete fromID (from)
+deleteProbeSQL = '''delete from PRB_Probe p
+	using %s m
+	where p._Probe_key = m.fromKey''' % (mergeTable)
 
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
+#
+# the (fromKey, toKey, referenceKey) of every line are staged in
+# 'checkTable' so that the gene and J: checks are answered for the
+# whole file by two queries
+#
+checkTable = 'probeassay_check'
+checkColumns = 'lineNum int not null, fromKey int not null, toKey int not null, refsKey int not null'
+
+# check that all genes are the same
+checkGenesSQL = '''
+	select distinct v.lineNum as lineNum
+	from %s v, PRB_Marker f, PRB_Marker t, GXD_ProbePrep p, GXD_Assay a
+	where f._Probe_key = v.fromKey
+	and t._Probe_key = v.toKey
+	and p._Probe_key = v.fromKey
+	and p._ProbePrep_key = a._ProbePrep_key
+	and f._Marker_key = t._Marker_key
+	and f._Marker_key = a._Marker_key
+	''' % (checkTable)
+
+# check that the J: is on at least one Assay
+checkJAssaySQL = '''
+	select distinct v.lineNum as lineNum
+	from %s v, GXD_ProbePrep p, GXD_Assay a
+	where p._Probe_key = v.fromKey
+	and p._ProbePrep_key = a._ProbePrep_key
+	and a._Refs_key = v.refsKey
+	''' % (checkTable)
 
-refFile = ''            # file descriptor
-aliasFile = ''          # file descriptor
+loaddate = loadlib.loaddate
 
-refTable = 'PRB_Reference'
-aliasTable = 'PRB_Alias'
+class ProbeAssay(loader.Loader):
 
-refFileName = refTable + '.bcp'
-aliasFileName = aliasTable + '.bcp'
+    program = 'probeassay'
+    columns = 5
 
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
+    tables = [refTable, aliasTable]
 
-refKey = 0              # PRB_Reference._Reference_key
-aliasKey = 0            # PRB_Alias._Alias_key
+    timedFunctions = [
+        (loadlib, ['verifyObject', 'verifyReference', 'verifyUser']),
+        ]
+    timedMethods = ['checkAssays']
 
-mgiTypeKey = '3'
-updateAssaySQL = '''update GXD_ProbePrep set _Probe_key = %s where _Probe_key = %s'''
-updateRefSQL = '''update PRB_Reference set _Probe_key = %s where _Probe_key = %s and _Refs_key != %s'''
-deleteProbeSQL = '''delete PRB_Probe from PRB_Probe where _Probe_key = %s'''
+    def __init__(self):
 
-execAssaySQL = []
-execRefSQL = []
-execProbeSQL = []
+        loader.Loader.__init__(self)
 
-loaddate = loadlib.loaddate
+        self.refKey = 0		# PRB_Reference._Reference_key
+        self.aliasKey = 0	# PRB_Alias._Alias_key
 
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global refFile, aliasFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        refFile = open(refFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % refFileName)
-
-    try:
-        aliasFile = open(aliasFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % aliasFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode == 'preview':
-        DEBUG = 1
-        bcpon = 0
-    elif mode != 'load':
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  sets global primary key variables
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  sets global primary key variables
-# Throws:   nothing
-
-def setPrimaryKeys():
-
-    global refKey, aliasKey
-
-    results = db.sql('select maxKey = max(_Reference_key) + 1 from PRB_Reference', 'auto')
-    refKey = results[0]['maxKey']
-
-    results = db.sql('select maxKey = max(_Alias_key) + 1 from PRB_Alias', 'auto')
-    aliasKey = results[0]['maxKey']
-
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
+        self.mergeList = []	# list of (fromKey, toKey, referenceKey)
+        self.fromKeys = set()	# fromKeys in mergeList
+        self.toKeys = set()	# toKeys in mergeList
 
-def bcpFiles():
+        self.lookupRows = {}	# lineNum : lookups of the line (see lookupRow())
+        self.genesLines = set()	# lines whose genes are the same
+        self.jAssayLines = set()	# lines whose J: is on an assay
 
-    diagFile.write(execAssaySQL)
-    diagFile.write(execRefSQL)
-    diagFile.write(execProbeSQL)
+    # Purpose:  sets the primary key variables
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  counts the lines in the input file and reserves a block
+    #	    of reference and alias keys, one of each per line
+    #	    (see probeloadlib/keys.py)
+    #	    exits if a line is invalid
+    # Throws:   nothing
 
-    if DEBUG or not bcpon:
-        return
+    def setPrimaryKeys(self):
 
-    refFile.close()
-    aliasFile.close()
+        lineCount = 0
 
-    db.commit()
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+            lineCount = lineCount + 1
 
-    # execute the sql commands
+        self.inputFile.seek(0)
 
-    # move assay information from fromID to toID
-    for r in execAssaySQL:
-        db.sql(r, None)
+        self.refKey = keys.reserveKeys(refTable, lineCount, self.DEBUG)
+        self.aliasKey = keys.reserveKeys(aliasTable, lineCount, self.DEBUG)
 
-    # move fromID (from) references to toID
-    db.sql(execRefSQL, None)
+    # Purpose:  runs the gene and J: checks for every line at once
+    # Returns:  two sets of line numbers: the lines whose genes are the same,
+    #	    and the lines whose J: is on at least one assay of the "from" probe
+    # Assumes:  nothing
+    # Effects:  stages the keys of every line in 'checkTable'
+    # Throws:   nothing
 
-    # delete fromID (from)
-    db.sql(execProbeSQL, None)
+    def checkAssays(self,
+        rows	# list of (lineNum, fromKey, toKey, referenceKey)
+        ):
 
-    db.commit()
+        staging.stageTable(checkTable, checkColumns, rows)
 
-    bcp1 = bcpCommand % (refTable, refFileName)
-    bcp2 = bcpCommand % (aliasTable, aliasFileName)
+        genesLines = set([r['lineNum'] for r in db.sql(checkGenesSQL, 'auto')])
+        jAssayLines = set([r['lineNum'] for r in db.sql(checkJAssaySQL, 'auto')])
 
-    for bcpCmd in [bcp1, bcp2]:
-        diagFile.write('%s\n' % bcpCmd)
-        os.system(bcpCmd)
+        return genesLines, jAssayLines
 
-    db.commit()
+    # Purpose:  looks up the keys of one input line
+    # Returns:  (fromKey, toKey, referenceKey, createdByKey, lookup errors)
+    # Assumes:  nothing
+    # Effects:  nothing; the lookup errors are kept with the line and
+    #	    reported by validateRow()
+    # Throws:   nothing
 
-    return
+    def lookupRow(self, lineNum, tokens):
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+        fromID = tokens[0]
+        toID = tokens[2]
+        jnum = tokens[3]
+        createdBy = tokens[4]
 
-def processFile():
+        lookupErrors = StringIO.StringIO()
+        fromKey = loadlib.verifyObject(fromID, mgiTypeKey, None, lineNum, lookupErrors)
+        toKey = loadlib.verifyObject(toID, mgiTypeKey, None, lineNum, lookupErrors)
+        referenceKey = loadlib.verifyReference(jnum, lineNum, lookupErrors)
+        createdByKey = loadlib.verifyUser(createdBy, lineNum, lookupErrors)
 
-    global refKey, aliasKey
-    global execProbeSQL
-    global execAssaySQL
-    global execRefSQL
+        return (fromKey, toKey, referenceKey, createdByKey, lookupErrors.getvalue())
 
-    lineNum = 0
-    # For each line in the input file
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  the line was looked up and checked by processFile()
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
 
-    for line in inputFile.readlines():
+    def validateRow(self, lineNum, tokens):
 
-	error = 0
-        lineNum = lineNum + 1
+        errorFile = self.errorFile
 
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
+        error = 0
+        fromID = tokens[0]
+        toID = tokens[2]
+        jnum = tokens[3]
+        createdBy = tokens[4]
 
-        try:
-	    fromID = tokens[0]
-	    name = tokens[1]
-	    toID = tokens[2]
-	    jnum = tokens[3]
-	    createdBy = tokens[4]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+        fromKey, toKey, referenceKey, createdByKey, lookupErrors = self.lookupRows[lineNum]
 
-        fromKey = loadlib.verifyObject(fromID, mgiTypeKey, None, lineNum, errorFile)
-        toKey = loadlib.verifyObject(toID, mgiTypeKey, None, lineNum, errorFile)
-	referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+        errorFile.write(lookupErrors)
 
-	if fromKey == 0:
+        if fromKey == 0:
             errorFile.write('Invalid Probe "From":  %s\n' % (fromID))
             error = 1
 
-	if toKey == 0:
+        if toKey == 0:
             errorFile.write('Invalid Probe "To":  %s\n' % (toID))
             error = 1
 
@@ -336,69 +260,120 @@ def processFile():
             errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
             error = 1
 
-	# check that all genes are the same
-	checkGenesSQL = '''
-			select f.*
-			from PRB_Marker f, PRB_Marker t, GXD_ProbePrep p, GXD_Assay a
-			where f._Probe_key = %s
-			and t._Probe_key = %s
-			and p._Probe_key = %s
-			and p._ProbePrep_key = a._ProbePrep_key
-			and f._Marker_key = t._Marker_key
-			and f._Marker_key = a._Marker_key
-			''' % (fromKey, toKey, fromKey)
-
-	checkGenes = db.sql(checkGenesSQL, 'auto')
-        if len(checkGenes) == 0:
+        # check that all genes are the same
+        if lineNum not in self.genesLines:
             errorFile.write('Gene of GenePaint, Eurexpress and Assay are not the same:  %s, %s\n' % (fromID, toID))
             error = 1
 
-	# check that the J: is on at least one Assay
-	checkJAssaySQL = '''
-			 select a.*
-			 from GXD_ProbePrep p, GXD_Assay a
-			 where p._Probe_key = %s
-			 and p._ProbePrep_key = a._ProbePrep_key
-			 and a._Refs_key = %s
-			 ''' % (fromKey, referenceKey)
-
-	checkJAssay = db.sql(checkJAssaySQL, 'auto')
-        if len(checkJAssay) == 0:
+        # check that the J: is on at least one Assay
+        if lineNum not in self.jAssayLines:
             errorFile.write('J: is not on any Assays attached to the probe:  %s\n' % (fromID))
             error = 1
 
-        # if errors, continue to next record
+        # the merges are applied all at once, so a probe may not be merged
+        # twice, nor be merged into a probe that is itself merged
+        if fromKey in self.fromKeys or fromKey in self.toKeys or toKey in self.fromKeys:
+            errorFile.write('Probe is already merged by an earlier line:  %s, %s\n' % (fromID, toID))
+            error = 1
+
         if error:
-            continue
+            return None
+
+        return {
+            'name' : tokens[1],
+            'fromKey' : fromKey,
+            'toKey' : toKey,
+            'referenceKey' : referenceKey,
+            'createdByKey' : createdByKey,
+            }
+
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the reference and alias to the table outputs;
+    #	    adds the merge to mergeList; advances the primary keys
+    # Throws:   nothing
 
-	# add alias using fromID name (from) to toID
+    def writeRow(self, row):
 
-        refFile.write('%s\t%s\t%s\t0\t0\t%s\t%s\t%s\t%s\n' \
-        	% (refKey, toKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
-        aliasFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\n' \
-        	% (aliasKey, refKey, name, createdByKey, createdByKey, loaddate, loaddate))
-        refKey = refKey + 1
-        aliasKey = aliasKey + 1
+        fromKey = row['fromKey']
+        toKey = row['toKey']
+        referenceKey = row['referenceKey']
+        createdByKey = row['createdByKey']
 
-	# move assay information from fromID to toID
-	execAssaySQL.append(updateAssaySQL % (toKey, fromKey))
+        # add alias using fromID name (from) to toID
 
-	# move fromID (from) references to toID
-	execRefSQL.append(updateRefSQL % (toKey, fromKey, referenceKey))
+        self.outputs[refTable].write('%s\t%s\t%s\t0\t0\t%s\t%s\t%s\t%s\n' \
+            % (self.refKey, toKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
+        self.outputs[aliasTable].write('%s\t%s\t%s\t%s\t%s\t%s\t%s\n' \
+            % (self.aliasKey, self.refKey, row['name'], createdByKey, createdByKey, loaddate, loaddate))
+        self.refKey = self.refKey + 1
+        self.aliasKey = self.aliasKey + 1
 
-	# delete fromID (from)
-	execProbeSQL.append(deleteProbeSQL % (fromKey))
+        # move assay information and references from fromID to toID;
+        # delete fromID (see executeSQL())
+        self.mergeList.append((fromKey, toKey, referenceKey))
+        self.fromKeys.add(fromKey)
+        self.toKeys.add(toKey)
 
-    #	end of "for line in inputFile.readlines():"
+    # Purpose:  processes data
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  looks up the keys of every line in the input file,
+    #	    runs the gene and J: checks for all lines at once,
+    #	    then verifies and processes each line
+    # Throws:   nothing
+
+    def processFile(self):
+
+        lines = []
+
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+            self.lookupRows[lineNum] = self.lookupRow(lineNum, tokens)
+            lines.append((lineNum, tokens))
+
+        rows = []
+        for lineNum, tokens in lines:
+            fromKey, toKey, referenceKey = self.lookupRows[lineNum][:3]
+            rows.append((lineNum, fromKey, toKey, referenceKey))
+
+        self.genesLines, self.jAssayLines = self.checkAssays(rows)
+
+        for lineNum, tokens in lines:
+            self.processRow(lineNum, tokens)
+
+    # Purpose:  merges the probes
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  stages mergeList and moves the assays and references of
+    #	    each "from" probe to its "to" probe; deletes the "from" probes
+    # Throws:   nothing
+
+    def executeSQL(self):
+
+        if len(self.mergeList) > 0:
+            staging.stageTable(mergeTable, mergeColumns, self.mergeList)
+            db.sql(updateAssaySQL, None)
+            db.sql(updateRefSQL, None)
+            db.sql(deleteProbeSQL, None)
+
+    # Purpose:  BCPs the data into the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  see loader.Loader.bcpFiles() and executeSQL()
+    # Throws:   nothing
+
+    def bcpFiles(self):
+
+        self.diagFile.write('%d probe(s) to merge\n' % (len(self.mergeList)))
+
+        for r in [updateAssaySQL, updateRefSQL, deleteProbeSQL]:
+            self.diagFile.write('%s\n' % (r))
+
+        loader.Loader.bcpFiles(self)
 
 #
 # Main
 #
 
-init()
-verifyMode()
-setPrimaryKeys()
-processFile()
-bcpFiles()
-exit(0)
-
+ProbeAssay().run()
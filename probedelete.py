@@ -18,6 +18,9 @@
 #
 # Envvars:
 #
+#	PROBEDELETECHUNK	number of probes deleted per commit in
+#				load-bulk mode (default 1000)
+#
 # Inputs:
 #
 #	A tab-delimited file in the format:
@@ -27,6 +30,16 @@
 #
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
+#
+# Modes:
+#
+#	preview			preview the deletes
+#	load			delete the probes one at a time
+#	preview-bulk		preview the deletes of load-bulk; writes them to
+#				the diagnostics file
+#	load-bulk		look up all of the probes at once and delete them
+#				PROBEDELETECHUNK at a time, committing each chunk
 #
 # Exit Codes:
 #
@@ -52,165 +65,137 @@ import db
 import mgi_utils
 import loadlib
 import sourceloadlib
+from probeloadlib import instrument
+from probeloadlib import loader
+from probeloadlib import lookups
+from probeloadlib import reader
+from probeloadlib import sqlutil
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-currentDir = os.environ['PROBELOADDIR']
-mode = os.environ['PROBELOADMODE']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
+mgiTypeKey = '3'
+deleteSQL = '''delete from PRB_Probe where _Probe_key = %s'''
+deleteBulkSQL = '''delete from PRB_Probe where _Probe_key in (%s)'''
 
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
+loaddate = loadlib.loaddate
 
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
+class ProbeDelete(loader.Loader):
 
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
+    program = 'probedelete'
+    columns = 1
 
-mgiTypeKey = '3'
-deleteSQL = '''delete PRB_Probe from PRB_Probe where _Probe_key = %s'''
+    previewModes = ('preview', 'preview-bulk')
+    loadModes = ('load', 'load-bulk')
+    bulkModes = ('preview-bulk', 'load-bulk')
 
-loaddate = loadlib.loaddate
+    timedFunctions = [
+        (loadlib, ['verifyObject']),
+        ]
+
+    phases = ['init', 'verifyMode', 'processFile']
+
+    def __init__(self):
+
+        loader.Loader.__init__(self)
+
+        self.chunkSize = int(os.environ.get('PROBEDELETECHUNK', 1000))
+
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the probe is invalid
+    # Throws:   nothing
+
+    def validateRow(self, lineNum, tokens):
+
+        probeKey = loadlib.verifyObject(tokens[0], mgiTypeKey, None, lineNum, self.errorFile)
+
+        if probeKey == 0:
+            return None
+
+        return {'probeKey' : probeKey}
+
+    # Purpose:  deletes one probe
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  deletes the probe from the database
+    #	    (prints the delete in preview mode)
+    # Throws:   nothing
+
+    def writeRow(self, row):
 
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode == 'preview':
-        DEBUG = 1
-        bcpon = 0
-    elif mode != 'load':
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
-
-def processFile():
-
-    lineNum = 0
-    # For each line in the input file
-
-    for line in inputFile.readlines():
-
-        lineNum = lineNum + 1
-
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
-
-        try:
-	    probeID = tokens[0]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
-
-        probeKey = loadlib.verifyObject(probeID, mgiTypeKey, None, lineNum, errorFile)
-
-	if probeKey == 0:
-            continue
-
-	if DEBUG:
-	    print deleteSQL % (probeKey)
-	    continue
+        if self.DEBUG:
+            print deleteSQL % (row['probeKey'])
+            return
 
-	db.sql(deleteSQL % (probeKey), None)
+        instrument.call('delete', db.sql, deleteSQL % (row['probeKey']), None)
 
-    #	end of "for line in inputFile.readlines():"
+    # Purpose:  processes data
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  verifies and processes each line in the input file
+    # Throws:   nothing
+
+    def processFile(self):
+
+        if self.mode in self.bulkModes:
+            self.processFileBulk()
+        else:
+            loader.Loader.processFile(self)
+
+    # Purpose:  processes data in the bulk modes
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  verifies each line in the input file, then deletes the
+    #	    probes 'chunkSize' at a time, committing after each chunk
+    #	    writes the progress to the diagnostics file
+    #	    (writes the deletes there instead in preview-bulk mode)
+    # Throws:   nothing
+
+    def processFileBulk(self):
+
+        lines = []
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+            lines.append((lineNum, tokens[0]))
+
+        lookups.resolveProbes(set([probeID for lineNum, probeID in lines]))
+
+        probeKeys = []
+        seen = set()
+
+        for lineNum, probeID in lines:
+
+            probeKey = lookups.verifyProbeObject(probeID, lineNum, self.errorFile)
+
+            if probeKey == 0:
+                instrument.count('rows rejected')
+                continue
+
+            instrument.count('rows accepted')
+
+            if probeKey not in seen:
+                seen.add(probeKey)
+                probeKeys.append(probeKey)
+
+        deleted = 0
+
+        for chunk in sqlutil.chunks(probeKeys, max(1, self.chunkSize)):
+
+            cmd = deleteBulkSQL % (sqlutil.keyList(chunk))
+
+            if self.DEBUG:
+                self.diagFile.write('%s\n' % (cmd))
+                continue
+
+            instrument.call('delete', db.sql, cmd, None)
+            db.commit()
+
+            deleted = deleted + len(chunk)
+            self.diagFile.write('%s: deleted %d of %d probe(s)\n' % (mgi_utils.date(), deleted, len(probeKeys)))
+            self.diagFile.flush()
 
 #
 # Main
 #
 
-init()
-verifyMode()
-processFile()
-exit(0)
-
+ProbeDelete().run()
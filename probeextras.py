@@ -30,7 +30,7 @@
 #		field 5:  Alias                 allows null
 #		field 6:  Created By		required
 #
-#	PRB_Reference data is always loaded
+#	The probe/reference (PRB_Reference) must already exist
 # 	If Marker given, then PRB_Marker (J:, Relationship) data is also loaded
 # 	If Alias given, then PRB_Alias (Alias) is also loaded
 #	
@@ -42,8 +42,15 @@
 #       PRB_Reference.bcp         	Probe Reference records
 #       PRB_Alias.bcp         		Probe Alias records
 #
+#	In load mode the probe/marker records are copied into the
+#	database over the loader's connection; the delete of the existing
+#	relationships and the copy are committed together
+#	(see probeloadlib/replace.py).  PRB_Marker.bcp is written in
+#	preview mode only.
+#
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
 #
 # Exit Codes:
 #
@@ -68,323 +75,263 @@ import accessionlib
 import db
 import mgi_utils
 import loadlib
+from probeloadlib import keys
+from probeloadlib import loader
+from probeloadlib import lookups
+from probeloadlib import reader
+from probeloadlib import replace
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-currentDir = os.environ['PROBELOADDIR']
-mode = os.environ['PROBELOADMODE']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
+markerTable = 'PRB_Marker'
+refTable = 'PRB_Reference'
+aliasTable = 'PRB_Alias'
 
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
+loaddate = loadlib.loaddate
 
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
+# the probe/reference of a line, by the resolved probe and reference keys
+probeReferenceSQL = '''select _Reference_key from PRB_Reference
+		where _Probe_key = %d
+		and _Refs_key = %d
+		'''
 
-bcpon = 1		# can the bcp files be bcp-ed into the database?  default is yes.
+class ProbeExtras(loader.Loader):
 
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
-markerFile = ''		# file descriptor
-refFile = ''            # file descriptor
-aliasFile = ''          # file descriptor
+    program = 'probeextras'
+    columns = 6
 
-markerTable = 'PRB_Marker'
-refTable = 'PRB_Reference'
-aliasTable = 'PRB_Alias'
+    tables = [markerTable, refTable, aliasTable]
 
-markerFileName = markerTable + '.bcp'
-refFileName = refTable + '.bcp'
-aliasFileName = aliasTable + '.bcp'
+    timedFunctions = [
+        (loadlib, ['verifyProbe', 'verifyReference', 'verifyUser', 'verifyMarker']),
+        (lookups, ['verifyProbe', 'verifyReference', 'verifyUser', 'verifyMarker']),
+        ]
 
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
+    copyError = 'Could not replace the probe/marker relationships: %s\n'
 
-refKey = 0		# PRB_Reference._Reference_key
-aliasKey = 0		# PRB_Alias._Alias_key
+    pipelined = 1
 
-loaddate = loadlib.loaddate
+    def __init__(self):
 
-# delete the probe/marker relationships so we can add new ones
-deleteSQL = 'delete from PRB_Marker where _Probe_key = %s and _Marker_key = %s'
-execSQL = []
-
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global markerFile, refFile, aliasFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        markerFile = open(markerFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % markerFileName)
-
-    try:
-        refFile = open(refFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % refFileName)
-
-    try:
-        aliasFile = open(aliasFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % aliasFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode == 'preview':
-        DEBUG = 1
-        bcpon = 0
-    elif mode != 'load':
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  sets global primary key variables
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  sets global primary key variables
-# Throws:   nothing
-
-def setPrimaryKeys():
-
-    global refKey, aliasKey
-
-    results = db.sql('select maxKey = max(_Reference_key) + 1 from PRB_Reference', 'auto')
-    refKey = results[0]['maxKey']
-
-    results = db.sql('select maxKey = max(_Alias_key) + 1 from PRB_Alias', 'auto')
-    aliasKey = results[0]['maxKey']
+        loader.Loader.__init__(self)
 
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
+        self.aliasKey = 0	# PRB_Alias._Alias_key
 
-def bcpFiles():
+        # the probe/marker relationships replaced by this load
+        # (see probeloadlib/replace.py)
+        self.markerPairs = []
+        self.markerPairSet = set()
 
-    if DEBUG or not bcpon:
-	#print execSQL
-        return
+    # Purpose: is 'table' copied in over the loader's connection?
+    # Returns: 1 if the table is copied, 0 if it is bcp-ed
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
 
-    markerFile.close()
-    refFile.close()
-    aliasFile.close()
+    def isCopied(self, table):
 
-    db.commit()
+        # only PRB_Marker is replaced; the references and aliases are bcp-ed
+        return table == markerTable and self.mode == 'load'
 
-    bcp1 = bcpCommand % (markerTable, markerFileName)
-    bcp2 = bcpCommand % (refTable, refFileName)
-    bcp3 = bcpCommand % (aliasTable, aliasFileName)
+    # Purpose:  sets the primary key variables
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  counts the aliases in the input file and reserves a
+    #	    block of alias keys (see probeloadlib/keys.py); the aliases
+    #	    go on the line's existing probe/reference, so no reference
+    #	    keys are needed
+    #	    exits if a line is invalid
+    # Throws:   nothing
 
-    # execute the sql deletions
-    for r in execSQL:
-        db.sql(r, None)
+    def setPrimaryKeys(self):
 
-    for bcpCmd in [bcp1, bcp2, bcp3]:
-	diagFile.write('%s\n' % bcpCmd)
-	os.system(bcpCmd)
+        aliasCount = 0
 
-    db.commit()
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+            aliasCount = aliasCount + len(string.split(tokens[4], '|'))
 
-    return
+        self.inputFile.seek(0)
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+        self.aliasKey = keys.reserveKeys(aliasTable, aliasCount, self.DEBUG)
 
-def processFile():
+    # Purpose:  submits the probe, reference, creator and marker lookups
+    #	    of one input line (see probeloadlib/pipeline.py)
+    # Returns:  dictionary of pipeline.Pending (None if cached)
+    # Assumes:  nothing
+    # Effects:  queues the queries
+    # Throws:   nothing
 
-    global refKey, aliasKey, execSQL
+    def prefetchRow(self, lineNum, tokens):
 
-    lineNum = 0
-    # For each line in the input file
+        lookupPipeline = self.lookupPipeline
 
-    for line in inputFile.readlines():
+        markers = {}
+        for markerID in string.split(tokens[1], '|'):
+            if markerID == 'none':
+                break
+            if markerID not in markers:
+                markers[markerID] = lookups.prefetchMarker(markerID, lookupPipeline)
 
-        error = 0
-        lineNum = lineNum + 1
-
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
-
-        try:
-	    probeID = tokens[0]
-	    markerIDs = string.split(tokens[1], '|')
-	    jnum = tokens[2]
-	    relationship = tokens[3]
-	    aliasList = string.split(tokens[4], '|')
-	    createdBy = tokens[5]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
-
-        probeKey = loadlib.verifyProbe(probeID, lineNum, errorFile)
-        refsKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
-
-	if probeKey == 0:
-	    errorFile.write('Invalid Probe:  %s\n' % (probeID))
-	    error = 1
-
-	if refsKey == 0:
-	    errorFile.write('Invalid Reference:  %s\n' % (jnum))
-	    error = 1
-
-	if createdByKey == 0:
-	    errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
-	    error = 1
-
-	results = db.sql('''select _Reference_key from PRB_Reference
-		where _Probe_key = %s
-		and _Refs_key = %s
-		''' % (probeKey, refsKey), 'auto')
-        referenceKey = results[0]['_Reference_key']
-	if referenceKey == 0:
-	    errorFile.write('Invalid Probe/Reference:  %s\n' % (jnum))
-	    error = 1
-
-	# marker IDs
-
-	markerList = []
-	for markerID in markerIDs:
-
-	    if markerID == 'none':
-		break
-
-	    markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
-
-	    if markerKey == 0:
-	        errorFile.write('Invalid Marker:  %s\n' % (markerID))
-	        error = 1
-            else:
-		markerList.append(markerKey)
+        return {
+            'probe' : lookups.prefetchProbe(tokens[0], lookupPipeline),
+            'reference' : lookups.prefetchReference(tokens[2], lookupPipeline),
+            'user' : lookups.prefetchUser(tokens[5], lookupPipeline),
+            'markers' : markers,
+            }
 
-        # if errors, continue to next record
-        if error:
-            continue
+    # Purpose:  submits the probe/reference lookup of one input line,
+    #	    by the keys of its prefetched probe and reference
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  queues the query; a line whose probe or reference the
+    #	    prefetched lookups do not resolve is looked up in validateRow()
+    # Throws:   nothing
+
+    def prefetchDependent(self, lineNum, tokens, prefetched):
+
+        probeKey = lookups.resolvedProbe(tokens[0], prefetched['probe'])
+        refsKey = lookups.resolvedReference(tokens[2], prefetched['reference'])
+
+        if probeKey > 0 and refsKey > 0:
+            prefetched['probeReference'] = self.lookupPipeline.query(probeReferenceSQL % (probeKey, refsKey))
 
-        # if no errors, process
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
 
-	for markerKey in markerList:
-	    if markerList.count(markerKey) == 1:
-                markerFile.write('%s\t%s\t%d\t%s\t%s\t%s\t%s\t%s\n' \
-		    % (probeKey, markerKey, refsKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
-		execSQL.append(deleteSQL % (probeKey, markerKey))
+    def validateRow(self, lineNum, tokens):
+
+        errorFile = self.errorFile
+
+        error = 0
+        probeID = tokens[0]
+        markerIDs = string.split(tokens[1], '|')
+        jnum = tokens[2]
+        createdBy = tokens[5]
+        prefetched = self.prefetched.pop(lineNum)
+
+        probeKey = lookups.verifyProbe(probeID, lineNum, errorFile, prefetched['probe'])
+        refsKey = lookups.verifyReference(jnum, lineNum, errorFile, prefetched['reference'])
+        createdByKey = lookups.verifyUser(createdBy, lineNum, errorFile, prefetched['user'])
+
+        if probeKey == 0:
+            errorFile.write('Invalid Probe:  %s\n' % (probeID))
+            error = 1
+
+        if refsKey == 0:
+            errorFile.write('Invalid Reference:  %s\n' % (jnum))
+            error = 1
+
+        if createdByKey == 0:
+            errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
+            error = 1
+
+        # the probe/reference, by the resolved keys
+
+        referenceKey = 0
+        if probeKey > 0 and refsKey > 0:
+            pending = prefetched.get('probeReference')
+            if pending is None:
+                pending = self.lookupPipeline.query(probeReferenceSQL % (probeKey, refsKey))
+            results = pending.result()
+            if len(results) > 0:
+                referenceKey = results[0]['_Reference_key']
+        if referenceKey == 0:
+            errorFile.write('Invalid Probe/Reference:  %s\n' % (jnum))
+            error = 1
+
+        # marker IDs
+
+        markers = []
+        for markerID in markerIDs:
+
+            if markerID == 'none':
+                break
+
+            markerKey = lookups.verifyMarker(markerID, lineNum, errorFile, prefetched['markers'].get(markerID))
+
+            if markerKey == 0:
+                errorFile.write('Invalid Marker:  %s\n' % (markerID))
+                error = 1
             else:
-		errorFile.write('Invalid Marker Duplicate:  %s\n' % (markerID))
+                markers.append((markerID, markerKey))
 
-	if referenceKey > 0:
-	    refKey = referenceKey
-	else:
-            refFile.write('%s\t%s\t%s\t0\t0\t%s\t%s\t%s\t%s\n' \
-		    % (refKey, probeKey, refsKey, createdByKey, createdByKey, loaddate, loaddate))
+        markerList = self.uniqueMarkers(probeID, markers)
 
-        # aliases
+        if error:
+            return None
+
+        return {
+            'tokens' : tokens,
+            'probeKey' : probeKey,
+            'refsKey' : refsKey,
+            'referenceKey' : referenceKey,
+            'createdByKey' : createdByKey,
+            'markerList' : markerList,
+            }
+
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the relationships and aliases to the table outputs;
+    #	    advances the alias key
+    # Throws:   nothing
+
+    def writeRow(self, row):
+
+        markerFile = self.outputs[markerTable]
+        aliasFile = self.outputs[aliasTable]
+
+        tokens = row['tokens']
+        relationship = tokens[3]
+        aliasList = string.split(tokens[4], '|')
+        probeKey = row['probeKey']
+        refsKey = row['refsKey']
+        referenceKey = row['referenceKey']
+        createdByKey = row['createdByKey']
+        markerList = row['markerList']
+
+        for markerKey in markerList:
+            markerFile.write('%s\t%s\t%d\t%s\t%s\t%s\t%s\t%s\n' \
+                % (probeKey, markerKey, refsKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
+            if (probeKey, markerKey) not in self.markerPairSet:
+                self.markerPairSet.add((probeKey, markerKey))
+                self.markerPairs.append((probeKey, markerKey))
+
+        # aliases, on the existing probe/reference; validateRow() rejects
+        # a line without one
 
         for alias in aliasList:
             aliasFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\n' \
-		    % (aliasKey, refKey, alias, createdByKey, createdByKey, loaddate, loaddate))
-	    aliasKey = aliasKey + 1
+                % (self.aliasKey, referenceKey, alias, createdByKey, createdByKey, loaddate, loaddate))
+            self.aliasKey = self.aliasKey + 1
+
+    # Purpose:  replaces the probe/marker relationships in the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  deletes the existing probe/marker relationships and copies
+    #	    the new ones into the database, in one transaction
+    # Throws:   the database driver's error if the replace fails
+
+    def copyOutputs(self, sinks):
 
-	# only used if referenceKey == 0
-	refKey = refKey + 1
+        replace.replaceProbeMarkers(self.markerPairs, self.outputs[markerTable].output, self.diagFile)
 
-    #	end of "for line in inputFile.readlines():"
+    # Purpose:  BCPs the data into the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  see loader.Loader.bcpFiles() and copyOutputs()
+    # Throws:   nothing
+
+    def bcpFiles(self):
+
+        self.diagFile.write('%d probe/marker relationship(s) to replace\n' % (len(self.markerPairs)))
+        loader.Loader.bcpFiles(self)
 
 #
 # Main
 #
 
-init()
-verifyMode()
-setPrimaryKeys()
-processFile()
-bcpFiles()
-exit(0)
-
+ProbeExtras().run()
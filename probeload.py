@@ -20,10 +20,44 @@
 # Requirements Satisfied by This Program:
 #
 # Usage:
-#	probeload.py
+#	probeload.py [--workers N] [--resume | --restart]
+#
+#	--workers N	validate the input lines in N processes once the
+#			lookups are resolved (see probeloadlib/parallel.py);
+#			the keys are assigned in input order, as in a serial run
+#	--resume	load-copy only: carry on from the last checkpoint of
+#			a load that died (see probeloadlib/checkpoint.py)
+#	--restart	load-copy only: discard the checkpoint of a load that
+#			died and load the whole file again; without --resume
+#			or --restart the load refuses to start while the
+#			checkpoint exists
 #
 # Envvars:
 #
+#	PROBELOADWORKERS	default for --workers (default 1)
+#	PROBELOADCHECKPOINT	load-copy only: commit every N input lines and
+#				record a checkpoint (default 0, one commit at the end)
+#	PROBELOADBCPWORKERS	number of bcp commands to run at a time (default 4)
+#	PROBELOADSQLLOG		SQL logged to the diagnostics file: all (default),
+#				sample:N (every Nth statement), summary or off
+#	PROBELOADBACKEND	db (default); fixtures:<dump> to run against an
+#				in-memory copy of the lookup tables; record:<file> or
+#				replay:<file> to record the db calls of a load or
+#				replay them with no server (see probeloadlib/backend.py)
+#	PROBELOADREPLAYSCALE	replay:<file> only: scale of the recorded latency
+#				(default 1; 0 for none)
+#	PROBELOAD_PROFILE	off (default), on, or a list of phases to run under
+#				cProfile; writes <input>.prof and <input>.alloc.txt
+#				(see probeloadlib/profiling.py)
+#	PROBELOADPROGRESS	seconds between progress records (line, rows accepted
+#				and rejected, rows/sec, ETA) in the log (default 0, none)
+#	PROBELOADSTATUSFILE	file kept up to date with the progress of the load,
+#				as JSON, for monitoring (default none; see
+#				probeloadlib/progress.py)
+#	PROBELOADSLOWROWS	number of slowest input rows listed, with the time
+#				of each lookup, at the end of the diagnostics file
+#				(default 0, none)
+#
 # Inputs:
 #
 #	A tab-delimited file in the format:
@@ -67,12 +101,22 @@
 #
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
+#
+# Modes:
+#
+#	preview			preview the load
+#	load			write the bcp files and bcp them into the database
+#	load-copy		copy the rows into the database over the loader's
+#				own connection, in one transaction (one per
+#				PROBELOADCHECKPOINT lines if set); no bcp files
 #
 # Exit Codes:
 #
 # Assumes:
 #
-#	That no one else is adding such records to the database.
+#	Nothing; the primary keys and MGI IDs used by the load are reserved
+#	before the first line is processed (see probeloadlib/keys.py).
 #
 # Bugs:
 #
@@ -98,38 +142,14 @@ import db
 import mgi_utils
 import loadlib
 import sourceloadlib
+from probeloadlib import keys
+from probeloadlib import loader
+from probeloadlib import lookups
+from probeloadlib import reader
+from probeloadlib import sqlutil
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-currentDir = os.environ['PROBELOADDIR']
-mode = os.environ['PROBELOADMODE']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
-
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
-
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
-
-bcpon = 1		# can the bcp files be bcp-ed into the database?  default is yes.
-
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
-probeFile = ''          # file descriptor
-markerFile = ''		# file descriptor
-refFile = ''            # file descriptor
-aliasFile = ''          # file descriptor
-accFile = ''            # file descriptor
-accRefFile = ''         # file descriptor
-noteFile = ''		# file descriptor
-
 probeTable = 'PRB_Probe'
 markerTable = 'PRB_Marker'
 refTable = 'PRB_Reference'
@@ -137,27 +157,8 @@ aliasTable = 'PRB_Alias'
 accTable = 'ACC_Accession'
 accRefTable = 'ACC_AccessionReference'
 noteTable = 'PRB_Notes'
-newProbeFile = 'newProbe.txt'
-rawNoteFile = 'rawNote.txt'
-
-probeFileName = probeTable + '.bcp'
-markerFileName = markerTable + '.bcp'
-refFileName = refTable + '.bcp'
-aliasFileName = aliasTable + '.bcp'
-accFileName = accTable + '.bcp'
-accRefFileName = accRefTable + '.bcp'
-noteFileName = noteTable + '.bcp'
-newProbeFileName = newProbeFile
-rawNoteFileName = rawNoteFile
-
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
-
-probeKey = 0            # PRB_Probe._Probe_key
-refKey = 0		# PRB_Reference._Reference_key
-aliasKey = 0		# PRB_Reference._Reference_key
-accKey = 0              # ACC_Accession._Accession_key
-mgiKey = 0              # ACC_AccessionMax.maxNumericPart
+newProbeFileName = 'newProbe.txt'
+rawNoteFileName = 'rawNote.txt'
 
 NA = -2			# for Not Applicable fields
 mgiTypeKey = 3		# Molecular Segment
@@ -165,470 +166,428 @@ mgiPrefix = "MGI:"
 
 loaddate = loadlib.loaddate
 
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global probeFile, markerFile, refFile, aliasFile, accFile, accRefFile, noteFile
-    global newProbeFile, rawNoteFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        probeFile = open(probeFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % probeFileName)
-
-    try:
-        markerFile = open(markerFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % markerFileName)
-
-    try:
-        refFile = open(refFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % refFileName)
-
-    try:
-        aliasFile = open(aliasFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % aliasFileName)
-
-    try:
-        accFile = open(accFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % accFileName)
-
-    try:
-        accRefFile = open(accRefFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % accRefFileName)
-
-    try:
-        noteFile = open(noteFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % noteFileName)
-
-    try:
-        newProbeFile = open(newProbeFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % newProbeFileName)
-
-    try:
-        rawNoteFile = open(rawNoteFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % rawNoteFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode == 'preview':
-        DEBUG = 1
-        bcpon = 0
-    elif mode != 'load':
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  verify Parent Probe Accession ID
-# Returns:  Probe Key if Parent Probe is valid, else 0
-#           Source Key if Parent Probe is valid, else 0
-# Assumes:  nothing
-# Effects:  verifies that the Parent Probe exists either in the Parent Probe dictionary or the database
-#       writes to the error file if the Parent Probe is invalid
-#       adds the Parent Probe id and key to the Parent Probe dictionary if the Parent Probe is valid
-# Throws:  nothing
-
-def verifyParentProbe(
-    probeID,    # Accession ID of the Probe (string)
-    lineNum,    # line number (integer)
-    errorFile   # error file (file descriptor)
-    ):
-
-    probeKey = 0
-    sourceKey = 0
-
-    results = db.sql('''
-        	select a._Object_key, p._Source_key 
-		from ACC_Accession a, PRB_Probe p 
-		where a.accID = '%s'
-		and a._MGIType_key = 3
-		and a._Object_key = p._Probe_key
-		''' % (probeID), 'auto')
-
-    for r in results:
-        if r['_Source_key'] is None:
-            if errorFile != None:
-                errorFile.write('Invalid Derivied Probe (%d) %s\n' % (lineNum, probeID))
-            probeKey = 0
-        else:
-            probeKey = r['_Object_key']
-            sourceKey = r['_Source_key']
-
-    return probeKey, sourceKey
-
-# Purpose:  sets global primary key variables
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  sets global primary key variables
-# Throws:   nothing
-
-def setPrimaryKeys():
+class ProbeLoad(loader.Loader):
 
-    global probeKey, refKey, aliasKey, accKey, mgiKey
+    program = 'probeload'
+    columns = 22
 
-    results = db.sql('select max(_Probe_key) + 1 as maxKey from PRB_Probe', 'auto')
-    probeKey = results[0]['maxKey']
+    loadModes = ('load', 'load-copy')
+    copyModes = ('load-copy',)
 
-    results = db.sql('select max(_Reference_key) + 1 as maxKey from PRB_Reference', 'auto')
-    refKey = results[0]['maxKey']
+    tables = [probeTable, markerTable, refTable, aliasTable, accTable, accRefTable, noteTable]
+    extraFiles = [newProbeFileName, rawNoteFileName]
 
-    results = db.sql('select max(_Alias_key) + 1 as maxKey from PRB_Alias', 'auto')
-    aliasKey = results[0]['maxKey']
+    timedFunctions = [
+        (loadlib, ['verifyMarker', 'verifyReference', 'verifyUser', 'verifyLogicalDB']),
+        (sourceloadlib, ['verifyOrganism', 'verifyStrain', 'verifyTissue', 'verifyGender',
+            'verifyCellLine', 'verifyVectorType', 'verifySegmentType', 'verifySource', 'verifyLibrary']),
+        (lookups, ['verifyMarker', 'verifyReference', 'verifyUser', 'verifyLogicalDB',
+            'verifyOrganism', 'verifyStrain', 'verifyTissue', 'verifyGender', 'verifyCellLine',
+            'verifyVectorType', 'verifySegmentType', 'verifySource', 'verifyLibrary']),
+        ]
+    timedMethods = ['verifyParentProbe']
 
-    results = db.sql('select max(_Accession_key) + 1 as maxKey from ACC_Accession', 'auto')
-    accKey = results[0]['maxKey']
+    phases = ['init', 'verifyMode', 'resolveLookups', 'setPrimaryKeys', 'processFile', 'bcpFiles']
 
-    results = db.sql('''select maxNumericPart + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' % (mgiPrefix), 'auto')
-    mgiKey = results[0]['maxKey']
+    parallelSafe = 1
 
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
+    resumable = 1
+    keyAttributes = ['probeKey', 'refKey', 'aliasKey', 'accKey', 'mgiKey']
 
-def bcpFiles():
+    def __init__(self):
 
-    if DEBUG or not bcpon:
-        return
+        loader.Loader.__init__(self)
 
-    probeFile.close()
-    markerFile.close()
-    refFile.close()
-    aliasFile.close()
-    accFile.close()
-    accRefFile.close()
-    noteFile.close()
-    newProbeFile.close()
-    rawNoteFile.close()
+        self.probeKey = 0	# PRB_Probe._Probe_key
+        self.refKey = 0		# PRB_Reference._Reference_key
+        self.aliasKey = 0	# PRB_Alias._Alias_key
+        self.accKey = 0		# ACC_Accession._Accession_key
+        self.mgiKey = 0		# ACC_AccessionMax.maxNumericPart
 
-    db.commit()
+        self.lineCount = 0	# number of input lines
+        self.aliasCount = 0	# number of aliases in the input
+        self.seqIDCount = 0	# number of sequence IDs in the input
 
-    bcp1 = bcpCommand % (probeTable, probeFileName)
-    bcp2 = bcpCommand % (markerTable, markerFileName)
-    bcp3 = bcpCommand % (refTable, refFileName)
-    bcp4 = bcpCommand % (aliasTable, aliasFileName)
-    bcp5 = bcpCommand % (accTable, accFileName)
-    bcp6 = bcpCommand % (accRefTable, accRefFileName)
-    bcp7 = bcpCommand % (noteTable, noteFileName)
+        self.parentProbeDict = {}	# Parent Probe ID : list of (_Object_key, _Source_key) rows
 
-    for bcpCmd in [bcp1, bcp2, bcp3, bcp4, bcp5, bcp6, bcp7]:
-	diagFile.write('%s\n' % bcpCmd)
-	os.system(bcpCmd)
+    # Purpose:  resolve the Parent Probe Accession IDs of the input file
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  adds each Parent Probe id and its (_Object_key, _Source_key)
+    #	    rows to the Parent Probe dictionary, with one query per
+    #	    sqlutil.chunkSize ids; an id with no rows maps to []
+    # Throws:  nothing
 
-    db.commit()
+    def resolveParentProbes(self,
+        probeIDs	# Accession IDs of the Probes (set of strings)
+        ):
 
-    return
+        probeIDs = [p for p in probeIDs if len(p) > 0 and p not in self.parentProbeDict]
+        probeIDs.sort()
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+        for chunk in sqlutil.chunks(probeIDs):
 
-def processFile():
+            for probeID in chunk:
+                self.parentProbeDict[probeID] = []
 
-    global probeKey, refKey, aliasKey, accKey, mgiKey
-
-    lineNum = 0
-    # For each line in the input file
-
-    for line in inputFile.readlines():
+            results = db.sql('''
+        	select a.accID, a._Object_key, p._Source_key 
+		from ACC_Accession a, PRB_Probe p 
+		where a.accID in (%s)
+		and a._MGIType_key = 3
+		and a._Object_key = p._Probe_key
+		''' % (sqlutil.sqlList(chunk)), 'auto')
+
+            for r in results:
+                self.parentProbeDict[r['accID']].append(r)
+
+    # Purpose:  verify Parent Probe Accession ID
+    # Returns:  Probe Key if Parent Probe is valid, else 0
+    #           Source Key if Parent Probe is valid, else 0
+    # Assumes:  nothing
+    # Effects:  verifies that the Parent Probe exists either in the Parent Probe dictionary or the database
+    #       writes to the error file if the Parent Probe is invalid
+    #       adds the Parent Probe id and key to the Parent Probe dictionary if the Parent Probe is valid
+    # Throws:  lookups.CacheMiss if lookups.cacheOnly is set and the Parent Probe is not in the dictionary
+
+    def verifyParentProbe(self,
+        probeID,    # Accession ID of the Probe (string)
+        lineNum,    # line number (integer)
+        errorFile   # error file (file descriptor)
+        ):
+
+        probeKey = 0
+        sourceKey = 0
+
+        if probeID not in self.parentProbeDict:
+            if lookups.cacheOnly:
+                raise lookups.CacheMiss(probeID)
+            self.resolveParentProbes([probeID])
+
+        for r in self.parentProbeDict.get(probeID, []):
+            if r['_Source_key'] is None:
+                if errorFile != None:
+                    errorFile.write('Invalid Derivied Probe (%d) %s\n' % (lineNum, probeID))
+                probeKey = 0
+            else:
+                probeKey = r['_Object_key']
+                sourceKey = r['_Source_key']
+
+        return probeKey, sourceKey
+
+    # Purpose:  pre-resolves the lookups made by validateRow()
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  collects the distinct lookup values from the input file
+    #	    and resolves each set with one query (see probeloadlib/lookups.py)
+    #	    counts the lines, aliases and sequence IDs for setPrimaryKeys()
+    #	    rewinds the input file
+    #	    exits if a line is invalid
+    # Throws:   nothing
+
+    def resolveLookups(self):
+
+        parentIDs = set()
+        markerIDs = set()
+        jnums = set()
+        users = set()
+        logicalDBs = set()
+        organisms = set()
+        strains = set()
+        tissues = set()
+        genders = set()
+        cellLines = set()
+        vectorTypes = set()
+        segmentTypes = set()
+
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+
+            jnums.add(tokens[1])
+            parentIDs.add(tokens[2])
+            organisms.add(tokens[4])
+            strains.add(tokens[5])
+            tissues.add(tokens[6])
+            genders.add(tokens[7])
+            cellLines.add(tokens[8])
+            vectorTypes.add(tokens[10])
+            segmentTypes.add(tokens[11])
+            markerIDs.update(string.split(tokens[15], '|'))
+            users.add(tokens[21])
+
+            for seqID in string.split(tokens[17], '|'):
+                logicalDBs.add(string.split(seqID, ':')[0])
+                if len(seqID) > 0:
+                    self.seqIDCount = self.seqIDCount + 1
+
+            for alias in string.split(tokens[18], '|'):
+                if len(alias) > 0:
+                    self.aliasCount = self.aliasCount + 1
+
+            self.lineCount = self.lineCount + 1
+
+        self.inputFile.seek(0)
+
+        self.resolveParentProbes(parentIDs)
+        lookups.resolveMarkers(markerIDs)
+        lookups.resolveReferences(jnums)
+        lookups.resolveUsers(users)
+        lookups.resolveLogicalDBs(logicalDBs)
+        lookups.resolveOrganisms(organisms)
+        lookups.resolveStrains(strains)
+        lookups.resolveTissues(tissues)
+        lookups.resolveGenders(genders)
+        lookups.resolveCellLines(cellLines)
+        lookups.resolveVectorTypes(vectorTypes)
+        lookups.resolveSegmentTypes(segmentTypes)
+
+    # Purpose:  sets the primary key variables
+    # Returns:  nothing
+    # Assumes:  resolveLookups() has counted the input
+    # Effects:  reserves a block of keys for each table (see probeloadlib/keys.py)
+    #	    a resumed load carries on with the keys of its checkpoint
+    # Throws:   nothing
+
+    def setPrimaryKeys(self):
+
+        if self.restoreKeys():
+            return
+
+        self.probeKey = keys.reserveKeys(probeTable, self.lineCount, self.DEBUG)
+        self.refKey = keys.reserveKeys(refTable, self.lineCount, self.DEBUG)
+        self.aliasKey = keys.reserveKeys(aliasTable, self.aliasCount, self.DEBUG)
+        self.accKey = keys.reserveKeys(accTable, self.lineCount + self.seqIDCount, self.DEBUG)
+        self.mgiKey = keys.reserveAccessionNumbers(mgiPrefix, self.lineCount, self.DEBUG)
+
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
+
+    def validateRow(self, lineNum, tokens):
+
+        errorFile = self.errorFile
 
         error = 0
-        lineNum = lineNum + 1
-
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
-
-        try:
-	    name = tokens[0]
-	    jnum = tokens[1]
-	    parentID = tokens[2]
-	    sourceName = tokens[3]
-	    organism = tokens[4]
-	    strain = tokens[5]
-	    tissue = tokens[6]
-	    gender = tokens[7]
-	    cellLine = tokens[8]
-	    age = tokens[9]
-	    vectorType = tokens[10]
-	    segmentType = tokens[11]
-	    regionCovered = tokens[12]
-	    insertSite = tokens[13]
-	    insertSize = tokens[14]
-	    markerIDs = string.split(tokens[15], '|')
-	    relationship = tokens[16]
-	    sequenceIDs = tokens[17]
-	    aliasList = string.split(tokens[18], '|')
-	    notes = tokens[19]
-	    rawnotes = tokens[20]
-	    createdBy = tokens[21]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
-
-	isParent = 0
-	isSource = 0
-	parentProbeKey = '';
-	sourceKey = 0
-
-	if parentID != '':
-	    isParent = 1
-
-	if sourceName != '':
-	    isSource = 1
-
-	if not isParent and not isSource:
-	    organismKey = sourceloadlib.verifyOrganism(organism, lineNum, errorFile)
-	    strainKey = sourceloadlib.verifyStrain(strain, lineNum, errorFile)
-	    tissueKey = sourceloadlib.verifyTissue(tissue, lineNum, errorFile)
-	    genderKey = sourceloadlib.verifyGender(gender, lineNum, errorFile)
-	    cellLineKey = sourceloadlib.verifyCellLine(cellLine, lineNum, errorFile)
-	    vectorKey = sourceloadlib.verifyVectorType(vectorType, lineNum, errorFile)
-	    segmentTypeKey = sourceloadlib.verifySegmentType(segmentType, lineNum, errorFile)
-	    sourceKey = sourceloadlib.verifySource(segmentTypeKey, \
-		vectorKey, organismKey, strainKey, \
-		tissueKey, genderKey, cellLineKey, age, lineNum, errorFile)
-
-	    if organismKey == 0 or strainKey == 0 or tissueKey == 0 or \
+        name = tokens[0]
+        jnum = tokens[1]
+        parentID = tokens[2]
+        sourceName = tokens[3]
+        organism = tokens[4]
+        strain = tokens[5]
+        tissue = tokens[6]
+        gender = tokens[7]
+        cellLine = tokens[8]
+        age = tokens[9]
+        vectorType = tokens[10]
+        segmentType = tokens[11]
+        markerIDs = string.split(tokens[15], '|')
+        sequenceIDs = tokens[17]
+        createdBy = tokens[21]
+
+        isParent = 0
+        isSource = 0
+        parentProbeKey = '';
+        sourceKey = 0
+
+        if parentID != '':
+            isParent = 1
+
+        if sourceName != '':
+            isSource = 1
+
+        if not isParent and not isSource:
+            organismKey = lookups.verifyOrganism(organism, lineNum, errorFile)
+            strainKey = lookups.verifyStrain(strain, lineNum, errorFile)
+            tissueKey = lookups.verifyTissue(tissue, lineNum, errorFile)
+            genderKey = lookups.verifyGender(gender, lineNum, errorFile)
+            cellLineKey = lookups.verifyCellLine(cellLine, lineNum, errorFile)
+            vectorKey = lookups.verifyVectorType(vectorType, lineNum, errorFile)
+            segmentTypeKey = lookups.verifySegmentType(segmentType, lineNum, errorFile)
+            sourceKey = lookups.verifySource(segmentTypeKey, \
+                vectorKey, organismKey, strainKey, \
+                tissueKey, genderKey, cellLineKey, age, lineNum, errorFile)
+
+            if organismKey == 0 or strainKey == 0 or tissueKey == 0 or \
                genderKey == 0 or cellLineKey == 0 or vectorKey == 0 or \
                segmentTypeKey == 0 or sourceKey == 0:
-		errorFile.write('%s, %s, %s, %s, %s, %s, %s, %s\n' % (segmentType, vectorType, organism, strain, tissue, gender, cellLine, age))
-	        error = 1
+                errorFile.write('%s, %s, %s, %s, %s, %s, %s, %s\n' % (segmentType, vectorType, organism, strain, tissue, gender, cellLine, age))
+                error = 1
 
         elif not isParent and isSource:
-	    vectorKey = sourceloadlib.verifyVectorType(vectorType, lineNum, errorFile)
-	    segmentTypeKey = sourceloadlib.verifySegmentType(segmentType, lineNum, errorFile)
-	    sourceKey = sourceloadlib.verifyLibrary(sourceName, lineNum, errorFile)
+            vectorKey = lookups.verifyVectorType(vectorType, lineNum, errorFile)
+            segmentTypeKey = lookups.verifySegmentType(segmentType, lineNum, errorFile)
+            sourceKey = lookups.verifyLibrary(sourceName, lineNum, errorFile)
 
-	    if vectorKey == 0 or segmentTypeKey == 0 or sourceKey == 0:
-	        error = 1
+            if vectorKey == 0 or segmentTypeKey == 0 or sourceKey == 0:
+                error = 1
 
-	# parent from = yes, source given = yes or no (ignored)
-	else:
-	    parentProbeKey, sourceKey = verifyParentProbe(parentID, lineNum, errorFile)
-	    vectorKey = sourceloadlib.verifyVectorType(vectorType, lineNum, errorFile)
-	    segmentTypeKey = sourceloadlib.verifySegmentType(segmentType, lineNum, errorFile)
+        # parent from = yes, source given = yes or no (ignored)
+        else:
+            parentProbeKey, sourceKey = self.verifyParentProbe(parentID, lineNum, errorFile)
+            vectorKey = lookups.verifyVectorType(vectorType, lineNum, errorFile)
+            segmentTypeKey = lookups.verifySegmentType(segmentType, lineNum, errorFile)
 
-	    if parentProbeKey == 0 or sourceKey == 0 or vectorKey == 0 or segmentTypeKey == 0:
-	        error = 1
+            if parentProbeKey == 0 or sourceKey == 0 or vectorKey == 0 or segmentTypeKey == 0:
+                error = 1
 
-        referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+        referenceKey = lookups.verifyReference(jnum, lineNum, errorFile)
+        createdByKey = lookups.verifyUser(createdBy, lineNum, errorFile)
 
-	if referenceKey == 0:
-	    errorFile.write('Invalid Reference:  %s\n' % (jnum))
-	    error = 1
+        if referenceKey == 0:
+            errorFile.write('Invalid Reference:  %s\n' % (jnum))
+            error = 1
 
-	if createdByKey == 0:
-	    errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
-	    error = 1
+        if createdByKey == 0:
+            errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
+            error = 1
 
-	# marker IDs
+        # marker IDs
 
-	markerList = []
-	for markerID in markerIDs:
+        markers = []
+        for markerID in markerIDs:
 
-	    markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
+            markerKey = lookups.verifyMarker(markerID, lineNum, errorFile)
 
-	    if len(markerID) > 0 and markerKey == 0:
-	        errorFile.write('Invalid Marker:  %s, %s\n' % (name, markerID))
-	        error = 1
+            if len(markerID) > 0 and markerKey == 0:
+                errorFile.write('Invalid Marker:  %s, %s\n' % (name, markerID))
+                error = 1
             elif len(markerID) > 0:
-		markerList.append(markerKey)
-
-	# sequence IDs
-	seqAccDict = {}
-	for seqID in string.split(sequenceIDs, '|'):
-	    if len(seqID) > 0:
-	        [logicalDB, acc] = string.split(seqID, ':')
-	        logicalDBKey = loadlib.verifyLogicalDB(logicalDB, lineNum, errorFile)
-	        if logicalDBKey > 0:
-		    seqAccDict[acc] = logicalDBKey
-
-        # if errors, continue to next record
+                markers.append((markerID, markerKey))
+
+        markerList = self.uniqueMarkers(name, markers)
+
+        # sequence IDs
+        seqAccDict = {}
+        for seqID in string.split(sequenceIDs, '|'):
+            if len(seqID) > 0:
+                [logicalDB, acc] = string.split(seqID, ':')
+                logicalDBKey = lookups.verifyLogicalDB(logicalDB, lineNum, errorFile)
+                if logicalDBKey > 0:
+                    seqAccDict[acc] = logicalDBKey
+
         if error:
-            continue
+            return None
+
+        return {
+            'tokens' : tokens,
+            'parentProbeKey' : parentProbeKey,
+            'sourceKey' : sourceKey,
+            'vectorKey' : vectorKey,
+            'segmentTypeKey' : segmentTypeKey,
+            'referenceKey' : referenceKey,
+            'createdByKey' : createdByKey,
+            'markerList' : markerList,
+            'seqAccDict' : seqAccDict,
+            }
+
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the probe to the table outputs and the new probe
+    #	    and raw note files; advances the primary keys
+    # Throws:   nothing
+
+    def writeRow(self, row):
+
+        probeFile = self.outputs[probeTable]
+        markerFile = self.outputs[markerTable]
+        refFile = self.outputs[refTable]
+        aliasFile = self.outputs[aliasTable]
+        accFile = self.outputs[accTable]
+        accRefFile = self.outputs[accRefTable]
+        noteFile = self.outputs[noteTable]
+        newProbeFile = self.files[newProbeFileName]
+        rawNoteFile = self.files[rawNoteFileName]
+
+        probeKey = self.probeKey
+        refKey = self.refKey
+        mgiKey = self.mgiKey
+
+        tokens = row['tokens']
+        name = tokens[0]
+        regionCovered = tokens[12]
+        insertSite = tokens[13]
+        insertSize = tokens[14]
+        relationship = tokens[16]
+        aliasList = string.split(tokens[18], '|')
+        notes = tokens[19]
+        rawnotes = tokens[20]
+
+        referenceKey = row['referenceKey']
+        createdByKey = row['createdByKey']
+        markerList = row['markerList']
+        seqAccDict = row['seqAccDict']
 
         # if no errors, process the probe
 
-        probeFile.write('%d\t%s\t%s\t%s\t%s\t%s\t\t\t%s\t%s\t%s\t\t%s\t%s\t%s\t%s\n' \
-            % (probeKey, name, parentProbeKey, sourceKey, vectorKey, segmentTypeKey, mgi_utils.prvalue(regionCovered), \
-	    mgi_utils.prvalue(insertSite), mgi_utils.prvalue(insertSize), createdByKey, createdByKey, loaddate, loaddate))
+        probeFile.row((probeKey, name, row['parentProbeKey'], row['sourceKey'], row['vectorKey'], row['segmentTypeKey'],
+            None, None, regionCovered, insertSite, insertSize, None,
+            createdByKey, createdByKey, loaddate, loaddate))
 
-	for markerKey in markerList:
-	    if markerList.count(markerKey) == 1:
-                markerFile.write('%s\t%s\t%d\t%s\t%s\t%s\t%s\t%s\n' \
-		    % (probeKey, markerKey, referenceKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
-            else:
-		errorFile.write('Invalid Marker Duplicate:  %s, %s\n' % (name, markerID))
+        for markerKey in markerList:
+            markerFile.row((probeKey, markerKey, referenceKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
 
-        refFile.write('%s\t%s\t%s\t0\t0\t%s\t%s\t%s\t%s\n' \
-		% (refKey, probeKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
+        refFile.row((refKey, probeKey, referenceKey, 0, 0, createdByKey, createdByKey, loaddate, loaddate))
 
         # aliases
 
         for alias in aliasList:
-	    if len(alias) == 0:
-		continue
-            aliasFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\n' \
-		    % (aliasKey, refKey, alias, createdByKey, createdByKey, loaddate, loaddate))
-	    aliasKey = aliasKey + 1
+            if len(alias) == 0:
+                continue
+            aliasFile.row((self.aliasKey, refKey, alias, createdByKey, createdByKey, loaddate, loaddate))
+            self.aliasKey = self.aliasKey + 1
 
         # MGI Accession ID for the marker
 
-        accFile.write('%s\t%s%d\t%s\t%s\t1\t%d\t%d\t0\t1\t%s\t%s\t%s\t%s\n' \
-            % (accKey, mgiPrefix, mgiKey, mgiPrefix, mgiKey, probeKey, mgiTypeKey, createdByKey, createdByKey, loaddate, loaddate))
-
-	# Print out a new text file and attach the new MGI Probe IDs as the last field
-
-        newProbeFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s%d\n' \
-	    % (name, jnum, \
-	    mgi_utils.prvalue(sourceName), \
-	    organism, \
-	    mgi_utils.prvalue(strain), \
-	    mgi_utils.prvalue(tissue), \
-	    mgi_utils.prvalue(gender), \
-	    mgi_utils.prvalue(cellLine), \
-	    mgi_utils.prvalue(age), \
-	    mgi_utils.prvalue(vectorType), \
-	    mgi_utils.prvalue(segmentType), \
-	    mgi_utils.prvalue(regionCovered) + \
-	    mgi_utils.prvalue(insertSite), \
-	    mgi_utils.prvalue(insertSize), \
-	    string.join(markerIDs, '|'), \
-	    relationship, \
-	    mgi_utils.prvalue(sequenceIDs), \
-	    string.join(aliasList, '|'), \
-	    mgi_utils.prvalue(notes), \
-	    createdBy, mgiPrefix, mgiKey))
-
-	# Print out a raw note file
+        accFile.row((self.accKey, '%s%d' % (mgiPrefix, mgiKey), mgiPrefix, mgiKey, 1, probeKey, mgiTypeKey, 0, 1,
+            createdByKey, createdByKey, loaddate, loaddate))
+
+        # Print out a new text file and attach the new MGI Probe IDs as the last field:
+        # the input line without the parent probe and the raw notes, and with
+        # the region covered and the insert site run together
+
+        newProbeFields = tokens[0:2] + tokens[3:12] + [regionCovered + insertSite] + tokens[14:20] + [tokens[21]]
+        newProbeFile.write('%s\t%s%d\n' % (string.join(newProbeFields, '\t'), mgiPrefix, mgiKey))
+
+        # Print out a raw note file
 
         if len(rawnotes) > 0:
             rawNoteFile.write('%s%d\t%s\n' % (mgiPrefix, mgiKey, rawnotes))
 
-	# Notes
+        # Notes
 
         if len(notes) > 0:
-	    noteFile.write('%s\t%s\t%s\t%s\n' % (probeKey, notes, loaddate, loaddate))
+            noteFile.row((probeKey, notes, loaddate, loaddate))
 
-        accKey = accKey + 1
-        mgiKey = mgiKey + 1
+        self.accKey = self.accKey + 1
+        self.mgiKey = self.mgiKey + 1
 
-	# sequence accession ids
-	for acc in seqAccDict.keys():
-	    prefixPart, numericPart = accessionlib.split_accnum(acc)
-            accFile.write('%s\t%s\t%s\t%s\t%s\t%d\t%d\t0\t1\t%s\t%s\t%s\t%s\n' \
-                % (accKey, acc, prefixPart, numericPart, seqAccDict[acc], probeKey, mgiTypeKey, createdByKey, createdByKey, loaddate, loaddate))
-            accRefFile.write('%s\t%s\t%s\t%s\t%s\t%s\n' \
-                % (accKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
-	    accKey = accKey + 1
+        # sequence accession ids
+        for acc in seqAccDict.keys():
+            prefixPart, numericPart = accessionlib.split_accnum(acc)
+            accFile.row((self.accKey, acc, prefixPart, numericPart, seqAccDict[acc], probeKey, mgiTypeKey, 0, 1,
+                createdByKey, createdByKey, loaddate, loaddate))
+            accRefFile.row((self.accKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
+            self.accKey = self.accKey + 1
 
-	refKey = refKey + 1
-        probeKey = probeKey + 1
+        self.refKey = self.refKey + 1
+        self.probeKey = self.probeKey + 1
 
-    #	end of "for line in inputFile.readlines():"
+    # Purpose:  processes data
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  verifies and processes each line in the input file
+    #	    writes the lookup cache statistics to the diagnostics file
+    # Throws:   nothing
 
-    #
-    # Update the AccessionMax value
-    #
+    def processFile(self):
 
-    if not DEBUG:
-        db.sql('select * from ACC_setMax (%d)' % (lineNum), None)
+        loader.Loader.processFile(self)
+        lookups.writeStatistics(self.diagFile)
 
 #
 # Main
 #
 
-init()
-verifyMode()
-setPrimaryKeys()
-processFile()
-bcpFiles()
-exit(0)
-
+ProbeLoad().run()
@@ -0,0 +1,27 @@
+#
+# Package: probeloadlib
+#
+# Purpose:
+#
+#	Support modules shared by the probe loaders in this product
+#	(probeload.py, primerload.py, probereference.py, ...).
+#
+#	bcp.py		runs the bcpin.csh commands of a load in parallel
+#	sqlutil.py	helpers for building set-based SQL
+#	copyin.py	copies rows into the database over the loader's connection
+#	staging.py	temporary tables for set-based updates and deletes
+#	replace.py	replaces a load's rows: staged delete + copy in one transaction
+#	keys.py		reserves blocks of primary keys and MGI IDs
+#	lookups.py	bulk pre-resolution of loadlib/sourceloadlib lookups
+#	reader.py	streaming reader for the tab-delimited input files
+#	sqllog.py	leveled SQL logging through a background writer
+#	instrument.py	per-phase timers and counters, written as <input>.stats.json
+#	loader.py	Loader base class: connection, files, modes and bcp of a load
+#	rows.py		per-table column specs and buffered row writers
+#	parallel.py	validates the input lines in worker processes (--workers)
+#	pipeline.py	pipelined row-by-row lookups on a pool of connections
+#	checkpoint.py	checkpoint journal of a chunked, resumable load (--resume, --restart)
+#	backend.py	pluggable db backend: offline SQLite stand-in, record and replay
+#	profiling.py	cProfile and memory profiling of the phases (PROBELOAD_PROFILE)
+#	progress.py	progress records, ETA and status file of a load (PROBELOADPROGRESS)
+#
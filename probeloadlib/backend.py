@@ -0,0 +1,684 @@
+#
+# Module: backend.py
+#
+# Purpose:
+#
+#	Pluggable database backend under the loaders' database calls.
+#
+#	The loaders, and the MGI libraries they call (loadlib,
+#	sourceloadlib, ...), all reach the database through the
+#	functions of the MGI db module: db.sql(), db.commit(),
+#	db.sharedDbConnection, ...  install() replaces those functions
+#	with the methods of a Backend, the way instrument.wrap() replaces
+#	the functions it times, so every caller in the process uses the
+#	backend without a change.
+#
+#	PROBELOADBACKEND selects the backend:
+#
+#		db			the server, through the db module
+#					(the default; nothing is installed)
+#		fixtures:<dump>		FixtureBackend: an in-memory SQLite
+#					database loaded from a fixture dump
+#		record:<recording>	RecordingBackend: the server, recording
+#					every db.sql() and db.commit() call
+#		replay:<recording>	ReplayBackend: serves the rows of a
+#					recording, with its latency
+#
+#	A fixture dump is a JSON document of table rows, written from
+#	the server by dumpTables() (see benchmark/fixtures.py):
+#
+#		{"MGI_User" : {"columns" : ["_User_key", "login", ...],
+#			       "rows" : [[1001, "lec", ...], ...]}, ...}
+#
+#	FixtureBackend runs the loaders' SQL in SQLite.  The Postgres
+#	sequence statements of keys.py are emulated, the rows copied in
+#	with "copy ... from stdin" are inserted (creating the table if it
+#	is not in the dump), and a statement SQLite cannot run returns no
+#	rows and is listed in the diagnostics file.  Nothing is written
+#	to the server; the loader does not run bcp (see Backend.offline),
+#	and the pipelined lookups run on the backend.
+#
+#	A recording has one JSON document per line, in the order of the
+#	calls, with the statement, its rows and its wall time:
+#
+#		{"sql" : "select ...", "rows" : [{...}, ...], "seconds" : 0.0021}
+#		{"commit" : 1, "seconds" : 0.0008}
+#
+#	ReplayBackend answers each statement with the rows recorded for
+#	the same statement text (the next of them, if it was run more
+#	than once) after sleeping for its recorded wall time, scaled by
+#	PROBELOADREPLAYSCALE (default 1; 0 for no latency).  It serves
+#	several threads at once, so the pipelined lookups of a replayed
+#	load overlap as they do against the server.  A statement that is
+#	not in the recording returns no rows and is listed in the
+#	diagnostics file.  The rows copied in with "copy ... from stdin"
+#	are not recorded; ReplayBackend discards them.
+#
+#	The statements run on a backend other than 'record' are not
+#	written to the SQL log.
+#
+# Usage:
+#
+#	setenv PROBELOADBACKEND fixtures:/data/probeload/fixtures.json
+#	probeload.py
+#
+#	setenv PROBELOADBACKEND record:/data/probeload/mydata.recording
+#	probeload.py
+#	setenv PROBELOADBACKEND replay:/data/probeload/mydata.recording
+#	setenv PROBELOADREPLAYSCALE 0.5
+#	probeload.py
+#
+
+import collections
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import db
+from probeloadlib import instrument
+from probeloadlib import rows
+
+# db module functions replaced by install()
+functions = ['sql', 'commit', 'useOneConnection', 'set_sqlUser', 'set_sqlPasswordFromFile',
+    'get_sqlServer', 'get_sqlDatabase']
+
+# tables of a fixture dump : where clause of the rows dumped
+# (the tables of the lookups; see probeloadlib/lookups.py)
+fixtureTables = {
+    'ACC_Accession' : 'where _MGIType_key in (2, 3) and _LogicalDB_key = 1 and preferred = 1',
+    'ACC_AccessionMax' : '',
+    'ACC_LogicalDB' : '',
+    'BIB_Citation_Cache' : '',
+    'MGI_Organism' : '',
+    'MGI_User' : '',
+    'MRK_Marker' : 'where _Organism_key = 1',
+    'PRB_Probe' : '',
+    'PRB_Reference' : '',
+    'PRB_Source' : '',
+    'PRB_Strain' : '',
+    'PRB_Tissue' : '',
+    'VOC_Term' : '''where _Vocab_key in (select _Vocab_key from VOC_Vocab
+	where name in ('Gender', 'Cell Line', 'Segment Vector Type', 'Segment Type'))''',
+    'VOC_Vocab' : '',
+    }
+
+copyRE = re.compile(r'\s*copy\s+(\w+)\.(\w+)\s+from\s+stdin', re.I)
+alterSequenceRE = re.compile(r'\s*alter\s+sequence\s+(\w+)\s+increment\s+by\s+(\d+)\s*$', re.I)
+lastValueRE = re.compile(r'\s*select\s+last_value\s*,\s*is_called\s+from\s+(\w+)\s*$', re.I)
+setvalRE = re.compile(r'''\s*select\s+setval\('(\w+)',\s*(\d+)\)\s*$''', re.I)
+
+class Cursor(object):
+
+    # Purpose: constructor; the cursor of db.sharedDbConnection
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self, backend):
+
+        self.backend = backend
+
+    # Purpose: psycopg2 cursor.copy_expert() for "copy ... from stdin"
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: see Backend.copy()
+    # Throws:  ValueError if 'cmd' is not a "copy ... from stdin"
+
+    def copy_expert(self,
+        cmd,		# copy statement (string)
+        dataFile	# tab-delimited rows (file)
+        ):
+
+        match = copyRE.match(cmd)
+
+        if match is None:
+            raise ValueError('not a copy from stdin: %s' % (cmd))
+
+        self.backend.copy(match.group(1), match.group(2), dataFile)
+
+    def close(self):
+
+        pass
+
+class Backend(object):
+
+    name = ''		# the name in PROBELOADBACKEND
+    offline = 1		# 1 if nothing reaches the server (the loader does not bcp)
+    concurrent = 0	# 1 if sql() can be called by several threads at once
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        arg		# what follows 'name:' in PROBELOADBACKEND (string)
+        ):
+
+        self.arg = arg
+        self.statements = 0
+
+    # Purpose: db.sql()
+    # Returns: list of dictionaries for a command; a list of those for
+    #	a list of commands
+    # Assumes: nothing
+    # Effects: see execute()
+    # Throws:  nothing
+
+    def sql(self,
+        cmd,			# SQL command, or list of them (string or list)
+        parser = 'auto'		# as db.sql() (string)
+        ):
+
+        if isinstance(cmd, list):
+            return [self.sql(c, parser) for c in cmd]
+
+        self.statements = self.statements + 1
+
+        return self.execute(cmd)
+
+    # Purpose: run one SQL command
+    # Returns: the rows (list of dictionaries)
+    # Assumes: nothing
+    # Effects: nothing; see the subclasses
+    # Throws:  nothing
+
+    def execute(self, cmd):
+
+        raise NotImplementedError
+
+    # Purpose: copy tab-delimited rows into a table
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing; see the subclasses
+    # Throws:  nothing
+
+    def copy(self,
+        schema,		# schema name (string)
+        table,		# table name (string)
+        dataFile	# tab-delimited rows (file)
+        ):
+
+        raise NotImplementedError
+
+    def commit(self):
+
+        pass
+
+    # Purpose: db.useOneConnection()
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: sets db.sharedDbConnection to the backend, or to None
+    # Throws:  nothing
+
+    def useOneConnection(self, flag):
+
+        if flag:
+            db.sharedDbConnection = self
+        else:
+            db.sharedDbConnection = None
+
+    # Purpose: db.sharedDbConnection.cursor()
+    # Returns: Cursor
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def cursor(self):
+
+        return Cursor(self)
+
+    def set_sqlUser(self, user):
+
+        pass
+
+    def set_sqlPasswordFromFile(self, fileName):
+
+        pass
+
+    def get_sqlServer(self):
+
+        return self.name
+
+    def get_sqlDatabase(self):
+
+        return self.arg
+
+    # Purpose: write the backend's statistics
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the diagnostics file
+    # Throws:  nothing
+
+    def writeStatistics(self,
+        diagFile	# diagnostics file (file descriptor)
+        ):
+
+        diagFile.write('\nDatabase backend %s:%s: %d statement(s)\n' % (self.name, self.arg, self.statements))
+
+    # Purpose: release the backend's resources at the end of the load
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing; see the subclasses
+    # Throws:  nothing
+
+    def close(self):
+
+        pass
+
+class FixtureBackend(Backend):
+
+    name = 'fixtures'
+
+    # Purpose: constructor; loads the fixture dump into SQLite
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: reads the fixture dump
+    # Throws:  IOError, ValueError if the dump cannot be read
+
+    def __init__(self,
+        fileName	# fixture dump file name (string)
+        ):
+
+        Backend.__init__(self, fileName)
+
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.text_factory = str
+
+        self.lastValues = {}	# sequence : last value set with setval()
+        self.unserved = {}	# SQLite error : number of statements
+
+        dumpFile = open(fileName, 'r')
+        tables = json.load(dumpFile)
+        dumpFile.close()
+
+        for table in tables.keys():
+            self.createTable('main', table, tables[table]['columns'])
+            self.insertRows('main', table, len(tables[table]['columns']), tables[table]['rows'])
+
+        self.connection.commit()
+
+    # Purpose: create a table with untyped columns
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  sqlite3.Error
+
+    def createTable(self, schema, table, columns):
+
+        self.connection.execute('create table %s.%s (%s)' % (schema, table, ', '.join(columns)))
+
+    # Purpose: insert rows into a table
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  sqlite3.Error
+
+    def insertRows(self, schema, table, width, values):
+
+        self.connection.executemany('insert into %s.%s values (%s)' \
+            % (schema, table, ', '.join(['?'] * width)), values)
+
+    # Purpose: run one SQL command in SQLite
+    # Returns: the rows (list of dictionaries)
+    # Assumes: nothing
+    # Effects: a command SQLite cannot run is counted in 'unserved'
+    #	and returns no rows
+    # Throws:  nothing
+
+    def execute(self, cmd):
+
+        # the sequence statements of keys.py
+
+        if alterSequenceRE.match(cmd) is not None:
+            return []
+
+        # a sequence that was never set starts at 1, not called;
+        # keys.py then starts it at the max(key) of its table
+        match = lastValueRE.match(cmd)
+        if match is not None:
+            sequence = match.group(1)
+            return [{'last_value' : self.lastValues.get(sequence, 1), 'is_called' : sequence in self.lastValues}]
+
+        match = setvalRE.match(cmd)
+        if match is not None:
+            self.lastValues[match.group(1)] = int(match.group(2))
+            return [{'setval' : int(match.group(2))}]
+
+        cursor = self.connection.cursor()
+
+        try:
+            cursor.execute(cmd.replace('pg_temp.', 'temp.').replace('mgd.', ''))
+        except sqlite3.Error as e:
+            error = str(e)
+            self.unserved[error] = self.unserved.get(error, 0) + 1
+            instrument.count('backend statements not served')
+            return []
+
+        if cursor.description is None:
+            return []
+
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, r)) for r in cursor.fetchall()]
+
+    # Purpose: copy tab-delimited rows into a table
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: inserts the rows; creates the table if it is not in
+    #	the dump (see rows.tableColumns)
+    # Throws:  sqlite3.Error if the rows do not fit the table
+
+    def copy(self, schema, table, dataFile):
+
+        if schema == 'pg_temp':
+            schema = 'temp'
+        else:
+            schema = 'main'
+
+        values = [[v if v != '' else None for v in line.rstrip('\n').split('\t')] for line in dataFile]
+
+        if len(values) == 0:
+            return
+
+        width = len(values[0])
+
+        try:
+            self.connection.execute('select * from %s.%s limit 0' % (schema, table))
+        except sqlite3.Error:
+            columns = rows.tableColumns.get(table, ['c%d' % (i + 1) for i in range(width)])
+            self.createTable(schema, table, columns)
+
+        self.insertRows(schema, table, width, values)
+
+    def commit(self):
+
+        self.connection.commit()
+
+    # Purpose: write the backend's statistics
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the diagnostics file, with each error of the
+    #	statements SQLite could not run
+    # Throws:  nothing
+
+    def writeStatistics(self, diagFile):
+
+        Backend.writeStatistics(self, diagFile)
+
+        for error in sorted(self.unserved.keys()):
+            diagFile.write('not served (%d statement(s)): %s\n' % (self.unserved[error], error))
+
+class RecordingBackend(Backend):
+
+    name = 'record'
+    offline = 0
+
+    # Purpose: constructor; keeps the db module's functions
+    # Returns: nothing
+    # Assumes: the db module's functions have not been replaced
+    # Effects: creates the recording file
+    # Throws:  IOError if the recording cannot be created
+
+    def __init__(self,
+        fileName	# recording file name (string)
+        ):
+
+        Backend.__init__(self, fileName)
+
+        self.db = dict([(f, getattr(db, f)) for f in functions])
+        self.recording = open(fileName, 'w')
+
+    # Purpose: write one call to the recording
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the recording file
+    # Throws:  nothing
+
+    def record(self, entry):
+
+        self.recording.write(json.dumps(entry, default = str) + '\n')
+
+    # Purpose: db.sql(), recorded
+    # Returns: what db.sql() returns
+    # Assumes: nothing
+    # Effects: runs the command on the server and records it
+    # Throws:  whatever db.sql() throws
+
+    def sql(self, cmd, parser = 'auto'):
+
+        self.statements = self.statements + 1
+
+        startTime = time.time()
+        results = self.db['sql'](cmd, parser)
+        self.record({'sql' : cmd, 'rows' : results, 'seconds' : round(time.time() - startTime, 6)})
+
+        return results
+
+    # Purpose: db.commit(), recorded
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: commits and records the commit
+    # Throws:  whatever db.commit() throws
+
+    def commit(self):
+
+        startTime = time.time()
+        self.db['commit']()
+        self.record({'commit' : 1, 'seconds' : round(time.time() - startTime, 6)})
+
+    def useOneConnection(self, flag):
+
+        self.db['useOneConnection'](flag)
+
+    def set_sqlUser(self, user):
+
+        self.db['set_sqlUser'](user)
+
+    def set_sqlPasswordFromFile(self, fileName):
+
+        self.db['set_sqlPasswordFromFile'](fileName)
+
+    def get_sqlServer(self):
+
+        return self.db['get_sqlServer']()
+
+    def get_sqlDatabase(self):
+
+        return self.db['get_sqlDatabase']()
+
+    def close(self):
+
+        self.recording.close()
+
+class ReplayBackend(Backend):
+
+    name = 'replay'
+    concurrent = 1
+
+    # Purpose: constructor; reads the recording
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: reads the recording file
+    # Throws:  IOError, ValueError if the recording cannot be read
+
+    def __init__(self,
+        fileName	# recording file name (string)
+        ):
+
+        Backend.__init__(self, fileName)
+
+        self.scale = float(os.environ.get('PROBELOADREPLAYSCALE', 1))
+        self.lock = threading.Lock()
+
+        self.replies = {}	# statement : deque of (rows, seconds)
+        self.commitSeconds = []	# wall time of each recorded commit
+        self.missing = {}	# statement not in the recording : number of calls
+        self.latency = 0.0	# seconds slept
+
+        recording = open(fileName, 'r')
+        for line in recording:
+            entry = json.loads(line)
+            if 'sql' in entry:
+                self.replies.setdefault(entry['sql'], collections.deque()).append((entry['rows'], entry['seconds']))
+            else:
+                self.commitSeconds.append(entry['seconds'])
+        recording.close()
+
+    # Purpose: sleep for a recorded wall time, scaled
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def wait(self, seconds):
+
+        seconds = seconds * self.scale
+
+        if seconds > 0:
+            time.sleep(seconds)
+            with self.lock:
+                self.latency = self.latency + seconds
+
+    # Purpose: the recorded rows of one SQL command
+    # Returns: the rows (list of dictionaries), [] if not recorded
+    # Assumes: nothing
+    # Effects: sleeps for the recorded wall time
+    # Throws:  nothing
+
+    def execute(self, cmd):
+
+        with self.lock:
+            replies = self.replies.get(cmd)
+
+            if replies is None:
+                self.missing[cmd] = self.missing.get(cmd, 0) + 1
+                instrument.count('backend statements not served')
+                return []
+
+            # the calls in recorded order; the last one is repeated
+            if len(replies) > 1:
+                rows, seconds = replies.popleft()
+            else:
+                rows, seconds = replies[0]
+
+        self.wait(seconds)
+
+        return rows
+
+    # Purpose: db.sql(); see execute()
+    # Returns: the rows (list of dictionaries)
+    # Assumes: nothing
+    # Effects: sleeps for the recorded wall time
+    # Throws:  nothing
+
+    def sql(self, cmd, parser = 'auto'):
+
+        if isinstance(cmd, list):
+            return [self.sql(c, parser) for c in cmd]
+
+        with self.lock:
+            self.statements = self.statements + 1
+
+        return self.execute(cmd)
+
+    # Purpose: discard the copied rows
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: reads the rows
+    # Throws:  nothing
+
+    def copy(self, schema, table, dataFile):
+
+        for line in dataFile:
+            pass
+
+    # Purpose: db.commit()
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: sleeps for the average wall time of a recorded commit
+    # Throws:  nothing
+
+    def commit(self):
+
+        if len(self.commitSeconds) > 0:
+            self.wait(sum(self.commitSeconds) / len(self.commitSeconds))
+
+    # Purpose: write the backend's statistics
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the diagnostics file, with each statement
+    #	that was not in the recording
+    # Throws:  nothing
+
+    def writeStatistics(self, diagFile):
+
+        Backend.writeStatistics(self, diagFile)
+
+        diagFile.write('replayed latency: %.3f seconds (scale %s)\n' % (self.latency, self.scale))
+
+        for cmd in sorted(self.missing.keys()):
+            diagFile.write('not in the recording (%d call(s)): %s\n' % (self.missing[cmd], cmd.strip()))
+
+# backend name : Backend class
+backends = {
+    'fixtures' : FixtureBackend,
+    'record' : RecordingBackend,
+    'replay' : ReplayBackend,
+    }
+
+# Purpose: install the backend named by PROBELOADBACKEND
+# Returns: the Backend, or None for 'db'
+# Assumes: no database call has been made yet
+# Effects: replaces the db module's functions with the backend's
+# Throws:  ValueError if the backend is unknown; whatever the
+#	backend's constructor throws
+
+def install(
+    spec	# PROBELOADBACKEND, i.e. 'fixtures:/data/fixtures.json' (string)
+    ):
+
+    if spec == 'db':
+        return None
+
+    name, sep, arg = spec.partition(':')
+
+    if name not in backends:
+        raise ValueError('unknown backend: %s' % (spec))
+
+    backend = backends[name](arg)
+
+    for function in functions:
+        setattr(db, function, getattr(backend, function))
+
+    return backend
+
+# Purpose: write a fixture dump of the server's tables
+# Returns: nothing
+# Assumes: the connection is set up
+# Effects: queries the database; creates 'fileName'
+# Throws:  IOError if the dump cannot be written
+
+def dumpTables(
+    fileName,			# fixture dump file name (string)
+    tables = fixtureTables	# table : where clause (dictionary)
+    ):
+
+    dump = {}
+
+    for table in sorted(tables.keys()):
+        results = db.sql('select * from %s %s' % (table, tables[table]), 'auto')
+        if len(results) == 0:
+            continue
+        columns = sorted(results[0].keys())
+        dump[table] = {
+            'columns' : columns,
+            'rows' : [[r[c] for c in columns] for r in results],
+            }
+
+    dumpFile = open(fileName, 'w')
+    json.dump(dump, dumpFile, default = str)
+    dumpFile.close()
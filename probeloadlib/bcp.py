@@ -0,0 +1,175 @@
+#
+# Module: bcp.py
+#
+# Purpose:
+#
+#	Runs the bcpin.csh command for each table of a load, running the
+#	loads of independent tables in parallel.
+#
+#	A table is started as soon as every table it depends on (see
+#	'dependencies') has loaded successfully; if one of them fails,
+#	the table is skipped.  At most 'workers' commands run at a time.
+#
+#	For each table the command, its wall time and its exit status
+#	are written to the diagnostics file.
+#
+# Usage:
+#
+#	scheduler = bcp.BcpScheduler(bcpCommand, diagFile, workers)
+#	scheduler.add(probeTable, probeFileName)
+#	...
+#	if scheduler.run() > 0:
+#	    exit(1, ...)
+#
+
+import subprocess
+import threading
+import time
+from probeloadlib import instrument
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+workers = 4		# default number of concurrent bcp commands
+
+#
+# table : tables that must be loaded first
+#
+# follows the foreign keys between the tables written by the loaders;
+# tables that are not listed may be loaded at any time
+#
+dependencies = {
+    'PRB_Marker' : ['PRB_Probe'],
+    'PRB_Reference' : ['PRB_Probe'],
+    'PRB_Alias' : ['PRB_Reference'],
+    'PRB_Notes' : ['PRB_Probe'],
+    'ACC_AccessionReference' : ['ACC_Accession'],
+    }
+
+class BcpJob(object):
+
+    def __init__(self, table, fileName, command):
+        self.table = table
+        self.fileName = fileName
+        self.command = command
+        self.status = None	# exit status; None if not run
+        self.seconds = 0.0	# wall time
+
+class BcpScheduler(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        bcpCommand,			# bcpin.csh command with %s for table & file (string)
+        diagFile,			# diagnostics file (file descriptor)
+        workers = workers,		# maximum number of concurrent commands (integer)
+        dependencies = dependencies	# table : tables that must be loaded first (dictionary)
+        ):
+
+        self.bcpCommand = bcpCommand
+        self.diagFile = diagFile
+        self.workers = max(1, workers)
+        self.dependencies = dependencies
+        self.jobs = []
+
+    # Purpose: add a table to the load
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def add(self,
+        table,		# table name (string)
+        fileName	# bcp file name (string)
+        ):
+
+        self.jobs.append(BcpJob(table, fileName, self.bcpCommand % (table, fileName)))
+
+    # Purpose: run one bcp command (in a worker thread)
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: puts the finished job on 'results'
+    # Throws:  nothing
+
+    def __execute(self, job, results):
+
+        startTime = time.time()
+
+        try:
+            job.status = subprocess.call(job.command, shell = True)
+        except OSError:
+            job.status = -1
+
+        job.seconds = time.time() - startTime
+        results.put(job)
+
+    # Purpose: run the bcp commands of all tables
+    # Returns: number of tables that failed or were skipped (integer)
+    # Assumes: nothing
+    # Effects: loads the bcp files into the database
+    #	writes each command, its wall time and exit status to the diagnostics file
+    # Throws:  nothing
+
+    def run(self):
+
+        tables = [job.table for job in self.jobs]
+        pending = list(self.jobs)
+        finished = {}		# table : job
+        results = queue.Queue()
+        running = 0
+        failed = 0
+
+        while pending or running > 0:
+
+            # start every job whose tables are loaded; skip those whose are not
+            progress = 1
+            while progress:
+                progress = 0
+                for job in list(pending):
+
+                    required = [t for t in self.dependencies.get(job.table, []) if t in tables]
+
+                    if [t for t in required if t in finished and finished[t].status != 0]:
+                        self.diagFile.write('%s\nskipped: a table it depends on did not load\n' % (job.command))
+                        pending.remove(job)
+                        finished[job.table] = job
+                        failed = failed + 1
+                        progress = 1
+                        continue
+
+                    if running >= self.workers or [t for t in required if t not in finished]:
+                        continue
+
+                    self.diagFile.write('%s\n' % (job.command))
+                    pending.remove(job)
+                    running = running + 1
+                    threading.Thread(target = self.__execute, args = (job, results)).start()
+                    progress = 1
+
+            if running == 0:
+                # nothing can be started: circular dependencies
+                for job in pending:
+                    self.diagFile.write('%s\nskipped: circular table dependency\n' % (job.command))
+                    failed = failed + 1
+                break
+
+            job = results.get()
+            running = running - 1
+            finished[job.table] = job
+
+            self.diagFile.write('bcp %s: exit status %s, %.2f seconds\n' % (job.table, job.status, job.seconds))
+            instrument.add('bcp ' + job.table, job.seconds)
+
+            if job.status != 0:
+                failed = failed + 1
+
+        self.diagFile.flush()
+
+        return failed
+
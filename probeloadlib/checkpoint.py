@@ -0,0 +1,112 @@
+#
+# Module: checkpoint.py
+#
+# Purpose:
+#
+#	Checkpoint journal of a resumable load (see Loader.resumable).
+#
+#	A resumable loader in a copy mode commits its rows every
+#	PROBELOADCHECKPOINT input lines instead of once at the end of
+#	the load.  After each commit the journal records:
+#
+#		the mode and the size of the input file
+#		the last input line committed
+#		the loader's next primary keys (Loader.keyAttributes)
+#		the keys reserved for the load by setPrimaryKeys()
+#		the size of each extra file (newProbe.txt, ...)
+#
+#	The journal sits next to the loader's diagnostics file:
+#
+#		<input file>.checkpoint.json
+#
+#	If the load dies, running the loader again with --resume skips
+#	the committed lines, carries on with the keys the journal
+#	records (the keys reserved by the first run are still the
+#	load's own; nothing new is reserved) and cuts the extra files
+#	back to what was committed.  The journal is removed when the
+#	load finishes.
+#
+#	The rows of the committed lines are already in the database, so
+#	a fresh run refuses to start while the journal exists; --restart
+#	removes the journal first, for a load whose committed rows have
+#	been deleted.
+#
+#	The journal is written to a temporary file and renamed over the
+#	old one, so a load killed while writing it leaves the last
+#	checkpoint intact.
+#
+# Usage:
+#
+#	journal = checkpoint.Journal(outputDir + '/mydata.txt.checkpoint.json')
+#	state = journal.read()
+#	...
+#	journal.write({'line' : 10000, ...})
+#	...
+#	journal.remove()
+#
+
+import json
+import os
+
+class Journal(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        fileName	# journal file name (string)
+        ):
+
+        self.fileName = fileName
+
+    # Purpose: read the last checkpoint
+    # Returns: the checkpoint (dictionary), None if there is none
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  ValueError if the journal is not valid JSON
+
+    def read(self):
+
+        if not os.path.exists(self.fileName):
+            return None
+
+        journalFile = open(self.fileName, 'r')
+        try:
+            return json.load(journalFile)
+        finally:
+            journalFile.close()
+
+    # Purpose: record a checkpoint
+    # Returns: nothing
+    # Assumes: the rows up to the checkpoint are committed
+    # Effects: replaces the journal file
+    # Throws:  IOError if the journal cannot be written
+
+    def write(self,
+        state		# the checkpoint (dictionary)
+        ):
+
+        tmpFileName = self.fileName + '.tmp'
+
+        journalFile = open(tmpFileName, 'w')
+        json.dump(state, journalFile, indent = 1, sort_keys = True)
+        journalFile.write('\n')
+        journalFile.flush()
+        os.fsync(journalFile.fileno())
+        journalFile.close()
+
+        os.rename(tmpFileName, self.fileName)
+
+    # Purpose: remove the journal of a finished load
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: removes the journal file
+    # Throws:  nothing
+
+    def remove(self):
+
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
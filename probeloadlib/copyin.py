@@ -0,0 +1,135 @@
+#
+# Module: copyin.py
+#
+# Purpose:
+#
+#	In-process alternative to bcpin.csh: the rows of each table are
+#	copied into Postgres with "copy ... from stdin" over the
+#	connection the loader already has open (db.useOneConnection(1)),
+#	so no bcp files are written and no csh/psql process is started.
+#
+#	A CopySink stands in for a bcp file: the loader writes its rows
+#	to it exactly as it would to the file.  The rows are held in
+#	memory (spilling to an anonymous temporary file past 'spoolSize')
+#	until copyTables() copies every table, in foreign key order, as
+#	part of the loader's open transaction.  Nothing is visible in the
+#	database until the loader calls db.commit().
+#
+
+import tempfile
+import time
+import db
+from probeloadlib import bcp
+from probeloadlib import instrument
+
+spoolSize = 64 * 1024 * 1024	# bytes held in memory per table
+
+copySQL = '''copy %s.%s from stdin with null as '' '''
+
+class CopySink(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        table,		# table name (string)
+        schema = 'mgd'	# schema name (string)
+        ):
+
+        self.table = table
+        self.schema = schema
+        self.rows = 0
+        self.buffer = tempfile.SpooledTemporaryFile(max_size = spoolSize, mode = 'w+')
+
+    # Purpose: add bcp-formatted row(s) to the table
+    # Returns: nothing
+    # Assumes: 'data' is tab-delimited and newline-terminated
+    # Effects: nothing
+    # Throws:  nothing
+
+    def write(self, data):
+
+        self.buffer.write(data)
+        self.rows = self.rows + data.count('\n')
+
+    # Purpose: copy the rows into the table
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: copies the rows into the database
+    # Throws:  the database driver's error if the copy fails
+
+    def copy(self, cursor):
+
+        self.buffer.seek(0)
+        cursor.copy_expert(copySQL % (self.schema, self.table), self.buffer)
+
+    # Purpose: discard the rows
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def close(self):
+
+        self.buffer.close()
+
+# Purpose: order tables so that each comes after the tables it depends on
+# Returns: list of tables
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def order(
+    tables,				# table names (list of strings)
+    dependencies = bcp.dependencies	# table : tables that must be loaded first (dictionary)
+    ):
+
+    ordered = []
+    pending = list(tables)
+
+    while pending:
+        ready = [t for t in pending
+                 if not [d for d in dependencies.get(t, []) if d in pending]]
+        if not ready:
+            # circular dependencies: keep the given order
+            ready = list(pending)
+        for t in ready:
+            ordered.append(t)
+            pending.remove(t)
+
+    return ordered
+
+# Purpose: copy the rows of each sink into its table
+# Returns: nothing
+# Assumes: the loader is using db.useOneConnection(1)
+# Effects: copies the rows into the database; does not commit
+#	writes each table's row count and wall time to the diagnostics file
+# Throws:  the database driver's error if a copy fails
+
+def copyTables(
+    sinks,		# sinks to copy (list of CopySink)
+    diagFile		# diagnostics file (file descriptor)
+    ):
+
+    sinkDict = {}
+    for sink in sinks:
+        sinkDict[sink.table] = sink
+
+    cursor = db.sharedDbConnection.cursor()
+
+    for table in order([sink.table for sink in sinks]):
+        sink = sinkDict[table]
+        startTime = time.time()
+        diagFile.write(copySQL % (sink.schema, sink.table) + '\n')
+        sink.copy(cursor)
+        seconds = time.time() - startTime
+        diagFile.write('copy %s: %d rows, %.2f seconds\n' % (sink.table, sink.rows, seconds))
+        instrument.add('copy ' + sink.table, seconds)
+        sink.close()
+
+    cursor.close()
+    diagFile.flush()
+
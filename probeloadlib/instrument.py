@@ -0,0 +1,271 @@
+#
+# Module: instrument.py
+#
+# Purpose:
+#
+#	Timing and counting instrumentation for the probe loaders.
+#
+#	Timers accumulate the number of calls and the wall time spent
+#	under a name ('init', 'loadlib.verifyMarker', 'bcp PRB_Probe',
+#	...); counters accumulate a number ('rows accepted', ...).
+#
+#	At the end of the run writeSummary() writes both, with the
+#	elapsed time and the rows per second, as a JSON document that
+#	sits next to the loader's diagnostics file:
+#
+#		<input file>.stats.json
+#
+# Usage:
+#
+#	instrument.wrap(loadlib, ['verifyMarker', 'verifyUser'])
+#	instrument.call('init', init)
+#
+#	instrument.start('write bcp files')
+#	...
+#	instrument.stop('write bcp files')
+#
+#	instrument.count('rows accepted')
+#
+#	With slowRows set it also keeps the 'slowRows' slowest input rows,
+#	each with the timers of the calls made for it (the verify*
+#	lookups, ...), for writeSlowest():
+#
+#	instrument.startRow()
+#	...
+#	instrument.stopRow(lineNum)
+#
+
+import heapq
+import json
+import os
+import sys
+import time
+
+startTime = time.time()
+
+timers = {}		# name : [calls, seconds]
+counters = {}		# name : count
+running = {}		# name : start time of a start()ed timer
+
+slowRows = 0		# rows kept by the slowest-row report; 0 for none
+slowest = []		# min-heap of (seconds, lineNum, timers) of the slowest rows
+rowTimers = None	# name : [calls, seconds] of the row being timed
+rowStart = 0		# start time of the row being timed
+rowsTimed = 0		# rows timed by startRow()
+
+# Purpose: add one or more calls to a timer
+# Returns: nothing
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def add(
+    name,	# timer name (string)
+    seconds,	# wall time (float)
+    calls = 1	# number of calls (integer)
+    ):
+
+    if name in timers:
+        timer = timers[name]
+        timer[0] = timer[0] + calls
+        timer[1] = timer[1] + seconds
+    else:
+        timers[name] = [calls, seconds]
+
+    if rowTimers is not None:
+        if name in rowTimers:
+            timer = rowTimers[name]
+            timer[0] = timer[0] + calls
+            timer[1] = timer[1] + seconds
+        else:
+            rowTimers[name] = [calls, seconds]
+
+# Purpose: start a timer
+# Returns: nothing
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def start(name):
+
+    running[name] = time.time()
+
+# Purpose: stop a timer started by start()
+# Returns: nothing
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def stop(name):
+
+    if name in running:
+        add(name, time.time() - running.pop(name))
+
+# Purpose: add to a counter
+# Returns: nothing
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def count(
+    name,	# counter name (string)
+    n = 1	# amount to add (integer)
+    ):
+
+    counters[name] = counters.get(name, 0) + n
+
+# Purpose: call a function under a timer
+# Returns: the function's return value
+# Assumes: nothing
+# Effects: nothing
+# Throws:  whatever the function throws
+
+def call(
+    name,	# timer name (string)
+    function,	# function to call (function)
+    *args
+    ):
+
+    callStart = time.time()
+    try:
+        return function(*args)
+    finally:
+        add(name, time.time() - callStart)
+
+# Purpose: wrap a function so that every call is timed
+# Returns: the wrapped function (function)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def timed(
+    name,	# timer name (string)
+    function	# function to wrap (function)
+    ):
+
+    def wrapper(*args, **kw):
+        callStart = time.time()
+        try:
+            return function(*args, **kw)
+        finally:
+            add(name, time.time() - callStart)
+
+    wrapper.__name__ = function.__name__
+    wrapper.timed = 1
+
+    return wrapper
+
+# Purpose: time every call of the named functions of a module
+# Returns: nothing
+# Assumes: nothing
+# Effects: replaces each function in 'module' with a timed wrapper
+#	named '<module>.<function>'; callers that look the function up
+#	through the module (loadlib.verifyMarker(...)) are timed
+# Throws:  nothing
+
+def wrap(
+    module,	# module (module)
+    names,	# names of the functions to time (list of strings)
+    label = None	# timer name prefix; default is the module name (string)
+    ):
+
+    for name in names:
+        function = getattr(module, name)
+        if not getattr(function, 'timed', 0):
+            setattr(module, name, timed('%s.%s' % (label or module.__name__.split('.')[-1], name), function))
+
+# Purpose: start timing an input row
+# Returns: nothing
+# Assumes: nothing
+# Effects: the timers added until stopRow() are also kept for the row
+# Throws:  nothing
+
+def startRow():
+
+    global rowTimers, rowStart
+
+    if slowRows < 1:
+        return
+
+    rowTimers = {}
+    rowStart = time.time()
+
+# Purpose: stop timing an input row started by startRow()
+# Returns: nothing
+# Assumes: nothing
+# Effects: keeps the row if it is one of the 'slowRows' slowest
+# Throws:  nothing
+
+def stopRow(
+    lineNum,		# line number of the row (integer)
+    seconds = 0.0	# time spent on the row elsewhere, i.e. in a worker (float)
+    ):
+
+    global rowTimers, rowsTimed
+
+    if rowTimers is None:
+        return
+
+    row = (time.time() - rowStart + seconds, lineNum, rowTimers)
+    rowTimers = None
+    rowsTimed = rowsTimed + 1
+
+    if len(slowest) < slowRows:
+        heapq.heappush(slowest, row)
+    elif row[0] > slowest[0][0]:
+        heapq.heapreplace(slowest, row)
+
+# Purpose: write the slowest-row report
+# Returns: nothing
+# Assumes: nothing
+# Effects: writes the slowest rows, slowest first, with the timers of
+#	each, to 'diagFile'; nothing if no row was timed
+# Throws:  nothing
+
+def writeSlowest(
+    diagFile	# diagnostics file (file descriptor)
+    ):
+
+    if len(slowest) == 0:
+        return
+
+    diagFile.write('\nSlowest %d of %d row(s) (timers include the calls they make):\n' \
+        % (len(slowest), rowsTimed))
+
+    for seconds, lineNum, rowTimers in sorted(slowest, reverse = True):
+        diagFile.write('line %d: %.3f seconds\n' % (lineNum, seconds))
+        for name, timer in sorted(rowTimers.items(), key = lambda t: t[1][1], reverse = True):
+            diagFile.write('    %-40s %6d call(s) %10.3f seconds\n' % (name, timer[0], timer[1]))
+
+# Purpose: write the timers and counters as a JSON document
+# Returns: nothing
+# Assumes: nothing
+# Effects: creates 'fileName'
+# Throws:  nothing; a summary that cannot be written is reported on stderr
+
+def writeSummary(
+    fileName,	# summary file name (string)
+    status	# the loader's exit status (integer)
+    ):
+
+    elapsed = time.time() - startTime
+    rows = counters.get('rows accepted', 0) + counters.get('rows rejected', 0)
+
+    summary = {
+        'program' : os.path.basename(sys.argv[0]),
+        'status' : status,
+        'start' : time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(startTime)),
+        'elapsed' : round(elapsed, 3),
+        'rowsPerSecond' : round(rows / elapsed, 3) if elapsed > 0 else 0,
+        'counters' : counters,
+        'timers' : dict([(name, {'calls' : t[0], 'seconds' : round(t[1], 6)}) for name, t in timers.items()]),
+        }
+
+    try:
+        summaryFile = open(fileName, 'w')
+        json.dump(summary, summaryFile, indent = 1, sort_keys = True)
+        summaryFile.write('\n')
+        summaryFile.close()
+    except IOError:
+        sys.stderr.write('Could not write file %s\n' % (fileName))
+
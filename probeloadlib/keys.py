@@ -0,0 +1,125 @@
+#
+# Module: keys.py
+#
+# Purpose:
+#
+#	Reserves blocks of primary keys and MGI accession numbers for a
+#	load, instead of each loader taking max(key) + 1 on its own, so
+#	that two loads can run at the same time without handing out the
+#	same keys.
+#
+#	Primary keys come from the table's sequence (see 'sequences').
+#	The bcp loads here and in other MGI loads write explicit keys and
+#	never advance the sequences, so the sequence is first brought up
+#	to the table's max(key); the block is then handed out by moving
+#	the sequence past it:
+#
+#		alter sequence prb_probe_seq increment by 1
+#		select last_value, is_called from prb_probe_seq
+#		select max(_Probe_key) as maxKey from PRB_Probe
+#		select setval('prb_probe_seq', <last key> + 1000)
+#		commit
+#
+#	"alter sequence" holds a lock that makes every other nextval(),
+#	setval() and "alter sequence" on the sequence wait for the
+#	commit, and the table's max(key) is read under it, so the block
+#	is contiguous and belongs to this load alone.  Every loader that
+#	adds rows to these tables reserves its keys here.
+#
+#	MGI accession numbers are reserved with a single update of
+#	ACC_AccessionMax, which replaces the ACC_setMax() call the
+#	loaders made at the end of the load.
+#
+#	In preview mode nothing is reserved; the next free key is
+#	returned so that the preview output looks like a real load.
+#
+#	Keys reserved for rows that are later rejected are not reused.
+#
+
+import db
+
+# table : (primary key column, sequence)
+sequences = {
+    'PRB_Probe' : ('_Probe_key', 'prb_probe_seq'),
+    'PRB_Reference' : ('_Reference_key', 'prb_reference_seq'),
+    'PRB_Alias' : ('_Alias_key', 'prb_alias_seq'),
+    'ACC_Accession' : ('_Accession_key', 'acc_accession_seq'),
+    }
+
+# Purpose: the last key used in a table
+# Returns: the larger of the sequence's last value and the table's
+#	max(key) (integer)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def lastKey(
+    table		# table name (string)
+    ):
+
+    keyColumn, sequence = sequences[table]
+
+    results = db.sql('select last_value, is_called from %s' % (sequence), 'auto')
+    lastValue = results[0]['last_value']
+
+    # a sequence that was never called has not handed out last_value
+    if not results[0]['is_called']:
+        lastValue = lastValue - 1
+
+    results = db.sql('select max(%s) as maxKey from %s' % (keyColumn, table), 'auto')
+
+    if len(results) > 0 and results[0]['maxKey'] is not None and results[0]['maxKey'] > lastValue:
+        return results[0]['maxKey']
+
+    return lastValue
+
+# Purpose: reserve a block of primary keys
+# Returns: the first key of the block (integer)
+# Assumes: no other SQL of the loader is waiting to be committed
+# Effects: moves the table's sequence past the block and commits
+# Throws:  nothing
+
+def reserveKeys(
+    table,		# table name (string)
+    count,		# number of keys (integer)
+    preview = 0		# if true, do not reserve (boolean)
+    ):
+
+    keyColumn, sequence = sequences[table]
+
+    if preview or count < 1:
+        return lastKey(table) + 1
+
+    # lock the sequence until the commit
+    db.sql('alter sequence %s increment by 1' % (sequence), None)
+
+    firstKey = lastKey(table) + 1
+    db.sql('''select setval('%s', %d)''' % (sequence, firstKey + count - 1), 'auto')
+    db.commit()
+
+    return firstKey
+
+# Purpose: reserve a block of MGI accession numbers
+# Returns: the first numeric part of the block (integer)
+# Assumes: no other SQL of the loader is waiting to be committed
+# Effects: advances ACC_AccessionMax by 'count' and commits
+# Throws:  nothing
+
+def reserveAccessionNumbers(
+    prefixPart,		# accession prefix, i.e. 'MGI:' (string)
+    count,		# number of accession numbers (integer)
+    preview = 0		# if true, do not reserve (boolean)
+    ):
+
+    if preview or count < 1:
+        results = db.sql('''select maxNumericPart + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' \
+            % (prefixPart), 'auto')
+        return results[0]['maxKey']
+
+    results = db.sql('''update ACC_AccessionMax set maxNumericPart = maxNumericPart + %d
+        where prefixPart = '%s'
+        returning maxNumericPart as maxKey''' % (count, prefixPart), 'auto')
+    db.commit()
+
+    return results[0]['maxKey'] - count + 1
+
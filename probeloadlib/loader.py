@@ -0,0 +1,930 @@
+#
+# Module: loader.py
+#
+# Purpose:
+#
+#	The Loader base class shared by the probe loaders.
+#
+#	A Loader owns everything the loaders used to repeat in every
+#	script: the database connection, the diagnostics, error and
+#	statistics files, the processing mode, the output for each
+#	table (a rows.RowWriter over a bcp file, or over a
+#	copyin.CopySink in the copy modes), the SQL log, the
+#	instrumentation and the final bcp/COPY of the tables.
+#
+#	A loader script subclasses Loader, declares its input layout,
+#	tables and modes as class attributes and supplies the row logic:
+#
+#		validateRow(lineNum, tokens)
+#			looks up and checks one input line; writes any
+#			errors to the error file and returns None, else
+#			returns the row (a dictionary) for writeRow()
+#
+#		writeRow(row)
+#			assigns the primary keys and writes the row to
+#			the table outputs
+#
+#	validateRow() must not change the loader's state; everything
+#	that does (keys, output) belongs in writeRow().
+#
+#	A loader whose validateRow() only reads its state may set
+#	parallelSafe; it then takes a --workers N option (or
+#	PROBELOADWORKERS) that validates the lines in N processes.
+#
+#	A loader that must look a line up in the database row by row
+#	may set pipelined and submit the queries in prefetchRow(); they
+#	run ahead of validateRow() on PROBELOADLOOKUPCONNECTIONS
+#	connections of their own.  A query that needs the rows of
+#	another, i.e. one by the keys the first lookups resolve, is
+#	submitted in prefetchDependent(), half a window later.
+#
+#	A loader whose keys are all reserved up front may set resumable
+#	and list its key attributes in keyAttributes; in a copy mode it
+#	then commits every PROBELOADCHECKPOINT lines and takes the
+#	--resume and --restart options (see probeloadlib/checkpoint.py).  Its setPrimaryKeys()
+#	calls restoreKeys() first.
+#
+#	PROBELOAD_PROFILE runs the phases of the load under cProfile and
+#	a memory profiler (see probeloadlib/profiling.py).
+#
+#	PROBELOADPROGRESS writes a progress record with an ETA to the
+#	log every N seconds of processFile(), and PROBELOADSTATUSFILE
+#	keeps the same figures in a file for monitoring (see
+#	probeloadlib/progress.py).
+#
+#	PROBELOADSLOWROWS lists the N slowest input rows at the end of
+#	the diagnostics file, with the time of each verify* lookup made
+#	for them (see probeloadlib/instrument.py).
+#
+#	PROBELOADBACKEND puts a stand-in for the database under every
+#	db call of the load (see probeloadlib/backend.py).
+#
+#	Optional hooks: resolveLookups(), setPrimaryKeys() and
+#	executeSQL() (SQL run after the first commit of bcpFiles()).
+#	A loader that cannot work row by row overrides processFile()
+#	and calls processRow() for each line.
+#
+# Usage:
+#
+#	class ProbeNotes(loader.Loader):
+#	    program = 'probenotes'
+#	    columns = 3
+#	    tables = ['PRB_Notes']
+#	    ...
+#
+#	ProbeNotes().run()
+#
+
+import collections
+import getopt
+import os
+import sys
+import db
+import mgi_utils
+from probeloadlib import backend
+from probeloadlib import bcp
+from probeloadlib import checkpoint
+from probeloadlib import copyin
+from probeloadlib import instrument
+from probeloadlib import parallel
+from probeloadlib import pipeline
+from probeloadlib import profiling
+from probeloadlib import progress
+from probeloadlib import reader
+from probeloadlib import rows
+from probeloadlib import sqllog
+
+class Loader(object):
+
+    program = ''		# program name; prefixes the timers of timedMethods
+    columns = 0			# number of fields in an input line
+
+    previewModes = ('preview',)	# modes that load nothing
+    loadModes = ('load',)	# modes that load the tables
+    copyModes = ()		# modes that copy the tables in over the loader's
+				# connection (see probeloadlib/copyin.py)
+
+    tables = []			# tables written by the loader, in load order
+    extraFiles = []		# other output files (list of file names)
+
+    timedFunctions = []		# (module, [function names]) to time
+    timedMethods = []		# names of the loader's methods to time
+
+    # exit message if copyOutputs() fails
+    copyError = 'Could not copy the data into the database: %s\n'
+
+    phases = ['init', 'verifyMode', 'setPrimaryKeys', 'processFile', 'bcpFiles']
+
+    parallelSafe = 0		# 1 if validateRow() can run in worker processes
+				# (see probeloadlib/parallel.py)
+
+    pipelined = 0		# 1 if prefetchRow() submits the lookups of a line
+				# (see probeloadlib/pipeline.py)
+    lookupWindow = 100		# lines whose lookups are submitted ahead
+
+    resumable = 0		# 1 if a copy mode load can be committed in chunks
+				# and resumed (see probeloadlib/checkpoint.py)
+    keyAttributes = []		# attributes holding the next primary keys,
+				# saved at each checkpoint
+
+    # environment variables of the configuration file
+    modeEnv = 'PROBELOADMODE'
+    loadDirEnv = 'PROBELOADDIR'
+    dataFileEnv = 'PROBEDATAFILE'
+    outputDirEnv = 'PROBELOADDATADIR'
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: reads the configuration from the environment and the
+    #	command line; exits if an option is invalid
+    # Throws:  KeyError if a required environment variable is not set
+
+    def __init__(self):
+
+        self.user = os.environ['PG_DBUSER']
+        self.passwordFileName = os.environ['PG_1LINE_PASSFILE']
+        self.mode = os.environ[self.modeEnv]
+        self.currentDir = os.environ[self.loadDirEnv]
+        self.inputFileName = os.environ[self.dataFileEnv]
+        self.outputDir = os.environ[self.outputDirEnv]
+
+        self.bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
+        self.bcpWorkers = int(os.environ.get('PROBELOADBCPWORKERS', bcp.workers))
+
+        self.DEBUG = 0		# if 0, not in debug mode
+
+        self.diagFile = None	# diagnostic file descriptor
+        self.errorFile = None	# error file descriptor
+        self.inputFile = None	# file descriptor
+
+        self.diagFileName = ''	# diagnostic file name
+        self.errorFileName = ''	# error file name
+        self.statsFileName = ''	# statistics (JSON) file name
+        self.profFileName = ''	# cProfile statistics file name
+        self.allocFileName = ''	# memory report file name
+
+        self.outputs = {}	# table : rows.RowWriter over a bcp file or copyin.CopySink
+        self.files = {}		# extra file name : file descriptor
+
+        self.workers = int(os.environ.get('PROBELOADWORKERS', 1))
+        self.lookupConnections = int(os.environ.get('PROBELOADLOOKUPCONNECTIONS', 0))
+
+        self.backend = None		# backend.Backend of PROBELOADBACKEND; None for the server
+        self.lookupPipeline = None	# pipeline.LookupPipeline of a pipelined loader
+        self.prefetched = {}		# lineNum : what prefetchRow() returned
+
+        self.checkpointRows = int(os.environ.get('PROBELOADCHECKPOINT', 0))
+        self.checkpointFileName = ''	# checkpoint journal file name
+        self.journal = None		# checkpoint.Journal of a checkpointed load
+        self.checkpointState = None	# the checkpoint being resumed (dictionary)
+        self.reservedKeys = {}		# key attribute : first key reserved
+        self.resume = 0			# 1 if --resume
+        self.restart = 0		# 1 if --restart
+
+        self.progressInterval = int(os.environ.get('PROBELOADPROGRESS', 0))
+        self.statusFileName = os.environ.get('PROBELOADSTATUSFILE', '')
+        self.progress = None		# progress.Progress of processFile()
+        self.lineOffsets = collections.deque()	# (lineNum, bytes read) of the lines in progress
+
+        instrument.slowRows = int(os.environ.get('PROBELOADSLOWROWS', 0))
+
+        self.profiler = None		# profiling.Profiler of PROBELOAD_PROFILE
+        try:
+            self.profilePhases = profiling.phases(os.environ.get('PROBELOAD_PROFILE', ''), self.phases)
+        except ValueError as e:
+            self.usage('PROBELOAD_PROFILE names a phase %s does not have: %s' % (self.program, e))
+
+        if len(self.profilePhases) > 0:
+            self.profiler = profiling.Profiler()
+
+        self.parseOptions()
+
+    # Purpose: prints the usage message and exits
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: exits with status 1
+    # Throws:  nothing
+
+    def usage(self,
+        message		# what is wrong (string)
+        ):
+
+        usage = 'Usage: %s' % (sys.argv[0])
+        if self.parallelSafe:
+            usage = usage + ' [--workers N]'
+        if self.resumable:
+            usage = usage + ' [--resume | --restart]'
+
+        sys.stderr.write('%s\n%s\n' % (message, usage))
+        sys.exit(1)
+
+    # Purpose: process command line options
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: sets the number of validation workers (--workers)
+    #	and whether to resume from the checkpoint (--resume) or
+    #	discard it (--restart)
+    #	exits if an option is invalid
+    # Throws:  nothing
+
+    def parseOptions(self):
+
+        try:
+            options, args = getopt.getopt(sys.argv[1:], '', ['workers=', 'resume', 'restart'])
+        except getopt.GetoptError as e:
+            self.usage(str(e))
+
+        if len(args) > 0:
+            self.usage('unexpected argument: %s' % (args[0]))
+
+        for opt, arg in options:
+            if opt == '--workers':
+                try:
+                    self.workers = int(arg)
+                except ValueError:
+                    self.usage('--workers needs a number: %s' % (arg))
+            elif opt == '--resume':
+                self.resume = 1
+            elif opt == '--restart':
+                self.restart = 1
+
+        if self.workers < 1:
+            self.usage('--workers needs a number greater than 0: %d' % (self.workers))
+
+        if self.workers > 1 and not self.parallelSafe:
+            self.usage('%s does not support --workers' % (self.program))
+
+        if self.resume and not self.resumable:
+            self.usage('%s does not support --resume' % (self.program))
+
+        if self.resume and self.mode not in self.copyModes:
+            self.usage('--resume needs a copy mode (%s), not %s' % (', '.join(self.copyModes), self.mode))
+
+        if self.restart and not self.resumable:
+            self.usage('%s does not support --restart' % (self.program))
+
+        if self.restart and self.mode not in self.copyModes:
+            self.usage('--restart needs a copy mode (%s), not %s' % (', '.join(self.copyModes), self.mode))
+
+        if self.resume and self.restart:
+            self.usage('--resume and --restart cannot be used together')
+
+    # Purpose: prints error message and exits
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: exits with exit status
+    # Throws:  nothing
+
+    def exit(self,
+        status,          # numeric exit status (integer)
+        message = None   # exit message (string)
+        ):
+
+        if message is not None:
+            sys.stderr.write('\n' + str(message) + '\n')
+
+        try:
+            if self.lookupPipeline is not None:
+                self.lookupPipeline.close()
+        except:
+            pass
+
+        try:
+            logFile = sqllog.stop()
+            if logFile is not None:
+                self.diagFile = logFile
+            if self.backend is not None:
+                self.backend.writeStatistics(self.diagFile)
+            instrument.writeSlowest(self.diagFile)
+            self.diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
+            self.errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
+            self.diagFile.close()
+            self.errorFile.close()
+            self.inputFile.close()
+        except:
+            pass
+
+        try:
+            if self.backend is not None:
+                self.backend.close()
+        except:
+            pass
+
+        try:
+            if self.progress is not None:
+                self.progress.finish(status)
+        except:
+            pass
+
+        if self.profiler is not None and self.profFileName != '':
+            self.profiler.write(self.profFileName, self.allocFileName)
+
+        if self.statsFileName != '':
+            instrument.count('sql statements', sqllog.statements)
+            if self.backend is not None:
+                instrument.count('backend statements', self.backend.statements)
+            instrument.writeSummary(self.statsFileName, status)
+
+        db.useOneConnection(0)
+        sys.exit(status)
+
+    # Purpose: opens a file
+    # Returns: file descriptor
+    # Assumes: nothing
+    # Effects: exits if the file cannot be opened
+    # Throws:  nothing
+
+    def openFile(self,
+        fileName,	# file name (string)
+        fileMode = 'w'	# open() mode (string)
+        ):
+
+        try:
+            return open(fileName, fileMode)
+        except:
+            self.exit(1, 'Could not open file %s\n' % fileName)
+
+    # Purpose: is 'table' copied in over the loader's connection?
+    # Returns: 1 if the table is copied, 0 if it is bcp-ed
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def isCopied(self, table):
+
+        return self.mode in self.copyModes
+
+    # Purpose: opens the output for one table
+    # Returns: a rows.RowWriter over a copyin.CopySink if the table is
+    #	copied, else over the bcp file
+    # Assumes: nothing
+    # Effects: creates the bcp file
+    #	exits if the bcp file cannot be opened
+    # Throws:  nothing
+
+    def openOutput(self, table):
+
+        if self.isCopied(table):
+            output = copyin.CopySink(table)
+        else:
+            output = self.openFile(table + '.bcp')
+
+        return rows.RowWriter(output, rows.tableColumns.get(table))
+
+    # Purpose: process command line options
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: opens the connection and all files
+    #	exits if files cannot be opened
+    # Throws:  nothing
+
+    def init(self):
+
+        # a stand-in for the database (see probeloadlib/backend.py)
+        try:
+            self.backend = backend.install(os.environ.get('PROBELOADBACKEND', 'db'))
+        except Exception as e:
+            self.exit(1, 'Could not start the database backend (PROBELOADBACKEND): %s\n' % (e))
+
+        db.useOneConnection(1)
+        db.set_sqlUser(self.user)
+        db.set_sqlPasswordFromFile(self.passwordFileName)
+
+        self.bcpCommand = self.bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + \
+            ' %s ' + self.currentDir + ' %s "\\t" "\\n" mgd'
+
+        head, tail = os.path.split(self.inputFileName)
+
+        self.diagFileName = self.outputDir + '/' + tail + '.diagnostics'
+        self.errorFileName = self.outputDir + '/' + tail + '.error'
+        self.statsFileName = self.outputDir + '/' + tail + '.stats.json'
+        self.checkpointFileName = self.outputDir + '/' + tail + '.checkpoint.json'
+        self.profFileName = self.outputDir + '/' + tail + '.prof'
+        self.allocFileName = self.outputDir + '/' + tail + '.alloc.txt'
+
+        # the checkpoint of a load that died: its committed rows are in
+        # the database, so a fresh run would load them a second time
+        if self.resumable and self.mode in self.copyModes and not self.resume and \
+                os.path.exists(self.checkpointFileName):
+            if not self.restart:
+                self.exit(1, 'A checkpoint exists for this input file: %s\n' \
+                    'Use --resume to carry on from it, or --restart to discard it\n' \
+                    % (self.checkpointFileName))
+            checkpoint.Journal(self.checkpointFileName).remove()
+
+        # commit every PROBELOADCHECKPOINT lines (see probeloadlib/checkpoint.py)
+        if self.resumable and self.mode in self.copyModes and \
+                (self.checkpointRows > 0 or self.resume):
+            self.journal = checkpoint.Journal(self.checkpointFileName)
+
+        fileMode = 'w'
+
+        if self.resume:
+            try:
+                self.checkpointState = self.journal.read()
+            except ValueError as e:
+                self.exit(1, 'Could not read the checkpoint %s: %s\n' % (self.checkpointFileName, e))
+
+            if self.checkpointState is None:
+                self.exit(1, 'No checkpoint to resume from: %s\n' % (self.checkpointFileName))
+
+            if self.checkpointState['mode'] != self.mode or \
+                    self.checkpointState['inputSize'] != os.path.getsize(self.inputFileName):
+                self.exit(1, 'The checkpoint %s is not for this input file and mode\n' % (self.checkpointFileName))
+
+            fileMode = 'a'
+
+        self.diagFile = self.openFile(self.diagFileName, fileMode)
+        self.errorFile = self.openFile(self.errorFileName, fileMode)
+        self.inputFile = self.openFile(self.inputFileName, 'r')
+
+        for table in self.tables:
+            self.outputs[table] = self.openOutput(table)
+
+        for fileName in self.extraFiles:
+            self.files[fileName] = self.openFile(fileName, fileMode)
+
+            # drop what was written after the last checkpoint
+            if self.checkpointState is not None:
+                self.files[fileName].truncate(self.checkpointState['files'].get(fileName, 0))
+
+        # pipelined lookups on PROBELOADLOOKUPCONNECTIONS connections
+        # (see probeloadlib/pipeline.py); on the backend, if there is one
+        if self.pipelined:
+            connections = self.lookupConnections
+            if self.backend is not None and not self.backend.concurrent:
+                connections = 0
+            try:
+                self.lookupPipeline = pipeline.LookupPipeline(self.user,
+                    self.passwordFileName, connections, self.backend)
+            except Exception as e:
+                self.exit(1, 'Could not open the lookup connections: %s\n' % (e))
+
+        # Log the SQL at the PROBELOADSQLLOG level (see probeloadlib/sqllog.py)
+        # the other diagnostics are queued behind the logged SQL
+        try:
+            self.diagFile = sqllog.start(self.diagFile)
+        except ValueError:
+            self.exit(1, 'Invalid SQL log level (PROBELOADSQLLOG): %s\n' % (sqllog.level))
+
+        # time the lookups and commits (see probeloadlib/instrument.py)
+        for module, names in self.timedFunctions:
+            instrument.wrap(module, names)
+        instrument.wrap(self, self.timedMethods, self.program)
+        instrument.wrap(db, ['commit'])
+
+        self.diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
+        self.diagFile.write('Server: %s\n' % (db.get_sqlServer()))
+        self.diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
+
+        self.errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
+
+        if self.checkpointState is not None:
+            self.diagFile.write('Resuming after line %d (see %s)\n' \
+                % (self.checkpointState['line'], self.checkpointFileName))
+
+    # Purpose: verify processing mode
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: if the processing mode is not valid, exits.
+    #	else, sets DEBUG
+    # Throws:  nothing
+
+    def verifyMode(self):
+
+        if self.mode in self.previewModes:
+            self.DEBUG = 1
+        elif self.mode not in self.loadModes:
+            self.exit(1, 'Invalid Processing Mode:  %s\n' % (self.mode))
+
+    # Purpose: pre-resolve the lookups made by validateRow()
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing; see the subclasses
+    # Throws:  nothing
+
+    def resolveLookups(self):
+
+        pass
+
+    # Purpose: sets the primary key variables
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing; see the subclasses
+    # Throws:  nothing
+
+    def setPrimaryKeys(self):
+
+        pass
+
+    # Purpose: restore the primary keys of a resumed load
+    # Returns: 1 if the keys were restored, 0 if the load is not resumed
+    # Assumes: nothing
+    # Effects: sets each of keyAttributes to the next key recorded at
+    #	the checkpoint; nothing new is reserved
+    # Throws:  nothing
+
+    def restoreKeys(self):
+
+        if self.checkpointState is None:
+            return 0
+
+        for name in self.keyAttributes:
+            setattr(self, name, self.checkpointState['keys'][name])
+
+        self.reservedKeys = self.checkpointState['reserved']
+
+        return 1
+
+    # Purpose: submit the lookups of one input line ahead of validateRow()
+    # Returns: anything validateRow() needs, i.e. a dictionary of
+    #	pipeline.Pending; validateRow() finds it in 'prefetched'
+    # Assumes: the loader is pipelined
+    # Effects: queues queries on 'lookupPipeline'
+    # Throws:  nothing
+
+    def prefetchRow(self,
+        lineNum,	# line number (integer)
+        tokens		# fields of the line (list of strings)
+        ):
+
+        return None
+
+    # Purpose: submit the lookups of one input line that need the rows
+    #	of its prefetchRow() lookups, ahead of validateRow()
+    # Returns: nothing
+    # Assumes: the loader is pipelined; prefetchRow() was called for
+    #	the line 'lookupWindow' / 2 lines earlier
+    # Effects: queues queries on 'lookupPipeline'; adds them to
+    #	'prefetched' (what prefetchRow() returned)
+    # Throws:  nothing
+
+    def prefetchDependent(self,
+        lineNum,	# line number (integer)
+        tokens,		# fields of the line (list of strings)
+        prefetched	# what prefetchRow() returned for the line
+        ):
+
+        pass
+
+    # Purpose: verify one input line
+    # Returns: the row for writeRow() (dictionary), None if invalid
+    # Assumes: nothing
+    # Effects: writes to the error file if the line is invalid
+    # Throws:  nothing
+
+    def validateRow(self,
+        lineNum,	# line number (integer)
+        tokens		# fields of the line (list of strings)
+        ):
+
+        raise NotImplementedError
+
+    # Purpose: drop the repeated markers of one input line
+    # Returns: the marker keys in input order, each key once (list of integers)
+    # Assumes: nothing
+    # Effects: keeps the first of each marker; writes the others to the
+    #	error file as duplicates (the line itself is still valid)
+    # Throws:  nothing
+
+    def uniqueMarkers(self,
+        name,		# probe/primer name or ID, for the error file (string)
+        markers		# verified markers of the line (list of (markerID, markerKey))
+        ):
+
+        markerList = []
+        seen = set()
+
+        for markerID, markerKey in markers:
+
+            if markerKey in seen:
+                self.errorFile.write('Invalid Marker Duplicate:  %s, %s\n' % (name, markerID))
+                instrument.count('duplicate markers')
+                continue
+
+            seen.add(markerKey)
+            markerList.append(markerKey)
+
+        return markerList
+
+    # Purpose: write one verified row
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes the row to the table outputs
+    # Throws:  nothing
+
+    def writeRow(self,
+        row		# row returned by validateRow() (dictionary)
+        ):
+
+        raise NotImplementedError
+
+    # Purpose: verifies and writes one input line
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: see validateRow() and writeRow(); times the line for the
+    #	slowest-row report
+    # Throws:  nothing
+
+    def processRow(self,
+        lineNum,	# line number (integer)
+        tokens		# fields of the line (list of strings)
+        ):
+
+        instrument.startRow()
+        self.loadRow(self.validateRow(lineNum, tokens))
+        instrument.stopRow(lineNum)
+
+    # Purpose: writes one row returned by validateRow()
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: see writeRow(); counts the accepted and rejected rows
+    # Throws:  nothing
+
+    def loadRow(self,
+        row		# row returned by validateRow() (dictionary), or None
+        ):
+
+        # if errors, continue to next record
+        if row is None:
+            instrument.count('rows rejected')
+            return
+
+        instrument.count('rows accepted')
+        instrument.start('write bcp files')
+        self.writeRow(row)
+        instrument.stop('write bcp files')
+
+    # Purpose: the lines of the input file still to be processed
+    # Returns: generator of (line number, list of tokens)
+    # Assumes: nothing
+    # Effects: reads the input file; skips the lines committed before
+    #	the checkpoint of a resumed load
+    #	records where each line ends in the file for the progress records
+    # Throws:  nothing
+
+    def records(self):
+
+        skip = 0
+        if self.checkpointState is not None:
+            skip = self.checkpointState['line']
+
+        records = reader.RecordReader(self.inputFile, self.columns, self.exit)
+
+        for lineNum, tokens in records:
+            if lineNum <= skip:
+                instrument.count('rows committed before resume')
+                continue
+            if self.progress is not None:
+                self.lineOffsets.append((lineNum, records.bytesRead))
+            yield lineNum, tokens
+
+    # Purpose: finish a line of the input file
+    # Returns: nothing
+    # Assumes: the lines before 'lineNum' are finished
+    # Effects: counts the line in the progress records; commits at the
+    #	checkpoints (see checkpointRow())
+    # Throws:  nothing
+
+    def lineDone(self,
+        lineNum		# line just processed (integer)
+        ):
+
+        if self.progress is not None:
+            # the reader may be ahead of the line (--workers, pipelined)
+            bytesRead = 0
+            while len(self.lineOffsets) > 0 and self.lineOffsets[0][0] <= lineNum:
+                bytesRead = self.lineOffsets.popleft()[1]
+            self.progress.update(lineNum, bytesRead)
+
+        self.checkpointRow(lineNum)
+
+    # Purpose: record a checkpoint
+    # Returns: nothing
+    # Assumes: the rows of the lines up to 'lineNum' are committed
+    # Effects: writes the checkpoint journal
+    #	exits if the journal cannot be written
+    # Throws:  nothing
+
+    def writeCheckpoint(self,
+        lineNum		# last line committed (integer)
+        ):
+
+        for fileName in self.extraFiles:
+            self.files[fileName].flush()
+
+        state = {
+            'mode' : self.mode,
+            'inputFile' : self.inputFileName,
+            'inputSize' : os.path.getsize(self.inputFileName),
+            'line' : lineNum,
+            'keys' : dict([(name, getattr(self, name)) for name in self.keyAttributes]),
+            'reserved' : self.reservedKeys,
+            'files' : dict([(f, os.path.getsize(f)) for f in self.extraFiles]),
+            }
+
+        try:
+            self.journal.write(state)
+        except (IOError, OSError) as e:
+            self.exit(1, 'Could not write the checkpoint %s: %s\n' % (self.checkpointFileName, e))
+
+    # Purpose: commit the rows written so far, every 'checkpointRows' lines
+    # Returns: nothing
+    # Assumes: every table is copied
+    # Effects: copies the rows into the database, commits and records a
+    #	checkpoint; starts new outputs for the next chunk
+    #	exits if the copy fails
+    # Throws:  nothing
+
+    def checkpointRow(self,
+        lineNum		# line just processed (integer)
+        ):
+
+        if self.journal is None or self.checkpointRows < 1 or lineNum % self.checkpointRows != 0:
+            return
+
+        instrument.start('checkpoint')
+
+        for table in self.tables:
+            self.outputs[table].flush()
+
+        try:
+            self.copyOutputs([self.outputs[t].output for t in self.tables])
+        except Exception as e:
+            self.exit(1, self.copyError % (e))
+
+        db.commit()
+
+        for table in self.tables:
+            self.outputs[table].close()
+            self.outputs[table] = self.openOutput(table)
+
+        self.writeCheckpoint(lineNum)
+        instrument.count('checkpoints')
+        instrument.stop('checkpoint')
+
+    # Purpose: processes data
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: verifies and processes each line in the input file,
+    #	in 'workers' processes if --workers was given
+    #	commits every 'checkpointRows' lines of a checkpointed load
+    #	writes progress records every 'progressInterval' seconds
+    # Throws:  nothing
+
+    def processFile(self):
+
+        if self.progressInterval > 0 or self.statusFileName != '':
+            self.progress = progress.Progress(self.program, self.inputFileName, sys.stdout,
+                self.progressInterval, self.statusFileName)
+
+        # the keys the load starts with, in case it has to be resumed
+        if self.journal is not None and self.checkpointState is None:
+            self.reservedKeys = dict([(name, getattr(self, name)) for name in self.keyAttributes])
+            self.writeCheckpoint(0)
+
+        if self.workers > 1:
+            parallel.processFile(self, self.workers)
+            return
+
+        records = self.records()
+
+        if not self.pipelined:
+            for lineNum, tokens in records:
+                self.processRow(lineNum, tokens)
+                self.lineDone(lineNum)
+            return
+
+        # submit the lookups of up to 'lookupWindow' lines ahead of
+        # the line being validated, and the dependent lookups of a
+        # line half way through the window
+        submitted = collections.deque()	# lines after prefetchRow()
+        window = collections.deque()	# lines after prefetchDependent()
+        dependentDepth = self.lookupWindow / 2
+
+        for lineNum, tokens in records:
+            self.prefetched[lineNum] = self.prefetchRow(lineNum, tokens)
+            submitted.append((lineNum, tokens))
+            if len(submitted) > dependentDepth:
+                lineNum, tokens = submitted.popleft()
+                self.prefetchDependent(lineNum, tokens, self.prefetched[lineNum])
+                window.append((lineNum, tokens))
+            if len(window) > self.lookupWindow - dependentDepth:
+                lineNum, tokens = window.popleft()
+                self.processRow(lineNum, tokens)
+                self.lineDone(lineNum)
+
+        while len(submitted) > 0:
+            lineNum, tokens = submitted.popleft()
+            self.prefetchDependent(lineNum, tokens, self.prefetched[lineNum])
+            window.append((lineNum, tokens))
+
+        while len(window) > 0:
+            lineNum, tokens = window.popleft()
+            self.processRow(lineNum, tokens)
+            self.lineDone(lineNum)
+
+    # Purpose: run SQL before the tables are loaded
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing; see the subclasses
+    # Throws:  nothing
+
+    def executeSQL(self):
+
+        pass
+
+    # Purpose: copy the copied tables into the database
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: copies the rows into the database; does not commit
+    # Throws:  the database driver's error if a copy fails
+
+    def copyOutputs(self,
+        sinks		# outputs of the copied tables (list of copyin.CopySink)
+        ):
+
+        copyin.copyTables(sinks, self.diagFile)
+
+    # Purpose: close the bcp files and the extra files
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: flushes the buffered rows of every table
+    # Throws:  nothing
+
+    def closeFiles(self):
+
+        for table in self.tables:
+            if self.isCopied(table):
+                self.outputs[table].flush()
+            else:
+                self.outputs[table].close()
+
+        for fileName in self.extraFiles:
+            self.files[fileName].close()
+
+    # Purpose:  BCPs (or copies) the data into the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  runs executeSQL(), copies the copied tables and
+    #	    bcps the others into the database, unless the backend is offline
+    #	    removes the checkpoint journal of a finished load
+    #	    exits if a table cannot be loaded
+    # Throws:   nothing
+
+    def bcpFiles(self):
+
+        self.closeFiles()
+
+        if self.DEBUG:
+            return
+
+        db.commit()
+
+        self.executeSQL()
+        db.commit()
+
+        sinks = [self.outputs[t].output for t in self.tables if self.isCopied(t)]
+
+        if len(sinks) > 0:
+            try:
+                self.copyOutputs(sinks)
+            except Exception as e:
+                self.exit(1, self.copyError % (e))
+            db.commit()
+
+        scheduler = bcp.BcpScheduler(self.bcpCommand, self.diagFile, self.bcpWorkers)
+        for table in self.tables:
+            if not self.isCopied(table):
+                if self.backend is not None and self.backend.offline:
+                    self.diagFile.write('%s.bcp not loaded: no server (PROBELOADBACKEND)\n' % (table))
+                else:
+                    scheduler.add(table, table + '.bcp')
+
+        failed = scheduler.run()
+
+        if failed > 0:
+            self.exit(1, '%d table(s) did not load; see %s\n' % (failed, self.diagFileName))
+
+        db.commit()
+
+        if self.journal is not None:
+            self.journal.remove()
+
+    # Purpose: run the load
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: runs each phase under a timer, and the PROBELOAD_PROFILE
+    #	phases under the profiler, then exits
+    # Throws:  nothing
+
+    def run(self):
+
+        for phase in self.phases:
+            if phase in self.profilePhases:
+                instrument.call(phase, self.profiler.call, phase, getattr(self, phase))
+            else:
+                instrument.call(phase, getattr(self, phase))
+
+        self.exit(0)
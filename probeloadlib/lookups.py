@@ -0,0 +1,468 @@
+#
+# Module: lookups.py
+#
+# Purpose:
+#
+#	Bulk pre-resolution of the loadlib/sourceloadlib lookups made
+#	for every input row by the probe loaders.
+#
+#	The loader makes a first pass over its input file, collects the
+#	distinct values of each lookup family and hands each set to the
+#	matching resolve*() function, which issues one set-based query
+#	and keeps the hits in an in-memory dictionary.
+#
+#	The verify*() functions take the same arguments as their
+#	loadlib/sourceloadlib counterparts.  A value found in the
+#	dictionary is returned without touching the database; any other
+#	value is passed through to loadlib/sourceloadlib, so the error
+#	file receives exactly the message it always did.  Successful
+#	pass-through results are saved as well.
+#
+#	The resolve*() queries are never looser than the loadlib and
+#	sourceloadlib lookups; a value that maps to more than one key is
+#	left out of the dictionary and resolved row by row as before.
+#
+#	Source and library resolution (sourceloadlib.verifySource and
+#	verifyLibrary) cannot be done up front; their results are kept
+#	in bounded LRU caches instead.  verifySource() is keyed on the
+#	resolved vocabulary keys plus the age, so every spelling of a
+#	term that resolves to the same key shares one entry.  Only valid
+#	sources are cached, so an invalid source is still reported on
+#	every row.  writeStatistics() reports the hit and miss counts.
+#
+#	A pipelined loader (see probeloadlib/pipeline.py) that cannot
+#	resolve its values up front submits the lookup of each value with
+#	prefetch*() ahead of the row, and hands the Pending to the
+#	verify*() function.  A value the query maps to exactly one key is
+#	served from its rows; any other value is passed through as above.
+#	resolved*() give the key of such a value without passing it
+#	through, for a lookup by the key that is submitted ahead of the
+#	row as well.
+#
+#	A validation worker (see probeloadlib/parallel.py) sets
+#	'cacheOnly': a value that is not in a dictionary or cache then
+#	raises CacheMiss instead of being passed through, so the worker
+#	never touches the database and the row is validated again by the
+#	loader itself.
+#
+
+from collections import OrderedDict
+import db
+import loadlib
+import sourceloadlib
+from probeloadlib import sqlutil
+
+markerDict = {}		# MGI Marker ID : _Marker_key
+probeDict = {}		# MGI Probe ID : _Probe_key
+referenceDict = {}	# J: : _Refs_key
+userDict = {}		# login : _User_key
+logicalDBDict = {}	# logical DB name : _LogicalDB_key
+organismDict = {}	# organism : _Organism_key
+strainDict = {}		# strain : _Strain_key
+tissueDict = {}		# tissue : _Tissue_key
+genderDict = {}		# gender term : _Term_key
+cellLineDict = {}	# cell line term : _Term_key
+vectorTypeDict = {}	# vector type term : _Term_key
+segmentTypeDict = {}	# segment type term : _Term_key
+
+cacheSize = 1000	# maximum number of entries in each LRU cache
+
+probeTypeKey = '3'	# ACC_MGIType._MGIType_key of Molecular Segment
+
+cacheOnly = 0		# if 1, raise CacheMiss rather than query the database
+
+class CacheMiss(Exception):
+    pass
+
+class LRUCache(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        name,			# name used in the statistics (string)
+        maxSize = cacheSize	# maximum number of entries (integer)
+        ):
+
+        self.name = name
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Purpose: look up an entry, marking it most recently used
+    # Returns: the cached value, or None
+    # Assumes: nothing
+    # Effects: counts the hit or miss
+    # Throws:  nothing
+
+    def get(self, key):
+
+        if key in self.entries:
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            self.hits = self.hits + 1
+            return value
+
+        self.misses = self.misses + 1
+        return None
+
+    # Purpose: add an entry, dropping the least recently used if full
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def put(self, key, value):
+
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.maxSize:
+            self.entries.popitem(last = False)
+
+        self.entries[key] = value
+
+sourceCache = LRUCache('verifySource')
+libraryCache = LRUCache('verifyLibrary')
+
+markerSQL = '''
+	select a.accID as lookupValue, a._Object_key as lookupKey
+	from ACC_Accession a, MRK_Marker m
+	where a._MGIType_key = 2
+	and a._LogicalDB_key = 1
+	and a.prefixPart = 'MGI:'
+	and a.preferred = 1
+	and a._Object_key = m._Marker_key
+	and m._Organism_key = 1
+	and m._Marker_Status_key = 1
+	and a.accID in (%s)
+	'''
+
+probeSQL = '''
+	select a.accID as lookupValue, a._Object_key as lookupKey
+	from ACC_Accession a
+	where a._MGIType_key = 3
+	and a._LogicalDB_key = 1
+	and a.prefixPart = 'MGI:'
+	and a.preferred = 1
+	and a.accID in (%s)
+	'''
+
+referenceSQL = '''
+	select jnumID as lookupValue, _Refs_key as lookupKey
+	from BIB_Citation_Cache
+	where jnumID in (%s)
+	'''
+
+userSQL = '''
+	select login as lookupValue, _User_key as lookupKey
+	from MGI_User
+	where login in (%s)
+	'''
+
+logicalDBSQL = '''
+	select name as lookupValue, _LogicalDB_key as lookupKey
+	from ACC_LogicalDB
+	where name in (%s)
+	'''
+
+organismSQL = '''
+	select commonName as lookupValue, _Organism_key as lookupKey
+	from MGI_Organism
+	where commonName in (%s)
+	'''
+
+strainSQL = '''
+	select strain as lookupValue, _Strain_key as lookupKey
+	from PRB_Strain
+	where strain in (%s)
+	'''
+
+tissueSQL = '''
+	select tissue as lookupValue, _Tissue_key as lookupKey
+	from PRB_Tissue
+	where tissue in (%s)
+	'''
+
+termSQL = '''
+	select t.term as lookupValue, t._Term_key as lookupKey
+	from VOC_Term t, VOC_Vocab v
+	where v.name = '%s'
+	and v._Vocab_key = t._Vocab_key
+	and t.term in (%%s)
+	'''
+
+# Purpose: resolve a set of values with one set-based query
+# Returns: nothing
+# Assumes: 'cmd' selects the columns lookupValue and lookupKey and
+#	contains one %s for the "in (...)" list
+# Effects: adds the unambiguous hits to 'cacheDict'
+# Throws:  nothing
+
+def resolve(
+    cacheDict,	# dictionary to fill (dictionary)
+    values,	# values to resolve (set or list of strings)
+    cmd		# SQL command (string)
+    ):
+
+    values = [v for v in values if len(v) > 0 and v not in cacheDict]
+    values.sort()
+
+    for chunk in sqlutil.chunks(values):
+        found = {}
+        for r in db.sql(cmd % (sqlutil.sqlList(chunk)), 'auto'):
+            found.setdefault(r['lookupValue'], set()).add(r['lookupKey'])
+        for value in found.keys():
+            if len(found[value]) == 1:
+                cacheDict[value] = found[value].pop()
+
+def resolveMarkers(values):
+    resolve(markerDict, values, markerSQL)
+
+def resolveProbes(values):
+    resolve(probeDict, values, probeSQL)
+
+def resolveReferences(values):
+    resolve(referenceDict, values, referenceSQL)
+
+def resolveUsers(values):
+    resolve(userDict, values, userSQL)
+
+def resolveLogicalDBs(values):
+    resolve(logicalDBDict, values, logicalDBSQL)
+
+def resolveOrganisms(values):
+    resolve(organismDict, values, organismSQL)
+
+def resolveStrains(values):
+    resolve(strainDict, values, strainSQL)
+
+def resolveTissues(values):
+    resolve(tissueDict, values, tissueSQL)
+
+def resolveGenders(values):
+    resolve(genderDict, values, termSQL % ('Gender'))
+
+def resolveCellLines(values):
+    resolve(cellLineDict, values, termSQL % ('Cell Line'))
+
+def resolveVectorTypes(values):
+    resolve(vectorTypeDict, values, termSQL % ('Segment Vector Type'))
+
+def resolveSegmentTypes(values):
+    resolve(segmentTypeDict, values, termSQL % ('Segment Type'))
+
+# Purpose: submit the lookup query of one value to a pipeline
+# Returns: pipeline.Pending, or None if the value is cached or empty
+# Assumes: 'cmd' is one of the resolve*() queries
+# Effects: queues the query
+# Throws:  nothing
+
+def prefetch(
+    cacheDict,		# dictionary to search (dictionary)
+    cmd,		# SQL command (string)
+    value,		# value to look up (string)
+    lookupPipeline	# the loader's pipeline (pipeline.LookupPipeline)
+    ):
+
+    if len(value) == 0 or value in cacheDict:
+        return None
+
+    return lookupPipeline.query(cmd % (sqlutil.sqlList([value])))
+
+def prefetchMarker(markerID, lookupPipeline):
+    return prefetch(markerDict, markerSQL, markerID, lookupPipeline)
+
+def prefetchProbe(probeID, lookupPipeline):
+    return prefetch(probeDict, probeSQL, probeID, lookupPipeline)
+
+def prefetchReference(jnum, lookupPipeline):
+    return prefetch(referenceDict, referenceSQL, jnum, lookupPipeline)
+
+def prefetchUser(login, lookupPipeline):
+    return prefetch(userDict, userSQL, login, lookupPipeline)
+
+# Purpose: the key of a value, from 'cacheDict' or the rows of its
+#	prefetched query, without passing it through to loadlib
+# Returns: the key (integer), 0 if the value is not cached and the
+#	query does not map it to exactly one key
+# Assumes: nothing
+# Effects: adds an unambiguous prefetched result to 'cacheDict'
+# Throws:  the database driver's error if the prefetched query failed
+
+def resolved(
+    cacheDict,		# dictionary to search (dictionary)
+    value,		# value to look up (string)
+    pending = None	# the value's prefetch() query, or None (pipeline.Pending)
+    ):
+
+    if value not in cacheDict and pending is not None:
+        keys = set([r['lookupKey'] for r in pending.result()])
+        if len(keys) == 1:
+            cacheDict[value] = keys.pop()
+
+    return cacheDict.get(value, 0)
+
+def resolvedProbe(probeID, pending = None):
+    return resolved(probeDict, probeID, pending)
+
+def resolvedReference(jnum, pending = None):
+    return resolved(referenceDict, jnum, pending)
+
+# Purpose: serve a lookup from 'cacheDict', else from the rows of its
+#	prefetched query, else from 'verifyFunction'
+# Returns: the key returned by the lookup (integer), 0 if invalid
+# Assumes: nothing
+# Effects: adds an unambiguous prefetched or a successful pass-through
+#	result to 'cacheDict'
+#	'verifyFunction' writes to the error file if the value is invalid
+# Throws:  CacheMiss if 'cacheOnly' is set and the value is not in 'cacheDict'
+#	the database driver's error if the prefetched query failed
+
+def verify(
+    cacheDict,		# dictionary to search (dictionary)
+    verifyFunction,	# loadlib/sourceloadlib function (function)
+    value,		# value to verify (string)
+    lineNum,		# line number (integer)
+    errorFile,		# error file (file descriptor)
+    pending = None	# the value's prefetch() query, or None (pipeline.Pending)
+    ):
+
+    if resolved(cacheDict, value, pending):
+        return cacheDict[value]
+
+    if cacheOnly:
+        raise CacheMiss(value)
+
+    key = verifyFunction(value, lineNum, errorFile)
+
+    if key:
+        cacheDict[value] = key
+
+    return key
+
+def verifyMarker(markerID, lineNum, errorFile, pending = None):
+    return verify(markerDict, loadlib.verifyMarker, markerID, lineNum, errorFile, pending)
+
+def verifyProbe(probeID, lineNum, errorFile, pending = None):
+    return verify(probeDict, loadlib.verifyProbe, probeID, lineNum, errorFile, pending)
+
+# Purpose: loadlib.verifyObject() for an MGI Probe ID, served from 'probeDict'
+# Returns: the probe key (integer), 0 if invalid
+# Assumes: nothing
+# Effects: adds a valid probe to 'probeDict'
+#	loadlib writes to the error file if the probe is invalid
+# Throws:  CacheMiss if 'cacheOnly' is set and the value is not cached
+
+def verifyProbeObject(probeID, lineNum, errorFile):
+
+    if probeID in probeDict:
+        return probeDict[probeID]
+
+    if cacheOnly:
+        raise CacheMiss(probeID)
+
+    probeKey = loadlib.verifyObject(probeID, probeTypeKey, None, lineNum, errorFile)
+
+    if probeKey:
+        probeDict[probeID] = probeKey
+
+    return probeKey
+
+def verifyReference(jnum, lineNum, errorFile, pending = None):
+    return verify(referenceDict, loadlib.verifyReference, jnum, lineNum, errorFile, pending)
+
+def verifyUser(login, lineNum, errorFile, pending = None):
+    return verify(userDict, loadlib.verifyUser, login, lineNum, errorFile, pending)
+
+def verifyLogicalDB(logicalDB, lineNum, errorFile):
+    return verify(logicalDBDict, loadlib.verifyLogicalDB, logicalDB, lineNum, errorFile)
+
+def verifyOrganism(organism, lineNum, errorFile):
+    return verify(organismDict, sourceloadlib.verifyOrganism, organism, lineNum, errorFile)
+
+def verifyStrain(strain, lineNum, errorFile):
+    return verify(strainDict, sourceloadlib.verifyStrain, strain, lineNum, errorFile)
+
+def verifyTissue(tissue, lineNum, errorFile):
+    return verify(tissueDict, sourceloadlib.verifyTissue, tissue, lineNum, errorFile)
+
+def verifyGender(gender, lineNum, errorFile):
+    return verify(genderDict, sourceloadlib.verifyGender, gender, lineNum, errorFile)
+
+def verifyCellLine(cellLine, lineNum, errorFile):
+    return verify(cellLineDict, sourceloadlib.verifyCellLine, cellLine, lineNum, errorFile)
+
+def verifyVectorType(vectorType, lineNum, errorFile):
+    return verify(vectorTypeDict, sourceloadlib.verifyVectorType, vectorType, lineNum, errorFile)
+
+def verifySegmentType(segmentType, lineNum, errorFile):
+    return verify(segmentTypeDict, sourceloadlib.verifySegmentType, segmentType, lineNum, errorFile)
+
+# Purpose: sourceloadlib.verifySource(), served from 'sourceCache'
+# Returns: the source key (integer), 0 if invalid
+# Assumes: nothing
+# Effects: adds a valid source to 'sourceCache'
+#	sourceloadlib writes to the error file if the source is invalid
+# Throws:  CacheMiss if 'cacheOnly' is set and the value is not cached
+
+def verifySource(segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey,
+    genderKey, cellLineKey, age, lineNum, errorFile):
+
+    key = (segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age)
+
+    sourceKey = sourceCache.get(key)
+    if sourceKey is not None:
+        return sourceKey
+
+    if cacheOnly:
+        raise CacheMiss(key)
+
+    sourceKey = sourceloadlib.verifySource(segmentTypeKey, vectorKey, organismKey, strainKey,
+        tissueKey, genderKey, cellLineKey, age, lineNum, errorFile)
+
+    if sourceKey:
+        sourceCache.put(key, sourceKey)
+
+    return sourceKey
+
+# Purpose: sourceloadlib.verifyLibrary(), served from 'libraryCache'
+# Returns: the source key (integer), 0 if invalid
+# Assumes: nothing
+# Effects: adds a valid library to 'libraryCache'
+#	sourceloadlib writes to the error file if the library is invalid
+# Throws:  CacheMiss if 'cacheOnly' is set and the value is not cached
+
+def verifyLibrary(libraryName, lineNum, errorFile):
+
+    sourceKey = libraryCache.get(libraryName)
+    if sourceKey is not None:
+        return sourceKey
+
+    if cacheOnly:
+        raise CacheMiss(libraryName)
+
+    sourceKey = sourceloadlib.verifyLibrary(libraryName, lineNum, errorFile)
+
+    if sourceKey:
+        libraryCache.put(libraryName, sourceKey)
+
+    return sourceKey
+
+# Purpose: report the hit and miss counts of the LRU caches
+# Returns: nothing
+# Assumes: nothing
+# Effects: writes to the diagnostics file
+# Throws:  nothing
+
+def writeStatistics(
+    diagFile	# diagnostics file (file descriptor)
+    ):
+
+    for cache in (sourceCache, libraryCache):
+        diagFile.write('%s cache: %d hits, %d misses, %d entries (maximum %d)\n' \
+            % (cache.name, cache.hits, cache.misses, len(cache.entries), cache.maxSize))
+
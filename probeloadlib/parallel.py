@@ -0,0 +1,156 @@
+#
+# Module: parallel.py
+#
+# Purpose:
+#
+#	Validates the lines of an input file in a pool of worker
+#	processes (the loader's --workers option).
+#
+#	Once the lookups are resolved (see probeloadlib/lookups.py)
+#	validateRow() is parsing and dictionary lookups, so the lines are
+#	sharded across 'workers' processes.  The results are merged back
+#	in input order, and the loader itself calls writeRow() for each
+#	one, so the keys are assigned exactly as in a serial run.
+#
+#	The workers are forked from the loader and inherit its lookup
+#	dictionaries.  They run with lookups.cacheOnly set: a line whose
+#	lookups are not all cached (a new source, an invalid value, ...)
+#	is handed back and validated again by the loader, which may query
+#	the database.  The workers never touch the database.
+#
+#	The input is processed 'batchRows' lines at a time, with a new
+#	pool for every batch, so the workers of a batch also see what the
+#	loader cached while it validated the earlier batches.
+#
+#	Each worker writes its error messages and counts the instrument
+#	timers and counters of a line separately; the loader writes the
+#	messages to the error file and adds the timings and counts, in
+#	input order, so the error file is the same as in a serial run.
+#
+#	validateRow() must only read the loader's state; a loader that
+#	supports --workers sets Loader.parallelSafe.
+#
+
+import multiprocessing
+import StringIO
+import time
+from probeloadlib import instrument
+from probeloadlib import lookups
+
+batchRows = 10000	# lines validated by one pool of workers
+chunkRows = 100		# lines sent to a worker at a time
+
+workerLoader = None	# the loader, in the worker processes
+workerErrorFile = None	# the loader's error file, in the worker processes
+
+# Purpose: initialize a worker process
+# Returns: nothing
+# Assumes: the worker was forked from the loader
+# Effects: keeps the loader for validate(); turns off database lookups
+# Throws:  nothing
+
+def initWorker(
+    loader	# the loader (loader.Loader)
+    ):
+
+    global workerLoader, workerErrorFile
+
+    # validate() replaces the loader's error file; keep a reference to
+    # the inherited one so that it is never closed (and flushed again)
+    # by the worker
+    workerLoader = loader
+    workerErrorFile = loader.errorFile
+    lookups.cacheOnly = 1
+
+# Purpose: validate one line in a worker process
+# Returns: (lineNum, tokens, missed, row, error messages, timers, counters, seconds)
+#	'missed' is 1 if a lookup was not cached, and the line must be
+#	validated again by the loader
+# Assumes: initWorker() has run
+# Effects: nothing
+# Throws:  nothing
+
+def validate(
+    line	# (lineNum, tokens)
+    ):
+
+    lineNum, tokens = line
+    startTime = time.time()
+
+    errorFile = StringIO.StringIO()
+    workerLoader.errorFile = errorFile
+    instrument.timers.clear()
+    instrument.counters.clear()
+
+    try:
+        row = workerLoader.validateRow(lineNum, tokens)
+    except lookups.CacheMiss:
+        return (lineNum, tokens, 1, None, '', {}, {}, 0.0)
+
+    return (lineNum, tokens, 0, row, errorFile.getvalue(),
+        dict(instrument.timers), dict(instrument.counters), time.time() - startTime)
+
+# Purpose: group the lines of the input file into batches
+# Returns: generator of lists of (lineNum, tokens)
+# Assumes: nothing
+# Effects: reads the input file
+# Throws:  nothing
+
+def batches(records):
+
+    batch = []
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batchRows:
+            yield batch
+            batch = []
+
+    if len(batch) > 0:
+        yield batch
+
+# Purpose: process the input file with 'workers' validation processes
+# Returns: nothing
+# Assumes: the loader has resolved its lookups
+# Effects: writes each valid row in input order (see Loader.loadRow())
+#	and commits at the loader's checkpoints
+# Throws:  nothing
+
+def processFile(
+    loader,	# the loader (loader.Loader)
+    workers	# number of worker processes (integer)
+    ):
+
+    for batch in batches(loader.records()):
+
+        # nothing buffered may be inherited by the workers
+        loader.errorFile.flush()
+        loader.diagFile.flush()
+
+        pool = multiprocessing.Pool(workers, initWorker, (loader,))
+
+        try:
+            for lineNum, tokens, missed, row, errors, timers, counters, seconds in \
+                    pool.imap(validate, batch, chunkRows):
+
+                if missed:
+                    instrument.count('rows validated serially')
+                    loader.processRow(lineNum, tokens)
+                    loader.lineDone(lineNum)
+                    continue
+
+                loader.errorFile.write(errors)
+
+                # the row's time is the worker's plus the loader's
+                instrument.startRow()
+                for name in timers.keys():
+                    instrument.add(name, timers[name][1], timers[name][0])
+                for name in counters.keys():
+                    instrument.count(name, counters[name])
+
+                loader.loadRow(row)
+                instrument.stopRow(lineNum, seconds)
+                loader.lineDone(lineNum)
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,230 @@
+#
+# Module: pipeline.py
+#
+# Purpose:
+#
+#	Pipelined lookup queries for the lookups a loader cannot resolve
+#	up front (see probeloadlib/lookups.py) and makes row by row.
+#
+#	A LookupPipeline owns a small pool of database connections of
+#	its own, each served by a thread.  The loader submits the lookup
+#	queries of the rows ahead of the one it is validating (see
+#	Loader.prefetchRow()); the threads run them while the loader
+#	works, so the round trips to the database overlap with each other
+#	and with the row processing instead of adding up one by one.
+#
+#	query() returns a Pending; its result() waits for the rows, in
+#	the form db.sql(cmd, 'auto') returns them.  A pipeline with no
+#	connections runs each query with db.sql() when its result is
+#	asked for, exactly as the loader did before.
+#
+#	The pipeline's connections are separate from the loader's: they
+#	see only committed data and must be used for read-only lookups.
+#	Their queries are not written to the SQL log.
+#
+#	Given a backend that can serve several threads at once (see
+#	probeloadlib/backend.py), the threads run the queries on the
+#	backend instead of on connections of their own.
+#
+# Usage:
+#
+#	lookupPipeline = pipeline.LookupPipeline(user, passwordFileName, 4)
+#	pending = lookupPipeline.query('select ...')
+#	...
+#	results = pending.result()
+#	...
+#	lookupPipeline.close()
+#
+
+import threading
+import time
+import db
+from probeloadlib import instrument
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+class Pending(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        cmd		# SQL command (string)
+        ):
+
+        self.cmd = cmd
+        self.rows = None
+        self.error = None
+        self.done = threading.Event()
+
+    # Purpose: the rows of the query, waiting for them if need be
+    # Returns: list of dictionaries, as db.sql(cmd, 'auto')
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  the database driver's error if the query failed
+
+    def result(self):
+
+        if not self.done.isSet():
+            startTime = time.time()
+            self.done.wait()
+            instrument.add('lookup pipeline wait', time.time() - startTime)
+
+        if self.error is not None:
+            raise self.error
+
+        return self.rows
+
+class Immediate(Pending):
+
+    # Purpose: the rows of the query, run with db.sql()
+    # Returns: list of dictionaries
+    # Assumes: nothing
+    # Effects: runs the query on the loader's connection the first time
+    # Throws:  the database driver's error if the query fails
+
+    def result(self):
+
+        if self.rows is None:
+            self.rows = db.sql(self.cmd, 'auto')
+
+        return self.rows
+
+class LookupPipeline(object):
+
+    # Purpose: constructor; opens the connections and starts the threads
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: opens 'connections' database connections
+    # Throws:  the database driver's error if a connection cannot be opened
+
+    def __init__(self,
+        user,			# database user (string)
+        passwordFileName,	# file holding the password (string)
+        connections = 0,	# number of connections; 0 to use db.sql() (integer)
+        backend = None		# backend.Backend to run the queries on, or None
+        ):
+
+        self.requests = queue.Queue()
+        self.connections = []
+        self.threads = []
+
+        if connections < 1:
+            return
+
+        if backend is None:
+            import psycopg2
+
+            passwordFile = open(passwordFileName, 'r')
+            password = passwordFile.readline().strip()
+            passwordFile.close()
+
+        for i in range(connections):
+            if backend is None:
+                connection = psycopg2.connect(host = db.get_sqlServer(),
+                    database = db.get_sqlDatabase(), user = user, password = password)
+                connection.autocommit = True
+                self.connections.append(connection)
+                execute = self.__cursorQuery(connection.cursor())
+            else:
+                execute = self.__backendQuery(backend)
+
+            thread = threading.Thread(target = self.__run, args = (execute,))
+            thread.setDaemon(1)
+            thread.start()
+            self.threads.append(thread)
+
+    # Purpose: a function running a query on a cursor of its own
+    # Returns: function of the SQL command returning its rows
+    # Assumes: the function is only called by one thread
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __cursorQuery(self, cursor):
+
+        def execute(cmd):
+            cursor.execute(cmd)
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, r)) for r in cursor.fetchall()]
+
+        return execute
+
+    # Purpose: a function running a query on the backend
+    # Returns: function of the SQL command returning its rows
+    # Assumes: the backend can serve several threads at once
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __backendQuery(self, backend):
+
+        def execute(cmd):
+            return backend.sql(cmd, 'auto')
+
+        return execute
+
+    # Purpose: runs the queued queries
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: fills in each Pending and marks it done
+    # Throws:  nothing
+
+    def __run(self,
+        execute		# function of the SQL command returning its rows
+        ):
+
+        while 1:
+            pending = self.requests.get()
+
+            if pending is None:
+                break
+
+            try:
+                pending.rows = execute(pending.cmd)
+            except Exception as e:
+                pending.error = e
+
+            pending.done.set()
+
+    # Purpose: submit a lookup query
+    # Returns: a Pending for its rows
+    # Assumes: 'cmd' only reads the database
+    # Effects: queues the query for the threads
+    # Throws:  nothing
+
+    def query(self,
+        cmd		# SQL command (string)
+        ):
+
+        if len(self.threads) == 0:
+            return Immediate(cmd)
+
+        pending = Pending(cmd)
+        instrument.count('lookup pipeline queries')
+        self.requests.put(pending)
+        return pending
+
+    # Purpose: stop the threads and close the connections
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: waits for the queued queries
+    # Throws:  nothing
+
+    def close(self):
+
+        for thread in self.threads:
+            self.requests.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+        for connection in self.connections:
+            connection.close()
+
+        self.threads = []
+        self.connections = []
@@ -0,0 +1,173 @@
+#
+# Module: profiling.py
+#
+# Purpose:
+#
+#	cProfile and memory profiling of the phases of a load, switched
+#	on with PROBELOAD_PROFILE:
+#
+#		(unset), 0 or off	no profiling (the default)
+#		1, on or all		profile every phase
+#		phase,phase,...		profile the named phases, i.e.
+#					processFile,bcpFiles
+#
+#	The profiled phases run under one cProfile.Profile, written at
+#	the end of the load next to the diagnostics file:
+#
+#		<input file>.prof	cProfile statistics (see pstats)
+#		<input file>.alloc.txt	memory report of each phase
+#
+#	The memory report lists, for each phase, the memory allocated by
+#	the phase and still held when it ended, with the source lines
+#	that hold the most (tracemalloc).  Where tracemalloc is not
+#	available (Python 2) it lists the peak RSS of the process before
+#	and after the phase instead (resource.getrusage()).
+#
+#	A phase that is not profiled runs exactly as before.
+#
+# Usage:
+#
+#	profiler = profiling.Profiler()
+#	profiler.call('processFile', processFile)
+#	...
+#	profiler.write('mydata.txt.prof', 'mydata.txt.alloc.txt')
+#
+
+import cProfile
+import resource
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+topAllocations = 20	# source lines listed for each phase
+
+# Purpose: the phases to profile
+# Returns: list of phase names
+# Assumes: nothing
+# Effects: nothing
+# Throws:  ValueError if 'spec' names a phase the loader does not have
+
+def phases(
+    spec,		# PROBELOAD_PROFILE (string)
+    loaderPhases	# the loader's phases (list of strings)
+    ):
+
+    if spec in ('', '0', 'off'):
+        return []
+
+    if spec in ('1', 'on', 'all'):
+        return list(loaderPhases)
+
+    names = [name.strip() for name in spec.split(',')]
+
+    for name in names:
+        if name not in loaderPhases:
+            raise ValueError(name)
+
+    return names
+
+class Profiler(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self):
+
+        self.profile = cProfile.Profile()
+        self.report = []	# lines of the memory report
+        self.running = None	# (phase, peak RSS before it) of the running phase
+
+    # Purpose: run one phase under the profiler
+    # Returns: the phase's return value
+    # Assumes: nothing
+    # Effects: adds the phase to the profile and the memory report
+    # Throws:  whatever the phase throws
+
+    def call(self,
+        name,		# phase name (string)
+        function	# the phase (function)
+        ):
+
+        if tracemalloc is not None:
+            tracemalloc.start()
+
+        self.running = (name, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        self.profile.enable()
+
+        try:
+            return function()
+        finally:
+            self.stop()
+
+    # Purpose: stop profiling the running phase
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: adds the phase to the memory report
+    # Throws:  nothing
+
+    def stop(self):
+
+        self.profile.disable()
+
+        if self.running is None:
+            return
+
+        name, rssBefore = self.running
+        self.running = None
+
+        rssAfter = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        self.report.append('%s: peak RSS %d KB before, %d KB after (%+d KB)\n' \
+            % (name, rssBefore, rssAfter, rssAfter - rssBefore))
+
+        if tracemalloc is None:
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')
+        tracemalloc.stop()
+
+        self.report.append('    allocated and held: %.1f KB, peak %.1f KB\n' % (current / 1024.0, peak / 1024.0))
+
+        for stat in statistics[:topAllocations]:
+            frame = stat.traceback[0]
+            self.report.append('    %10.1f KB %8d blocks  %s:%d\n' \
+                % (stat.size / 1024.0, stat.count, frame.filename, frame.lineno))
+
+    # Purpose: write the profile and the memory report
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: creates the two files; a phase still running (the load
+    #	is exiting from it) is stopped first
+    # Throws:  nothing; a file that cannot be written is reported on stderr
+
+    def write(self,
+        profFileName,	# cProfile statistics file name (string)
+        reportFileName	# memory report file name (string)
+        ):
+
+        self.stop()
+
+        try:
+            self.profile.dump_stats(profFileName)
+        except IOError:
+            sys.stderr.write('Could not write file %s\n' % (profFileName))
+
+        if tracemalloc is None:
+            heading = 'Memory by phase (peak RSS; tracemalloc is not available)\n\n'
+        else:
+            heading = 'Memory by phase (tracemalloc: top %d source lines by size held)\n\n' % (topAllocations)
+
+        try:
+            reportFile = open(reportFileName, 'w')
+            reportFile.write(heading)
+            reportFile.write(''.join(self.report))
+            reportFile.close()
+        except IOError:
+            sys.stderr.write('Could not write file %s\n' % (reportFileName))
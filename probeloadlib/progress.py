@@ -0,0 +1,209 @@
+#
+# Module: progress.py
+#
+# Purpose:
+#
+#	Progress records of a running load (Loader.processFile()).
+#
+#	Every PROBELOADPROGRESS seconds the loader writes a record to its
+#	log (standard output, which the .csh wrappers append to the log
+#	file):
+#
+#		Progress probeload: line 12000 (35.2% of the file), 11950
+#		accepted, 50 rejected, 850.3 rows/sec, ETA 0:03:10
+#
+#	The rows/sec are those of the last interval (in the last record,
+#	written when the loader exits, those of the whole file); the ETA
+#	assumes the rest of the input file is read at the average rate
+#	(bytes per second) so far.
+#
+#	If PROBELOADSTATUSFILE is set, the same figures are kept in that
+#	file as a JSON document, with the state of the load ('running',
+#	'done' or 'failed') and the time of the last update, for a cron
+#	job to poll:  a 'running' load whose status has not been updated
+#	for a few intervals is stalled.  The file is written to a
+#	temporary file and renamed, so it is never read half written.
+#
+# Usage:
+#
+#	progress = progress.Progress('probeload', inputFileName, sys.stdout, 60, '')
+#	progress.update(lineNum, bytesRead)
+#	...
+#	progress.finish(0)
+#
+
+import json
+import os
+import time
+from probeloadlib import instrument
+
+class Progress(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes the status file, if any
+    # Throws:  nothing
+
+    def __init__(self,
+        program,		# program name (string)
+        inputFileName,		# input file name (string)
+        logFile,		# log (file descriptor)
+        interval,		# seconds between records; 0 for none (integer)
+        statusFileName		# status file name; '' for none (string)
+        ):
+
+        self.program = program
+        self.inputFileName = inputFileName
+        self.logFile = logFile
+        self.interval = interval
+        self.statusFileName = statusFileName
+
+        self.totalBytes = os.path.getsize(inputFileName)
+        self.startTime = time.time()
+        self.startBytes = None	# bytes read before the first line processed
+        self.bytesRead = 0
+        self.lineNum = 0	# last line processed
+        self.lines = 0		# lines processed
+        self.lineTime = self.startTime	# time the last line was processed
+        self.lastTime = self.startTime	# time of the last record
+        self.lastLines = 0
+
+        # seconds between updates of the log and the status file; with
+        # no log records the status file is updated every minute
+        if interval > 0:
+            self.every = interval
+        else:
+            self.every = 60
+
+        self.writeStatus('running', 0.0, None)
+
+    # Purpose: count one processed line
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes a record every 'interval' seconds
+    # Throws:  nothing
+
+    def update(self,
+        lineNum,	# line processed (integer)
+        bytesRead	# bytes of the input file read up to the end of the line (integer)
+        ):
+
+        if self.startBytes is None:
+            self.startBytes = bytesRead
+
+        self.lineNum = lineNum
+        self.bytesRead = bytesRead
+        self.lines = self.lines + 1
+
+        now = time.time()
+        self.lineTime = now
+
+        if now - self.lastTime >= self.every:
+            self.report(now, 'running', (self.lines - self.lastLines) / (now - self.lastTime))
+
+    # Purpose: write a progress record
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the log and the status file
+    # Throws:  nothing
+
+    def report(self,
+        now,		# time of the record (float)
+        state,		# 'running', 'done' or 'failed' (string)
+        rowsPerSecond	# rows/sec to report (float)
+        ):
+
+        eta = None
+        if self.startBytes is not None and self.bytesRead > self.startBytes:
+            eta = (now - self.startTime) * (self.totalBytes - self.bytesRead) / (self.bytesRead - self.startBytes)
+
+        if self.interval > 0:
+            if eta is None:
+                etaText = 'unknown'
+            else:
+                etaText = '%d:%02d:%02d' % (eta / 3600, eta % 3600 / 60, eta % 60)
+
+            self.logFile.write('Progress %s: line %d (%.1f%% of the file), %d accepted, %d rejected, ' \
+                '%.1f rows/sec, ETA %s\n' % (self.program, self.lineNum, self.percent(),
+                instrument.counters.get('rows accepted', 0), instrument.counters.get('rows rejected', 0),
+                rowsPerSecond, etaText))
+            self.logFile.flush()
+
+        self.writeStatus(state, rowsPerSecond, eta)
+
+        self.lastTime = now
+        self.lastLines = self.lines
+
+    # Purpose: the part of the input file read
+    # Returns: percent (float)
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def percent(self):
+
+        if self.totalBytes == 0:
+            return 100.0
+
+        return 100.0 * self.bytesRead / self.totalBytes
+
+    # Purpose: write the status file
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: replaces the status file, if there is one
+    # Throws:  nothing; a status file that cannot be written is skipped
+
+    def writeStatus(self,
+        state,		# 'running', 'done' or 'failed' (string)
+        rowsPerSecond,	# rows/sec of the last interval (float)
+        eta		# seconds to the end of the file, or None (float)
+        ):
+
+        if self.statusFileName == '':
+            return
+
+        status = {
+            'program' : self.program,
+            'inputFile' : self.inputFileName,
+            'pid' : os.getpid(),
+            'state' : state,
+            'line' : self.lineNum,
+            'percent' : round(self.percent(), 1),
+            'rowsAccepted' : instrument.counters.get('rows accepted', 0),
+            'rowsRejected' : instrument.counters.get('rows rejected', 0),
+            'rowsPerSecond' : round(rowsPerSecond, 1),
+            'etaSeconds' : None if eta is None else int(eta),
+            'elapsed' : round(time.time() - self.startTime, 1),
+            'updated' : time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+
+        tmpFileName = self.statusFileName + '.tmp'
+
+        try:
+            statusFile = open(tmpFileName, 'w')
+            json.dump(status, statusFile, indent = 1, sort_keys = True)
+            statusFile.write('\n')
+            statusFile.close()
+            os.rename(tmpFileName, self.statusFileName)
+        except (IOError, OSError):
+            pass
+
+    # Purpose: write the last record of the load
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the log and the status file
+    # Throws:  nothing
+
+    def finish(self,
+        status		# the loader's exit status (integer)
+        ):
+
+        rowsPerSecond = 0.0
+        if self.lineTime > self.startTime:
+            rowsPerSecond = self.lines / (self.lineTime - self.startTime)
+
+        if status == 0:
+            self.report(time.time(), 'done', rowsPerSecond)
+        else:
+            self.report(time.time(), 'failed', rowsPerSecond)
@@ -0,0 +1,63 @@
+#
+# Module: reader.py
+#
+# Purpose:
+#
+#	Streaming reader for the tab-delimited input files of the
+#	probe loaders.
+#
+#	Lines are read from the file one at a time, so memory use does
+#	not depend on the size of the input file.  Each line is split
+#	into its tokens and checked for the number of columns the loader
+#	expects; a short line is reported through the loader's exit()
+#	function exactly as the loaders always have:
+#
+#		Invalid Line (lineNum): line
+#
+# Usage:
+#
+#	for lineNum, tokens in reader.RecordReader(inputFile, 5, exit):
+#	    probeID = tokens[0]
+#	    ...
+#
+
+class RecordReader(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        inputFile,	# input file (file descriptor)
+        columns,	# minimum number of columns per line (integer)
+        exit		# the loader's exit function (function)
+        ):
+
+        self.inputFile = inputFile
+        self.columns = columns
+        self.exit = exit
+        self.lineNum = 0	# number of the last line read
+        self.bytesRead = 0	# bytes read up to the end of the last line
+
+    # Purpose: iterate over the records of the input file
+    # Returns: generator of (line number, list of tokens)
+    # Assumes: nothing
+    # Effects: reads the input file
+    #	calls exit() if a line has fewer than 'columns' columns
+    # Throws:  nothing
+
+    def __iter__(self):
+
+        for line in self.inputFile:
+
+            self.lineNum = self.lineNum + 1
+            self.bytesRead = self.bytesRead + len(line)
+            tokens = line.rstrip('\n').split('\t')
+
+            if len(tokens) < self.columns:
+                self.exit(1, 'Invalid Line (%d): %s\n' % (self.lineNum, line))
+
+            yield self.lineNum, tokens
+
@@ -0,0 +1,79 @@
+#
+# Module: replace.py
+#
+# Purpose:
+#
+#	Replaces the rows that a load owns in a table (all of the
+#	PRB_Notes of a probe, ...) in one transaction:
+#
+#		1. the keys are staged in a temporary table
+#		   (see probeloadlib/staging.py)
+#		2. one delete, joined to the staged keys, removes the
+#		   old rows
+#		3. the new rows are copied in from a copyin.CopySink
+#
+#	The caller commits, so the old rows are never gone without the
+#	new rows being there.
+#
+# Usage:
+#
+#	notesFile = copyin.CopySink('PRB_Notes')
+#	...
+#	replace.replaceRows('PRB_Notes', ['_Probe_key'], [(probeKey,), ...], notesFile, diagFile)
+#	db.commit()
+#
+#	replaceProbeMarkers() is the PRB_Marker stage shared by
+#	probemarker.py and probeextras.py: the (probe, marker) pairs are
+#	replaced, so reloading an association updates it rather than
+#	adding a duplicate.
+#
+
+import db
+from probeloadlib import copyin
+from probeloadlib import staging
+
+deleteSQL = '''delete from %s t
+	using %s s
+	where %s'''
+
+# Purpose: replace the rows of 'table' that match 'keys'
+# Returns: nothing
+# Assumes: the loader is using db.useOneConnection(1)
+# Effects: deletes the rows of 'table' whose 'keyColumns' match one of
+#	'keys' and copies in the rows of 'sink'; does not commit
+#	writes the delete and the copy to the diagnostics file
+# Throws:  the database driver's error if the copy fails
+
+def replaceRows(
+    table,		# table name (string)
+    keyColumns,		# columns the rows are replaced by (list of strings)
+    keys,		# key values whose rows are replaced (list of tuples of integers)
+    sink,		# new rows (copyin.CopySink)
+    diagFile		# diagnostics file (file descriptor)
+    ):
+
+    stageName = '%s_replace' % (table.lower())
+
+    if len(keys) > 0:
+        staging.stageTable(stageName,
+            ', '.join(['%s int not null' % (c) for c in keyColumns]), keys)
+        cmd = deleteSQL % (table, stageName,
+            '\n\tand '.join(['t.%s = s.%s' % (c, c) for c in keyColumns]))
+        diagFile.write('%s\n' % (cmd))
+        db.sql(cmd, None)
+
+    copyin.copyTables([sink], diagFile)
+
+# Purpose: replace probe/marker associations
+# Returns: nothing
+# Assumes: the loader is using db.useOneConnection(1)
+# Effects: see replaceRows()
+# Throws:  the database driver's error if the copy fails
+
+def replaceProbeMarkers(
+    pairs,		# (_Probe_key, _Marker_key) pairs (list of tuples)
+    sink,		# new PRB_Marker rows (copyin.CopySink)
+    diagFile		# diagnostics file (file descriptor)
+    ):
+
+    replaceRows('PRB_Marker', ['_Probe_key', '_Marker_key'], pairs, sink, diagFile)
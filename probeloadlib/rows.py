@@ -0,0 +1,125 @@
+#
+# Module: rows.py
+#
+# Purpose:
+#
+#	Formats and buffers the rows written to a table output (a bcp
+#	file or a copyin.CopySink).
+#
+#	The columns of each table are declared once in 'tableColumns'.
+#	A RowWriter is built from them when the output is opened; each
+#	row is then a tuple of values formatted with one join (None is
+#	written as an empty column, as mgi_utils.prvalue() does), and the
+#	rows are handed to the output 'blockRows' at a time, so a load
+#	makes one write call per block instead of one per row.
+#
+#	A row with the wrong number of values raises ValueError, so a
+#	missing or extra column is caught when the row is written rather
+#	than by bcp.
+#
+# Usage:
+#
+#	probeFile = rows.RowWriter(open('PRB_Probe.bcp', 'w'), rows.tableColumns['PRB_Probe'])
+#	probeFile.row((probeKey, name, ...))
+#	probeFile.close()
+#
+#	RowWriter.write() takes an already formatted (tab-delimited,
+#	newline-terminated) string, as a bcp file does.
+#
+
+blockRows = 4096	# rows buffered before they are written to the output
+
+tableColumns = {
+    'PRB_Probe' : ['_Probe_key', 'name', 'derivedFrom', '_Source_key', '_Vector_key',
+        '_SegmentType_key', 'primer1sequence', 'primer2sequence', 'regionCovered',
+        'insertSite', 'insertSize', 'productSize',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'PRB_Marker' : ['_Probe_key', '_Marker_key', '_Refs_key', 'relationship',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'PRB_Reference' : ['_Reference_key', '_Probe_key', '_Refs_key', 'hasRmap', 'hasSequence',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'PRB_Alias' : ['_Alias_key', '_Reference_key', 'alias',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'PRB_Notes' : ['_Probe_key', 'note', 'creation_date', 'modification_date'],
+    'ACC_Accession' : ['_Accession_key', 'accID', 'prefixPart', 'numericPart',
+        '_LogicalDB_key', '_Object_key', '_MGIType_key', 'private', 'preferred',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'ACC_AccessionReference' : ['_Accession_key', '_Refs_key',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    }
+
+class RowWriter(object):
+
+    # Purpose: constructor
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        output,			# bcp file or copyin.CopySink
+        columns = None		# column names (list of strings); None if unknown
+        ):
+
+        self.output = output
+        self.columns = columns
+        self.pending = []
+
+        if columns is None:
+            self.width = None
+        else:
+            self.width = len(columns)
+
+    # Purpose: add one row
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes a block of rows to the output every 'blockRows' rows
+    # Throws:  ValueError if the row does not have one value per column
+
+    def row(self,
+        values		# column values (tuple)
+        ):
+
+        if self.width is not None and len(values) != self.width:
+            raise ValueError('expected %d columns, got %d: %s' % (self.width, len(values), values))
+
+        self.pending.append('\t'.join(['' if v is None else str(v) for v in values]) + '\n')
+
+        if len(self.pending) >= blockRows:
+            self.flush()
+
+    # Purpose: add formatted row(s)
+    # Returns: nothing
+    # Assumes: 'data' is tab-delimited and newline-terminated
+    # Effects: see row()
+    # Throws:  nothing
+
+    def write(self, data):
+
+        self.pending.append(data)
+
+        if len(self.pending) >= blockRows:
+            self.flush()
+
+    # Purpose: hand the buffered rows to the output
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes the buffered rows to the output
+    # Throws:  nothing
+
+    def flush(self):
+
+        if len(self.pending) > 0:
+            self.output.write(''.join(self.pending))
+            self.pending = []
+
+    # Purpose: flush and close the output
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: see flush()
+    # Throws:  nothing
+
+    def close(self):
+
+        self.flush()
+        self.output.close()
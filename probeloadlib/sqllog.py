@@ -0,0 +1,204 @@
+#
+# Module: sqllog.py
+#
+# Purpose:
+#
+#	SQL logging for the probe loaders, in place of
+#	db.set_sqlLogFunction(db.sqlLogAll).
+#
+#	The level is set by PROBELOADSQLLOG:
+#
+#		all		log every statement (the default; as before)
+#		sample:N	log every Nth statement
+#		summary		log nothing but the number of statements
+#		off		log nothing
+#
+#	Logged statements are formatted by db.sqlLogAll() as before, but
+#	are handed to a background thread that writes them to the log
+#	file in batches, so the loader does not wait on the log I/O.
+#
+#	start() returns the file the loader writes the rest of its
+#	diagnostics to: the writer itself, so that they are queued
+#	behind the statements logged before them and the file stays in
+#	time order (at level 'off', the log file).  The writer's flush()
+#	waits for everything queued to be written.  stop() writes what
+#	is still queued (and, at every level but 'off', the statement
+#	count), and returns the log file for what is written after it.
+#
+# Usage:
+#
+#	diagFile = sqllog.start(diagFile)
+#	...
+#	diagFile = sqllog.stop() or diagFile
+#	diagFile.close()
+#
+
+import os
+import threading
+import db
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+level = os.environ.get('PROBELOADSQLLOG', 'all')
+
+batchSize = 1000	# maximum number of log entries written at once
+
+writer = None		# LogWriter of the running log
+sampleEvery = 1		# log every Nth statement; 0 if none are logged
+statements = 0		# number of statements executed
+logged = 0		# number of statements logged
+
+class LogWriter(object):
+
+    # Purpose: constructor; starts the writer thread
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def __init__(self,
+        logFile		# log file (file descriptor)
+        ):
+
+        self.logFile = logFile
+        self.entries = queue.Queue()
+        self.thread = threading.Thread(target = self.__run)
+        self.thread.setDaemon(1)
+        self.thread.start()
+
+    # Purpose: queue data for the log file
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: nothing
+    # Throws:  nothing
+
+    def write(self, data):
+
+        self.entries.put(data)
+
+    # Purpose: wait for the queued data to be written
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: flushes the log file
+    # Throws:  nothing
+
+    def flush(self):
+
+        self.entries.join()
+        self.logFile.flush()
+
+    # Purpose: write the queued data and stop the thread
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the log file
+    # Throws:  nothing
+
+    def close(self):
+
+        self.entries.put(None)
+        self.thread.join()
+
+    # Purpose: write queued data to the log file (in the writer thread)
+    # Returns: nothing
+    # Assumes: nothing
+    # Effects: writes to the log file
+    # Throws:  nothing
+
+    def __run(self):
+
+        done = 0
+
+        while not done:
+            batch = [self.entries.get()]
+            while len(batch) < batchSize:
+                try:
+                    batch.append(self.entries.get_nowait())
+                except queue.Empty:
+                    break
+
+            entries = len(batch)
+
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                done = 1
+
+            self.logFile.write(''.join(batch))
+
+            for i in range(entries):
+                self.entries.task_done()
+
+        self.logFile.flush()
+
+# Purpose: the function installed with db.set_sqlLogFunction()
+# Returns: nothing
+# Assumes: start() has been called
+# Effects: counts the statement; logs it through db.sqlLogAll()
+#	if the level asks for it
+# Throws:  nothing
+
+def logStatement(*args):
+
+    global statements, logged
+
+    statements = statements + 1
+
+    if sampleEvery > 0 and (statements - 1) % sampleEvery == 0:
+        logged = logged + 1
+        db.sqlLogAll(*args)
+
+# Purpose: start SQL logging at the PROBELOADSQLLOG level
+# Returns: the file to write the other diagnostics to (file descriptor)
+# Assumes: nothing
+# Effects: installs logStatement() as the db module's SQL log function
+#	and points the db module's log at the background writer
+# Throws:  ValueError if PROBELOADSQLLOG is not a valid level
+
+def start(
+    logFile	# log file (file descriptor)
+    ):
+
+    global writer, sampleEvery
+
+    if level == 'all':
+        sampleEvery = 1
+    elif level in ('summary', 'off'):
+        sampleEvery = 0
+    elif level.startswith('sample:') and level[7:].isdigit() and int(level[7:]) > 0:
+        sampleEvery = int(level[7:])
+    else:
+        raise ValueError(level)
+
+    db.set_sqlLogFunction(logStatement)
+
+    if level == 'off':
+        return logFile
+
+    writer = LogWriter(logFile)
+    db.set_sqlLogFD(writer)
+
+    return writer
+
+# Purpose: stop SQL logging
+# Returns: the log file, or None if there was no writer
+# Assumes: nothing
+# Effects: writes the queued data and the statement count
+#	to the log file
+# Throws:  nothing
+
+def stop():
+
+    global writer
+
+    if writer is None:
+        return None
+
+    logFile = writer.logFile
+
+    writer.write('\nSQL log level: %s; %d statement(s) executed, %d logged\n' % (level, statements, logged))
+    writer.close()
+    writer = None
+
+    return logFile
@@ -0,0 +1,61 @@
+#
+# Module: sqlutil.py
+#
+# Purpose:
+#
+#	Helpers for building the set-based SQL statements used by the
+#	probe loaders.
+#
+
+chunkSize = 5000	# maximum number of values in one "in (...)" list
+
+# Purpose: quote a value for use as an SQL string literal
+# Returns: the quoted value (string)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def quote(
+    value	# value to quote (string)
+    ):
+
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Purpose: build the body of an SQL "in (...)" list of string literals
+# Returns: comma-separated list of quoted values (string)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def sqlList(
+    values	# values to quote (list of strings)
+    ):
+
+    return ','.join(map(quote, values))
+
+# Purpose: build the body of an SQL "in (...)" list of integer keys
+# Returns: comma-separated list of keys (string)
+# Assumes: nothing
+# Effects: nothing
+# Throws:  ValueError if a value is not an integer
+
+def keyList(
+    values	# keys (list of integers)
+    ):
+
+    return ','.join([str(int(v)) for v in values])
+
+# Purpose: split a list of values into lists of at most 'size' values
+# Returns: generator of lists
+# Assumes: nothing
+# Effects: nothing
+# Throws:  nothing
+
+def chunks(
+    values,		# values to split (list)
+    size = chunkSize	# maximum length of each chunk (integer)
+    ):
+
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
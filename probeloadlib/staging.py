@@ -0,0 +1,53 @@
+#
+# Module: staging.py
+#
+# Purpose:
+#
+#	Temporary tables for set-based SQL.
+#
+#	Instead of building one update/delete statement per input row,
+#	a loader stages the keys of all its rows in a temporary table
+#	and joins that table into a few set-based statements:
+#
+#		staging.stageTable('probeassay_merge',
+#			'fromKey int, toKey int, refsKey int', rows)
+#		db.sql("""update GXD_ProbePrep p set _Probe_key = m.toKey
+#			from probeassay_merge m
+#			where p._Probe_key = m.fromKey""", None)
+#
+#	The rows are copied in with "copy ... from stdin" over the
+#	loader's connection.  A temporary table lives until the
+#	connection is closed, so the loader must use
+#	db.useOneConnection(1).
+#
+
+import db
+from probeloadlib import copyin
+
+# Purpose: create a temporary table and copy rows into it
+# Returns: nothing
+# Assumes: the loader is using db.useOneConnection(1)
+# Effects: replaces any temporary table of the same name;
+#	does not commit
+# Throws:  the database driver's error if the copy fails
+
+def stageTable(
+    table,	# temporary table name (string)
+    columns,	# column definitions, i.e. 'fromKey int, toKey int' (string)
+    rows	# rows to copy (list of tuples)
+    ):
+
+    db.sql('drop table if exists pg_temp.%s' % (table), None)
+    db.sql('create temporary table %s (%s)' % (table, columns), None)
+
+    sink = copyin.CopySink(table, 'pg_temp')
+
+    for row in rows:
+        sink.write('\t'.join([str(value) for value in row]) + '\n')
+
+    cursor = db.sharedDbConnection.cursor()
+    sink.copy(cursor)
+    cursor.close()
+    sink.close()
+
+    db.sql('analyze pg_temp.%s' % (table), None)
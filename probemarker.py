@@ -29,12 +29,18 @@
 #
 # Outputs:
 #
-#       1 BCP files:
+#       1 BCP file (preview mode only):
 #
 #	PRB_Marker.bcp			Probe/Marker records
 #
+#	In load mode the probe/marker records are copied into the
+#	database over the loader's connection; the delete of the existing
+#	relationships and the copy are committed together
+#	(see probeloadlib/replace.py).
+#
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
 #
 # Exit Codes:
 #
@@ -59,255 +65,144 @@ import accessionlib
 import db
 import mgi_utils
 import loadlib
+from probeloadlib import loader
+from probeloadlib import replace
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-currentDir = os.environ['PROBELOADDIR']
-mode = os.environ['PROBELOADMODE']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
-
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
-
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
-
-bcpon = 1		# can the bcp files be bcp-ed into the database?  default is yes.
-
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
-markerFile = ''		# file descriptor
-
 markerTable = 'PRB_Marker'
 
-markerFileName = markerTable + '.bcp'
+loaddate = loadlib.loaddate
 
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
+class ProbeMarker(loader.Loader):
 
-loaddate = loadlib.loaddate
+    program = 'probemarker'
+    columns = 5
 
-# delete the probe/marker relationships so we can add new ones
-deleteSQL = 'delete from PRB_Marker where _Probe_key = %s and _Marker_key = %s'
-execSQL = []
-
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global markerFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        markerFile = open(markerFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % markerFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode == 'preview':
-        DEBUG = 1
-        bcpon = 0
-    elif mode != 'load':
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
-
-def bcpFiles():
-
-    diagFile.write(str(execSQL))
-
-    if DEBUG or not bcpon:
-        return
-
-    markerFile.close()
-
-    db.commit()
-
-    bcp1 = bcpCommand % (markerTable, markerFileName)
-
-    # execute the sql deletions
-    for r in execSQL:
-        db.sql(r, None)
+    copyModes = ('load',)
 
-    for bcpCmd in [bcp1]:
-	diagFile.write('%s\n' % bcpCmd)
-	os.system(bcpCmd)
+    tables = [markerTable]
 
-    db.commit()
+    timedFunctions = [
+        (loadlib, ['verifyProbe', 'verifyReference', 'verifyUser', 'verifyMarker']),
+        ]
 
-    return
+    phases = ['init', 'verifyMode', 'processFile', 'bcpFiles']
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+    copyError = 'Could not replace the probe/marker relationships: %s\n'
 
-def processFile():
+    def __init__(self):
 
-    global execSQL
+        loader.Loader.__init__(self)
 
-    lineNum = 0
-    # For each line in the input file
+        # the probe/marker relationships replaced by this load
+        # (see probeloadlib/replace.py)
+        self.markerPairs = []
+        self.markerPairSet = set()
 
-    for line in inputFile.readlines():
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
 
-        error = 0
-        lineNum = lineNum + 1
+    def validateRow(self, lineNum, tokens):
 
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
+        errorFile = self.errorFile
 
-        try:
-	    probeID = tokens[0]
-	    markerIDs = string.split(tokens[1], '|')
-	    jnum = tokens[2]
-	    relationship = tokens[3]
-	    createdBy = tokens[4]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+        error = 0
+        probeID = tokens[0]
+        markerIDs = string.split(tokens[1], '|')
+        jnum = tokens[2]
+        createdBy = tokens[4]
 
         probeKey = loadlib.verifyProbe(probeID, lineNum, errorFile)
         referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+        createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
 
-	if probeKey == 0:
-	    errorFile.write('Invalid Probe:  %s\n' % (probeID))
-	    error = 1
+        if probeKey == 0:
+            errorFile.write('Invalid Probe:  %s\n' % (probeID))
+            error = 1
 
-	if referenceKey == 0:
-	    errorFile.write('Invalid Reference:  %s\n' % (jnum))
-	    error = 1
+        if referenceKey == 0:
+            errorFile.write('Invalid Reference:  %s\n' % (jnum))
+            error = 1
 
-	if createdByKey == 0:
-	    errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
-	    error = 1
+        if createdByKey == 0:
+            errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
+            error = 1
 
-	# marker IDs
+        # marker IDs
 
-	markerList = []
-	for markerID in markerIDs:
+        markers = []
+        for markerID in markerIDs:
 
-	    markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
+            markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
 
-	    if markerKey == 0:
-	        errorFile.write('Invalid Marker:  %s, %s\n' % (name, markerID))
-	        error = 1
+            if markerKey == 0:
+                errorFile.write('Invalid Marker:  %s, %s\n' % (probeID, markerID))
+                error = 1
             else:
-		markerList.append(markerKey)
+                markers.append((markerID, markerKey))
+
+        markerList = self.uniqueMarkers(probeID, markers)
 
-        # if errors, continue to next record
         if error:
-            continue
+            return None
 
-        # if no errors, process
+        return {
+            'probeKey' : probeKey,
+            'referenceKey' : referenceKey,
+            'relationship' : tokens[3],
+            'createdByKey' : createdByKey,
+            'markerList' : markerList,
+            }
 
-	for markerKey in markerList:
-	    if markerList.count(markerKey) == 1:
-                markerFile.write('%s|%s|%d|%s|%s|%s|%s|%s\n' \
-		    % (probeKey, markerKey, referenceKey, relationship, createdByKey, createdByKey, loaddate, loaddate))
-		execSQL.append(deleteSQL % (probeKey, markerKey))
-            else:
-		errorFile.write('Invalid Marker Duplicate:  %s, %s\n' % (name, markerID))
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the relationships to the PRB_Marker output;
+    #	    collects the probe/marker pairs that are replaced
+    # Throws:   nothing
+
+    def writeRow(self, row):
+
+        markerFile = self.outputs[markerTable]
+        probeKey = row['probeKey']
+        markerList = row['markerList']
+
+        for markerKey in markerList:
+            markerFile.write('%s\t%s\t%d\t%s\t%s\t%s\t%s\t%s\n' \
+                % (probeKey, markerKey, row['referenceKey'], row['relationship'],
+                   row['createdByKey'], row['createdByKey'], loaddate, loaddate))
+            if (probeKey, markerKey) not in self.markerPairSet:
+                self.markerPairSet.add((probeKey, markerKey))
+                self.markerPairs.append((probeKey, markerKey))
+
+    # Purpose:  replaces the probe/marker relationships in the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  deletes the existing probe/marker relationships and copies
+    #	    the new ones into the database, in one transaction
+    # Throws:   the database driver's error if the replace fails
 
-    #	end of "for line in inputFile.readlines():"
+    def copyOutputs(self, sinks):
+
+        replace.replaceProbeMarkers(self.markerPairs, self.outputs[markerTable].output, self.diagFile)
+
+    # Purpose:  replaces the probe/marker relationships in the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  see loader.Loader.bcpFiles() and copyOutputs()
+    # Throws:   nothing
+
+    def bcpFiles(self):
+
+        self.diagFile.write('%d probe/marker relationship(s) to replace\n' % (len(self.markerPairs)))
+        loader.Loader.bcpFiles(self)
 
 #
 # Main
 #
 
-init()
-verifyMode()
-processFile()
-bcpFiles()
-exit(0)
-
+ProbeMarker().run()
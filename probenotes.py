@@ -27,12 +27,24 @@
 #
 # Outputs:
 #
-#       1 BCP files:
+#       1 BCP file (preview modes only):
 #
 #	PRB_Notes.bcp			Probe/Notes records
 #
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
+#
+# Modes:
+#
+#	preview			preview the load
+#	preview-notdeleted	preview the load; keep the existing notes
+#	load			replace the notes of each probe in the input file
+#	load-notdeleted		add the notes; keep the existing notes
+#
+#	In the load modes the notes are copied into the database over the
+#	loader's connection; the delete of the existing notes and the copy
+#	are committed together (see probeloadlib/replace.py).
 #
 # Exit Codes:
 #
@@ -57,237 +69,120 @@ import accessionlib
 import db
 import mgi_utils
 import loadlib
+from probeloadlib import loader
+from probeloadlib import replace
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
-mode = os.environ['PROBELOADMODE']
-currentDir = os.environ['PROBELOADDIR']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
+notesTable = 'PRB_Notes'
 
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
+loaddate = loadlib.loaddate
 
-bcpon = 1		# can the bcp files be bcp-ed into the database?  default is yes.
+class ProbeNotes(loader.Loader):
 
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
-notesFile = ''		# file descriptor
+    program = 'probenotes'
+    columns = 3
 
-notesTable = 'PRB_Notes'
+    previewModes = ('preview', 'preview-notdeleted')
+    loadModes = ('load', 'load-notdeleted')
+    copyModes = ('load', 'load-notdeleted')
 
-notesFileName = notesTable + '.bcp'
+    tables = [notesTable]
 
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
+    timedFunctions = [
+        (loadlib, ['verifyProbe', 'verifyUser']),
+        ]
 
-loaddate = loadlib.loaddate
+    phases = ['init', 'verifyMode', 'processFile', 'bcpFiles']
+
+    copyError = 'Could not replace the notes: %s\n'
 
-# delete the probe/notes so we can add new ones
-deleteSQL = 'delete from PRB_Notes where _Probe_key = %s'
-execSQL = []
-
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global notesFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        notesFile = open(notesFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % notesFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode in ('preview', 'preview-notdeleted'):
-        DEBUG = 1
-        bcpon = 0
-    elif mode not in ('load', 'load-notdeleted'):
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
-
-def bcpFiles():
-
-    for r in execSQL:
-        diagFile.write(r + '\n')
-
-    if DEBUG or not bcpon:
-        return
-
-    notesFile.close()
-
-    db.commit()
-
-    # execute the sql deletions
-    for r in execSQL:
-        db.sql(r, None)
-    db.commit()
+    def __init__(self):
 
-    bcp1 = bcpCommand % (notesTable, notesFileName)
+        loader.Loader.__init__(self)
 
-    for bcpCmd in [bcp1]:
-	diagFile.write('%s\n' % bcpCmd)
-	os.system(bcpCmd)
+        # probes whose notes are deleted so we can add new ones
+        self.probeKeys = []
+        self.probeKeySet = set()
 
-    db.commit()
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
 
-    return
+    def validateRow(self, lineNum, tokens):
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+        errorFile = self.errorFile
 
-def processFile():
+        error = 0
+        probeID = tokens[0]
+        createdBy = tokens[2]
 
-    global execSQL
+        probeKey = loadlib.verifyProbe(probeID, lineNum, errorFile)
+        createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
 
-    lineNum = 0
-    # For each line in the input file
+        if probeKey == 0:
+            errorFile.write('Invalid Probe:  %s\n' % (probeID))
+            error = 1
 
-    for line in inputFile.readlines():
+        if createdByKey == 0:
+            errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
+            error = 1
 
-        error = 0
-        lineNum = lineNum + 1
+        if error:
+            return None
 
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
+        return {
+            'probeKey' : probeKey,
+            'notes' : tokens[1],
+            }
 
-        try:
-	    probeID = tokens[0]
-	    notes = tokens[1]
-	    createdBy = tokens[2]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the notes to the PRB_Notes output;
+    #	    collects the probes whose notes are replaced
+    # Throws:   nothing
 
-        probeKey = loadlib.verifyProbe(probeID, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+    def writeRow(self, row):
 
-	if probeKey == 0:
-	    errorFile.write('Invalid Probe:  %s\n' % (probeID))
-	    error = 1
+        probeKey = row['probeKey']
+        notes = row['notes']
 
-	if createdByKey == 0:
-	    errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
-	    error = 1
+        # automatically deletes any existing notes for this probe
+        if self.mode in ('preview', 'load') and probeKey not in self.probeKeySet:
+            self.probeKeySet.add(probeKey)
+            self.probeKeys.append(probeKey)
 
-        # if errors, continue to next record
-        if error:
-            continue
+        if len(notes) > 0:
+            self.outputs[notesTable].write('%s\t%s\t%s\t%s\n' % (probeKey, notes, loaddate, loaddate))
 
-        # if no errors, process
+    # Purpose:  replaces the notes in the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  deletes the existing notes of the probes (mode 'load') and
+    #	    copies the new notes into the database, in one transaction
+    # Throws:   the database driver's error if the replace fails
 
-        # Notes
+    def copyOutputs(self, sinks):
 
-	# automatically deletes any existing notes for this probe
-        if mode in ('preview', 'load'):
-	    execSQL.append(deleteSQL % (probeKey))
+        replace.replaceRows(notesTable, ['_Probe_key'], [(k,) for k in self.probeKeys],
+            self.outputs[notesTable].output, self.diagFile)
 
-        if len(notes) > 0:
-            notesFile.write('%s\t%s\t%s\t%s\n' % (probeKey, notes, loaddate, loaddate))
+    # Purpose:  replaces the notes in the database
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  see loader.Loader.bcpFiles() and copyOutputs()
+    # Throws:   nothing
 
-    #	end of "for line in inputFile.readlines():"
+    def bcpFiles(self):
+
+        self.diagFile.write('%d probe(s) with notes to replace\n' % (len(self.probeKeys)))
+        loader.Loader.bcpFiles(self)
 
 #
 # Main
 #
 
-init()
-verifyMode()
-processFile()
-bcpFiles()
-exit(0)
-
+ProbeNotes().run()
@@ -36,6 +36,7 @@
 #
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
+#       Statistics file (JSON) of per-phase timings and row counts
 #
 # Modes:
 #
@@ -67,353 +68,290 @@ import accessionlib
 import db
 import mgi_utils
 import loadlib
+from probeloadlib import keys
+from probeloadlib import loader
+from probeloadlib import lookups
+from probeloadlib import reader
+from probeloadlib import sqlutil
 
 #globals
 
-#
-# from configuration file
-#
-user = os.environ['PG_DBUSER']
-passwordFileName = os.environ['PG_1LINE_PASSFILE']
-currentDir = os.environ['PROBELOADDIR']
-mode = os.environ['PROBELOADMODE']
-inputFileName = os.environ['PROBEDATAFILE']
-outputDir = os.environ['PROBELOADDATADIR']
+refTable = 'PRB_Reference'
+aliasTable = 'PRB_Alias'
 
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
+loaddate = loadlib.loaddate
 
-DEBUG = 0		# if 0, not in debug mode
-TAB = '\t'		# tab
-CRT = '\n'		# carriage return/newline
+probeSQL = '''
+    		     select p._Probe_key, a.accID
+		     from PRB_Probe p, ACC_Accession a
+		     where p._Probe_key = a._Object_key
+		     and a._MGIType_key = 3
+                     and p.name = %s
+                     '''
 
-bcpon = 1		# can the bcp files be bcp-ed into the database?  default is yes.
+probeReferenceSQL = '''
+                     select r._Reference_key 
+                     from PRB_Reference r, PRB_Acc_View p, BIB_View b
+                     where p.accID = %s
+		     and b.jnumID = %s
+		     and p._Object_key = r._Probe_key
+		     and b._Refs_key = r._Refs_key
+                     '''
 
-diagFile = ''		# diagnostic file descriptor
-errorFile = ''		# error file descriptor
-inputFile = ''		# file descriptor
-markerFile = ''		# file descriptor
-refFile = ''            # file descriptor
-aliasFile = ''          # file descriptor
+class ProbeReference(loader.Loader):
 
-refTable = 'PRB_Reference'
-aliasTable = 'PRB_Alias'
+    program = 'probereference'
+    columns = 4
 
-refFileName = refTable + '.bcp'
-aliasFileName = aliasTable + '.bcp'
+    previewModes = ('preview', 'preview-noreference')
+    loadModes = ('load', 'load-noreference')
 
-diagFileName = ''	# diagnostic file name
-errorFileName = ''	# error file name
+    tables = [refTable, aliasTable]
 
-refKey = 0		# PRB_Reference._Reference_key
-aliasKey = 0		# PRB_Alias._Alias_key
+    timedFunctions = [
+        (loadlib, ['verifyProbe', 'verifyReference', 'verifyUser']),
+        (lookups, ['verifyProbe', 'verifyReference', 'verifyUser']),
+        ]
+    timedMethods = ['verifyProbe', 'verifyProbeReference']
 
-loaddate = loadlib.loaddate
+    pipelined = 1
 
-# Purpose: prints error message and exits
-# Returns: nothing
-# Assumes: nothing
-# Effects: exits with exit status
-# Throws: nothing
-
-def exit(
-    status,          # numeric exit status (integer)
-    message = None   # exit message (string)
-    ):
-
-    if message is not None:
-        sys.stderr.write('\n' + str(message) + '\n')
- 
-    try:
-        diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
-        diagFile.close()
-        errorFile.close()
-	inputFile.close()
-    except:
-        pass
-
-    db.useOneConnection(0)
-    sys.exit(status)
- 
-# Purpose: process command line options
-# Returns: nothing
-# Assumes: nothing
-# Effects: initializes global variables
-#          exits if files cannot be opened
-# Throws: nothing
-
-def init():
-    global bcpCommand
-    global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global refFile, aliasFile
- 
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
- 
-    bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
-
-    head, tail = os.path.split(inputFileName) 
-
-    diagFileName = outputDir + '/' + tail + '.diagnostics'
-    errorFileName = outputDir + '/' + tail + '.error'
-
-    try:
-        diagFile = open(diagFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % diagFileName)
-		
-    try:
-        errorFile = open(errorFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % errorFileName)
-		
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
-
-    try:
-        refFile = open(refFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % refFileName)
-
-    try:
-        aliasFile = open(aliasFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % aliasFileName)
-
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
-
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
-
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
-
-    return
-
-# Purpose: verify processing mode
-# Returns: nothing
-# Assumes: nothing
-# Effects: if the processing mode is not valid, exits.
-#	   else, sets global variables
-# Throws:  nothing
-
-def verifyMode():
-
-    global DEBUG
-
-    if mode in ('preview', 'preview-noreference'):
-        DEBUG = 1
-        bcpon = 0
-    elif mode not in ('load', 'load-noreference'):
-        exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
-
-# Purpose:  verify Probe based on Probe Name
-# Returns:  Probe Key and Probe ID if Probe
-# Assumes:  nothing
-# Throws:  nothing
-
-def verifyProbe(
-    probeName,   # name of the Probe (string)
-    lineNum,     # line number (integer)
-    errorFile    # error file (file descriptor)
-    ):
-
-    probeKey = None
-
-    results = db.sql('''
-    		     select p._Probe_key, a.accID
-		     from PRB_Probe p, ACC_Accession a
-		     where p._Probe_key = a._Object_key
-		     and a._MGIType_key = 3
-                     and p.name = '%s'
-                     ''' % (probeName), 'auto')
+    def __init__(self):
 
-    for r in results:
-        probeKey = r['_Probe_key']
-	accID = r['accID']
+        loader.Loader.__init__(self)
 
-    if probeKey is None:
-        probeKey = 0
-	accID = ''
+        self.refKey = 0		# PRB_Reference._Reference_key
+        self.aliasKey = 0	# PRB_Alias._Alias_key
 
-    return probeKey, accID
+    # Purpose:  verify Probe based on Probe Name
+    # Returns:  Probe Key and Probe ID if Probe
+    # Assumes:  nothing
+    # Throws:  nothing
 
-# Purpose:  verify Probe Reference based on Probe Accession ID and J:
-# Returns:  Probe Reference Key if Probe and Reference are valid, else 0
-# Assumes:  nothing
-# Effects:  verifies that the Probe Reference exists in the database
-#       writes to the error file if the Probe Reference is invalid
-# Throws:  nothing
+    def verifyProbe(self,
+        probeName,   # name of the Probe (string)
+        lineNum,     # line number (integer)
+        errorFile,   # error file (file descriptor)
+        pending = None	# the probeSQL query, if submitted by prefetchRow() (pipeline.Pending)
+        ):
 
-def verifyProbeReference(
-    probeID,     # Accession ID of the Probe (string)
-    referenceID, # Reference Accession ID (string)
-    lineNum,     # line number (integer)
-    errorFile    # error file (file descriptor)
-    ):
+        probeKey = None
 
-    probereferenceKey = None
+        if pending is None:
+            pending = self.lookupPipeline.query(probeSQL % (sqlutil.quote(probeName)))
 
-    results = db.sql('''
-                     select r._Reference_key 
-                     from PRB_Reference r, PRB_Acc_View p, BIB_View b
-                     where p.accID = '%s' 
-		     and b.jnumID = '%s'
-		     and p._Object_key = r._Probe_key
-		     and b._Refs_key = r._Refs_key
-                     ''' % (probeID, referenceID), 'auto')
+        results = pending.result()
+
+        for r in results:
+            probeKey = r['_Probe_key']
+            accID = r['accID']
 
-    for r in results:
-        probereferenceKey = r['_Reference_key']
+        if probeKey is None:
+            probeKey = 0
+            accID = ''
 
-    if probereferenceKey is None:
-        probereferenceKey = 0
+        return probeKey, accID
 
-    return probereferenceKey
+    # Purpose:  verify Probe Reference based on Probe Accession ID and J:
+    # Returns:  Probe Reference Key if Probe and Reference are valid, else 0
+    # Assumes:  nothing
+    # Effects:  verifies that the Probe Reference exists in the database
+    #       writes to the error file if the Probe Reference is invalid
+    # Throws:  nothing
 
-# Purpose:  sets global primary key variables
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  sets global primary key variables
-# Throws:   nothing
+    def verifyProbeReference(self,
+        probeID,     # Accession ID of the Probe (string)
+        referenceID, # Reference Accession ID (string)
+        lineNum,     # line number (integer)
+        errorFile,   # error file (file descriptor)
+        pending = None	# the probeReferenceSQL query, if submitted by prefetchRow() (pipeline.Pending)
+        ):
 
-def setPrimaryKeys():
+        probereferenceKey = None
 
-    global refKey, aliasKey
+        if pending is None:
+            pending = self.lookupPipeline.query(probeReferenceSQL \
+                % (sqlutil.quote(probeID), sqlutil.quote(referenceID)))
 
-    results = db.sql('select max(_Reference_key) + 1 as maxKey from PRB_Reference', 'auto')
-    refKey = results[0]['maxKey']
+        results = pending.result()
 
-    results = db.sql('select max(_Alias_key) + 1 as maxKey from PRB_Alias', 'auto')
-    aliasKey = results[0]['maxKey']
+        for r in results:
+            probereferenceKey = r['_Reference_key']
 
-# Purpose:  BCPs the data into the database
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  BCPs the data into the database
-# Throws:   nothing
+        if probereferenceKey is None:
+            probereferenceKey = 0
 
-def bcpFiles():
+        return probereferenceKey
 
-    bcpdelim = "\t"
+    # Purpose:  sets the primary key variables
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  counts the lines and aliases in the input file and
+    #	    reserves a block of keys for each table (see probeloadlib/keys.py)
+    #	    exits if a line is invalid
+    # Throws:   nothing
 
-    if DEBUG or not bcpon:
-        return
+    def setPrimaryKeys(self):
 
-    refFile.close()
-    aliasFile.close()
+        lineCount = 0
+        aliasCount = 0
 
-    db.commit()
+        for lineNum, tokens in reader.RecordReader(self.inputFile, self.columns, self.exit):
+            lineCount = lineCount + 1
+            aliasCount = aliasCount + len([a for a in string.split(tokens[2], '|') if len(a) > 0])
 
-    bcp1 = bcpCommand % (refTable, refFileName)
-    bcp2 = bcpCommand % (aliasTable, aliasFileName)
+        self.inputFile.seek(0)
 
-    for bcpCmd in [bcp1, bcp2]:
-	diagFile.write('%s\n' % bcpCmd)
-	os.system(bcpCmd)
+        self.refKey = keys.reserveKeys(refTable, lineCount, self.DEBUG)
+        self.aliasKey = keys.reserveKeys(aliasTable, aliasCount, self.DEBUG)
 
-    db.commit()
+    # Purpose:  submits the probe, probe/reference, reference and
+    #	    creator lookups of one input line (see probeloadlib/pipeline.py)
+    # Returns:  dictionary of pipeline.Pending (None if cached)
+    # Assumes:  nothing
+    # Effects:  queues the queries; the probe/reference lookup of a
+    #	    probe given by name waits for the probe's MGI ID
+    #	    (see prefetchDependent())
+    # Throws:   nothing
 
-    return
+    def prefetchRow(self, lineNum, tokens):
 
-# Purpose:  processes data
-# Returns:  nothing
-# Assumes:  nothing
-# Effects:  verifies and processes each line in the input file
-# Throws:   nothing
+        lookupPipeline = self.lookupPipeline
 
-def processFile():
+        probeID = tokens[0]
+        jnum = tokens[1]
 
-    global refKey, aliasKey
+        prefetched = {
+            'reference' : lookups.prefetchReference(jnum, lookupPipeline),
+            'user' : lookups.prefetchUser(tokens[3], lookupPipeline),
+            }
 
-    lineNum = 0
-    # For each line in the input file
+        if probeID.find('MGI:') >= 0:
+            prefetched['probeID'] = lookups.prefetchProbe(probeID, lookupPipeline)
+            prefetched['probeReference'] = lookupPipeline.query(probeReferenceSQL \
+                % (sqlutil.quote(probeID), sqlutil.quote(jnum)))
+        else:
+            prefetched['probe'] = lookupPipeline.query(probeSQL % (sqlutil.quote(probeID)))
 
-    for line in inputFile.readlines():
+        return prefetched
 
-        error = 0
-        lineNum = lineNum + 1
+    # Purpose:  submits the probe/reference lookup of an input line whose
+    #	    probe is given by name, by the MGI ID of the prefetched probe
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  queues the query
+    # Throws:   nothing
+
+    def prefetchDependent(self, lineNum, tokens, prefetched):
 
-        # Split the line into tokens
-        tokens = string.split(line[:-1], '\t')
+        if 'probe' not in prefetched:
+            return
 
-        try:
-	    probeID = probeName = tokens[0]
-	    jnum = tokens[1]
-	    aliasList = string.split(tokens[2], '|')
-	    createdBy = tokens[3]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+        probeKey, probeID = self.verifyProbe(tokens[0], lineNum, self.errorFile, prefetched['probe'])
 
-	if probeID.find('MGI:') >= 0:
-            probeKey = loadlib.verifyProbe(probeID, lineNum, errorFile)
-	else:
-	    probeKey, probeID = verifyProbe(probeName, lineNum, errorFile)
+        if probeKey > 0:
+            prefetched['probeReference'] = self.lookupPipeline.query(probeReferenceSQL \
+                % (sqlutil.quote(probeID), sqlutil.quote(tokens[1])))
 
-        probeReferenceKey = verifyProbeReference(probeID, jnum, lineNum, errorFile)
-        referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-	createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+    # Purpose:  verifies one input line
+    # Returns:  the row for writeRow() (dictionary), None if invalid
+    # Assumes:  nothing
+    # Effects:  writes to the error file if the line is invalid
+    # Throws:   nothing
 
-	if probeKey == 0:
-	    errorFile.write('Invalid Probe:  %s\n' % (probeID))
-	    error = 1
+    def validateRow(self, lineNum, tokens):
 
-	if referenceKey == 0:
-	    errorFile.write('Invalid Reference:  %s\n' % (jnum))
-	    error = 1
+        errorFile = self.errorFile
+        prefetched = self.prefetched.pop(lineNum, {})
 
-	#if probeReferenceKey == 0:
-	#    errorFile.write('Invalid Probe Reference:  %s, %s\n' % (probeID, jnum))
-	#    error = 1
+        error = 0
+        probeID = probeName = tokens[0]
+        jnum = tokens[1]
+        createdBy = tokens[3]
+
+        if probeID.find('MGI:') >= 0:
+            probeKey = lookups.verifyProbe(probeID, lineNum, errorFile, prefetched.get('probeID'))
+        else:
+            probeKey, probeID = self.verifyProbe(probeName, lineNum, errorFile, prefetched.get('probe'))
+
+        if probeKey > 0:
+            probeReferenceKey = self.verifyProbeReference(probeID, jnum, lineNum, errorFile,
+                prefetched.get('probeReference'))
+        else:
+            probeReferenceKey = 0
+        referenceKey = lookups.verifyReference(jnum, lineNum, errorFile, prefetched.get('reference'))
+        createdByKey = lookups.verifyUser(createdBy, lineNum, errorFile, prefetched.get('user'))
 
-	if createdByKey == 0:
-	    errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
-	    error = 1
+        if probeKey == 0:
+            errorFile.write('Invalid Probe:  %s\n' % (probeID))
+            error = 1
+
+        if referenceKey == 0:
+            errorFile.write('Invalid Reference:  %s\n' % (jnum))
+            error = 1
+
+        #if probeReferenceKey == 0:
+        #    errorFile.write('Invalid Probe Reference:  %s, %s\n' % (probeID, jnum))
+        #    error = 1
+
+        if createdByKey == 0:
+            errorFile.write('Invalid Creator:  %s\n\n' % (createdBy))
+            error = 1
 
-        # if errors, continue to next record
         if error:
-            continue
+            return None
+
+        return {
+            'tokens' : tokens,
+            'probeKey' : probeKey,
+            'probeReferenceKey' : probeReferenceKey,
+            'referenceKey' : referenceKey,
+            'createdByKey' : createdByKey,
+            }
+
+    # Purpose:  writes one verified row
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  writes the reference and aliases to the table outputs;
+    #	    advances the primary keys
+    # Throws:   nothing
 
-        # if no errors, process
+    def writeRow(self, row):
 
-	# create a new probe-reference key if one does not already exist
-	# else use the existing probe-reference key
+        refFile = self.outputs[refTable]
+        aliasFile = self.outputs[aliasTable]
+
+        aliasList = string.split(row['tokens'][2], '|')
+        probeKey = row['probeKey']
+        probeReferenceKey = row['probeReferenceKey']
+        referenceKey = row['referenceKey']
+        createdByKey = row['createdByKey']
+
+        # create a new probe-reference key if one does not already exist
+        # else use the existing probe-reference key
 
         if probeReferenceKey == 0:
             refFile.write('%s\t%s\t%s\t0\t0\t%s\t%s\t%s\t%s\n' \
-		    % (refKey, probeKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
-	    aliasrefKey = refKey
-	    refKey = refKey + 1
+                % (self.refKey, probeKey, referenceKey, createdByKey, createdByKey, loaddate, loaddate))
+            aliasrefKey = self.refKey
+            self.refKey = self.refKey + 1
         else:
-	    #errorFile.write('Probe/Reference Already Exists: %s\n' % (tokens))
-	    aliasrefKey = probeReferenceKey
+            #errorFile.write('Probe/Reference Already Exists: %s\n' % (tokens))
+            aliasrefKey = probeReferenceKey
 
         # aliases
 
         for alias in aliasList:
 
-	    if len(alias) == 0:
-		continue
+            if len(alias) == 0:
+                continue
 
             aliasFile.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\n' \
-		    % (aliasKey, aliasrefKey, alias, createdByKey, createdByKey, loaddate, loaddate))
-	    aliasKey = aliasKey + 1
-
-
-    #	end of "for line in inputFile.readlines():"
+                % (self.aliasKey, aliasrefKey, alias, createdByKey, createdByKey, loaddate, loaddate))
+            self.aliasKey = self.aliasKey + 1
 
 #
 # Main
 #
 
-init()
-verifyMode()
-setPrimaryKeys()
-processFile()
-bcpFiles()
-exit(0)
-
+ProbeReference().run()